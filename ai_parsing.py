@@ -0,0 +1,296 @@
+# ai_parsing.py
+# Tolerant parsing of the JSON the model is asked to return.
+#
+# Models wrap JSON in markdown fences, prepend chatter, copy the "# include only
+# when ..." comment from the prompt, leave trailing commas or get cut off. The
+# scanner below finds the first balanced {...} object (also incrementally, chunk
+# by chunk, for streamed output), a few cheap repairs fix the usual defects, and
+# the result is validated against a pydantic schema per prompt. Every parse is
+# counted per prompt name so failure rates can be watched.
+
+import json
+import threading
+from typing import List, Literal
+
+from pydantic import BaseModel, ValidationError, field_validator
+
+EMOTIONS = ["Happy", "Sad", "Anxious", "Stressed", "Angry", "Lonely",
+            "Grateful", "Hopeful", "Guilty", "Conflicted"]
+
+QUESTION_TYPE_ALIASES = {
+    "yes_no": "yes_no", "yesno": "yes_no", "yes/no": "yes_no", "boolean": "yes_no",
+    "choice": "choice", "multiple_choice": "choice", "multiple choice": "choice", "mcq": "choice",
+    "reflection": "reflection", "open": "reflection", "open_ended": "reflection",
+}
+
+
+class ParseError(ValueError):
+    """The model output could not be turned into the expected schema."""
+
+
+# ------------------------------------------------------
+# SCHEMAS
+# ------------------------------------------------------
+class QuestionFields(BaseModel):
+    question_type: Literal["yes_no", "choice", "reflection"] = "reflection"
+    question: str
+    options: List[str] = []
+
+    @field_validator("question_type", mode="before")
+    @classmethod
+    def _normalize_type(cls, value):
+        if not isinstance(value, str):
+            return "reflection"
+        key = value.strip().lower().replace("-", "_")
+        return QUESTION_TYPE_ALIASES.get(key, QUESTION_TYPE_ALIASES.get(key.replace("_", " "), "reflection"))
+
+    @field_validator("question")
+    @classmethod
+    def _non_empty(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("empty question")
+        return value
+
+    @field_validator("options", mode="before")
+    @classmethod
+    def _coerce_options(cls, value):
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [value] if value.strip() else []
+        return [str(v).strip() for v in value if str(v).strip()]
+
+
+class EmotionQuestion(QuestionFields):
+    """/save-journal: dominant emotion + first validation question."""
+    emotion: str = "Unknown"
+
+    @field_validator("emotion", mode="before")
+    @classmethod
+    def _normalize_emotion(cls, value):
+        if not isinstance(value, str) or not value.strip():
+            return "Unknown"
+        value = value.strip().strip(".").capitalize()
+        return value if value in EMOTIONS else "Unknown"
+
+
+class NextQuestion(QuestionFields):
+    """/answer-question: the next validation question."""
+
+
+class Advice(BaseModel):
+    """/complete: advice + affirmation."""
+    advice: str
+    affirmation: str
+
+    @field_validator("advice", "affirmation")
+    @classmethod
+    def _strip(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("empty field")
+        return value
+
+
+# ------------------------------------------------------
+# BALANCED OBJECT SCANNER
+# ------------------------------------------------------
+class JsonObjectScanner:
+    """
+    Incremental scanner for the first top-level {...} object. Feed text in any
+    chunking; `feed()` returns the object text as soon as its closing brace
+    arrives, else None. Quotes (" and ') and escapes are tracked so braces
+    inside strings do not count.
+    """
+
+    def __init__(self):
+        self._buf = []
+        self._stack = []
+        self._in_string = None
+        self._escape = False
+        self._started = False
+        self.done = None
+
+    def feed(self, chunk):
+        if self.done is not None:
+            return self.done
+        for ch in chunk:
+            if not self._started:
+                if ch != "{":
+                    continue
+                self._started = True
+            self._buf.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == self._in_string:
+                    self._in_string = None
+                continue
+
+            if ch in "\"'":
+                self._in_string = ch
+            elif ch in "{[":
+                self._stack.append("}" if ch == "{" else "]")
+            elif ch in "}]":
+                if self._stack and self._stack[-1] == ch:
+                    self._stack.pop()
+                if not self._stack:
+                    self.done = "".join(self._buf)
+                    return self.done
+        return None
+
+    def partial(self):
+        """Best effort for truncated output: close open strings and brackets."""
+        if self.done is not None:
+            return self.done
+        if not self._started:
+            return None
+        text = "".join(self._buf)
+        if self._in_string:
+            text += self._in_string
+        return text + "".join(reversed(self._stack))
+
+
+def partial_fields(scanner):
+    """
+    Fields of the object a scanner has seen so far, for showing a reply while
+    it streams in: {} until the (closed-off) partial text parses as JSON.
+    """
+    text = scanner.partial()
+    if not text:
+        return {}
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def extract_first_object(text):
+    scanner = JsonObjectScanner()
+    return scanner.feed(text) or scanner.partial()
+
+
+# ------------------------------------------------------
+# REPAIRS
+# ------------------------------------------------------
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _next_significant(text, i):
+    while i < len(text) and text[i].isspace():
+        i += 1
+    return text[i] if i < len(text) else ""
+
+
+def repair(text):
+    """
+    Fix common defects outside string literals: // and # comments, single
+    quotes, Python literals, unquoted keys and trailing commas. Brackets left
+    open (a comment runs to the end of its line and may take the closing ones
+    with it) are closed again.
+    """
+    text = text.translate(_SMART_QUOTES)
+    out = []
+    i, n = 0, len(text)
+    while i < n:
+        ch = text[i]
+        if ch in "\"'":
+            # copy the string, normalising the quotes to "
+            j = i + 1
+            buf = []
+            while j < n and text[j] != ch:
+                if text[j] == "\\" and j + 1 < n:
+                    # \' is not a valid JSON escape
+                    buf.append("'" if text[j + 1] == "'" else text[j:j + 2])
+                    j += 2
+                    continue
+                buf.append('\\"' if (ch == "'" and text[j] == '"') else text[j])
+                j += 1
+            out.append('"' + "".join(buf) + '"')
+            i = j + 1
+        elif ch == "#" or text.startswith("//", i):
+            while i < n and text[i] != "\n":
+                i += 1
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if _next_significant(text, j) == ":":
+                out.append('"' + word + '"')
+            else:
+                out.append(_PY_LITERALS.get(word, word))
+            i = j
+        elif ch == "," and _next_significant(text, i + 1) in ("}", "]"):
+            i += 1
+        else:
+            out.append(ch)
+            i += 1
+    repaired = "".join(out)
+    scanner = JsonObjectScanner()
+    return scanner.feed(repaired) or scanner.partial() or repaired
+
+
+# ------------------------------------------------------
+# PARSING + STATS
+# ------------------------------------------------------
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, outcome):
+    with _stats_lock:
+        counts = _stats.setdefault(name, {"ok": 0, "repaired": 0, "failed": 0})
+        counts[outcome] += 1
+
+
+def parse_model_output(text, schema, name=None):
+    """
+    Return `schema`-validated data (a dict) from raw model output.
+    Raises ParseError when nothing usable can be recovered.
+    """
+    name = name or schema.__name__
+    candidate = extract_first_object(text or "")
+    if candidate is None:
+        _record(name, "failed")
+        raise ParseError("No JSON object in model output")
+
+    outcome = "ok"
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        outcome = "repaired"
+        try:
+            data = json.loads(repair(candidate))
+        except ValueError as e:
+            _record(name, "failed")
+            raise ParseError(f"Unrepairable JSON: {e}") from e
+
+    try:
+        result = schema.model_validate(data).model_dump()
+    except ValidationError as e:
+        _record(name, "failed")
+        raise ParseError(f"Schema mismatch: {e.errors()[0].get('msg')}") from e
+
+    _record(name, outcome)
+    return result
+
+
+def parser(schema, name):
+    """Callable for llm_client.complete(parse=...)."""
+    return lambda text: parse_model_output(text, schema, name)
+
+
+def parse_stats():
+    with _stats_lock:
+        snapshot = {k: dict(v) for k, v in _stats.items()}
+    for counts in snapshot.values():
+        total = counts["ok"] + counts["repaired"] + counts["failed"]
+        counts["failure_rate"] = round(counts["failed"] / total, 4) if total else 0.0
+    return snapshot
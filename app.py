@@ -1,14 +1,31 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from flask_pymongo import PyMongo
-import bcrypt
+from werkzeug.utils import secure_filename
 import os
 import json
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from collections import defaultdict
-from cryptography.fernet import Fernet
-import traceback
+import zlib
+
+import ai_parsing
+import app_logging
+import db_indexes
+import decrypt_cache
+import emotion_jobs
+import instrumentation
+import journal_crypto
+import journal_store
+import llm_cache
+import llm_client
+import metrics
+import mood_stats
+import password_hashing
+import prompt_budget
+import session_planner
+import summary_store
+import validation_session
 
 # NEW: Import Groq
 from groq import Groq
@@ -17,14 +34,20 @@ from groq import Groq
 # Load environment variables
 load_dotenv()
 
+# JSON logs written by a background thread (LOG_LEVEL, LOG_SAMPLE, ... see app_logging.py)
+app_logging.configure()
+logger = app_logging.get_logger("app")
+
 # Load Groq API Key
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 if not GROQ_API_KEY:
     raise ValueError("❌ GROQ_API_KEY is missing. Add it to your .env file.")
 
-# Initialize Groq Client
-client = Groq(api_key=GROQ_API_KEY)
+# Initialize Groq Client (GROQ_BASE_URL lets tests point it at fake_groq.py)
+# Retries and timeouts are handled by llm_client, so the SDK's own are off
+client = Groq(api_key=GROQ_API_KEY, base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0)
+llm_client.configure(client)
 
 # Encryption Key
 ENCRYPTION_KEY = os.getenv("FERNET_KEY")
@@ -32,8 +55,8 @@ ENCRYPTION_KEY = os.getenv("FERNET_KEY")
 if not ENCRYPTION_KEY:
     raise ValueError("❌ FERNET_KEY is missing. Add it in your .env")
 
-# Fernet expects BYTES
-fernet = Fernet(ENCRYPTION_KEY.encode())
+# Fernet expects BYTES. Old keys (FERNET_OLD_KEYS) stay readable during rotation.
+fernet = journal_crypto.build_fernet(ENCRYPTION_KEY, os.getenv("FERNET_OLD_KEYS"))
 
 # (NO GEMINI ANYMORE)
 # Deleted:
@@ -44,25 +67,45 @@ fernet = Fernet(ENCRYPTION_KEY.encode())
 app = Flask(__name__)
 CORS(app)
 
+# Per-request stage timings (see instrumentation.py), exported on /metrics
+app.json = instrumentation.TimedJSONProvider(app)
+app.wsgi_app = instrumentation.TimingMiddleware(app.wsgi_app)
+
 app.config["MONGO_URI"] = os.getenv("MONGO_URI")
-mongo = PyMongo(app)
+mongo = PyMongo(app, event_listeners=[instrumentation.MongoCommandTimer()])
 
 # Collections (global)
 users_collection = mongo.db.users
 journals_collection = mongo.db.journals
 memories_collection = mongo.db.memories
-summaries_collection = mongo.db.summaries
 calm_quest_collection = mongo.db.calm_quest
 
+# Idempotent index bootstrap (set INDEX_BOOTSTRAP=0 to manage indexes with db_indexes.py only)
+if os.getenv("INDEX_BOOTSTRAP", "1") != "0":
+    try:
+        db_indexes.ensure_indexes(mongo.db, log=logger.warning)
+    except Exception as e:
+        logger.warning("Could not create indexes: %s", e)
+
 
+@instrumentation.timed("crypto")
 def encrypt_text(plain_text):
     """Encrypt journal text before saving. Returns string or None."""
     if plain_text is None:
         return None
     if not isinstance(plain_text, str):
         plain_text = str(plain_text)
-    token = fernet.encrypt(plain_text.encode())
-    return token.decode()
+    token = fernet.encrypt(plain_text.encode()).decode()
+    # Seed the plaintext cache: the entry is usually read back right away
+    decrypt_cache.put(token, plain_text)
+    return token
+
+@instrumentation.timed("crypto")
+def decrypt_text(encrypted_text):
+    """Decrypt through the plaintext cache. Raises on invalid tokens."""
+    return decrypt_cache.get_or_decrypt(
+        encrypted_text, lambda token: fernet.decrypt(token.encode()).decode()
+    )
 
 def decrypt_text_safe(encrypted_text):
     """Try to decrypt; if it fails, return empty string (or original)."""
@@ -71,14 +114,38 @@ def decrypt_text_safe(encrypted_text):
     # If it's already plaintext (very unlikely) - you can try a heuristic:
     # Fernet tokens usually start with "gAAAA" — but we still try decrypt
     try:
-        return fernet.decrypt(encrypted_text.encode()).decode()
+        return decrypt_text(encrypted_text)
     except Exception as e:
         # Decryption failed — log and return fallback
-        print("⚠️ Decryption failed:", e)
+        logger.warning("Decryption failed: %s", e)
         # fallback: return empty string so UI doesn't crash, or return original
         return ""
 
 
+def server_busy():
+    """503 for shed requests; clients should retry after a short pause."""
+    response = jsonify({'message': 'Server is busy, please try again in a moment'})
+    response.headers['Retry-After'] = str(password_hashing.RETRY_AFTER)
+    return response, 503
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: latency histograms plus pool / cache / parser stats."""
+    gauges = (
+        metrics.flatten_stats("llm_pool", llm_client.pool_stats())
+        + metrics.flatten_stats("hash_pool", password_hashing.stats())
+        + metrics.flatten_stats("decrypt_cache", decrypt_cache.stats())
+        + metrics.flatten_stats("log_queue", app_logging.stats())
+        + metrics.flatten_stats("session_planner", session_planner.stats())
+    )
+    for template, counts in prompt_budget.stats().items():
+        gauges += metrics.flatten_stats("model_tokens", counts, {"template": template})
+    for prompt, counts in ai_parsing.parse_stats().items():
+        gauges += metrics.flatten_stats("model_parse", counts, {"prompt": prompt})
+    return Response(metrics.render_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/signup', methods=['POST'])
 def signup():
     try:
@@ -89,8 +156,8 @@ def signup():
         if users_collection.find_one({'email': data['email']}):
             return jsonify({'message': 'User already exists'}), 409
 
-        # Hash the password
-        hashed_pw = bcrypt.hashpw(data['password'].encode('utf-8'), bcrypt.gensalt())
+        # Hash the password (bounded bcrypt pool; sheds with 503 when saturated)
+        hashed_pw = password_hashing.hash_password(data['password'])
 
         # Insert new user
         users_collection.insert_one({
@@ -101,6 +168,9 @@ def signup():
 
         return jsonify({'message': 'User registered successfully'}), 201
 
+    except password_hashing.HashingOverloaded:
+        return server_busy()
+
     except Exception as e:
         return jsonify({'error': str(e), 'message': 'An error occurred'}), 500
 
@@ -118,92 +188,109 @@ def signin():
         users_collection = mongo.db.users
         user = users_collection.find_one({'email': email})
 
-        if user:
-            print("User found:", user.get('username'))
-
         # Ensure password is stored as bytes
-        if user and bcrypt.checkpw(password.encode('utf-8'), user['password']):
+        if user and password_hashing.check_password(password, user['password']):
+            if password_hashing.needs_rehash(user['password']):
+                # Cost factor changed: upgrade the stored hash off the request path
+                password_hashing.rehash_in_background(
+                    password,
+                    lambda new_hash: users_collection.update_one(
+                        {'_id': user['_id'], 'password': user['password']},
+                        {'$set': {'password': new_hash}}
+                    )
+                )
             return jsonify({'message': 'Login successful', 'username': user['username']}), 200
         else:
             return jsonify({'message': 'Invalid email or password'}), 401
 
+    except password_hashing.HashingOverloaded:
+        return server_busy()
+
     except Exception as e:
-        import traceback
-        traceback.print_exc()  # full stack trace in terminal
+        logger.exception("Sign-in failed")
         return jsonify({'error': str(e), 'message': 'An error occurred'}), 500
 
 
+# Tolerant JSON extraction + schema validation for each prompt (see ai_parsing.py)
+parse_emotion = ai_parsing.parser(ai_parsing.EmotionQuestion, "emotion")
+parse_next_question = ai_parsing.parser(ai_parsing.NextQuestion, "next_question")
+parse_advice = ai_parsing.parser(ai_parsing.Advice, "advice")
+
+
 # ------------------------------------------------------
-# SAVE JOURNAL ENTRY (with Gemini AI)
+# VALIDATION PROMPTS (shared with the session planner)
 # ------------------------------------------------------
-@app.route('/save-journal', methods=['POST'])
-def save_journal():
-    import traceback
+def next_question_call(journal_context, answers):
+    """(template, prompt, parse) of the follow-up question after `answers`."""
+    prompt = f""" You are an emotionally intelligent journaling assistant. Do NOT reveal the detected emotion to the user.  Context: Journal: \"\"\"{prompt_budget.journal_for('next_question', journal_context)}\"\"\" Previous answers: {prompt_budget.answers_for(answers)}  Task: Based on the journal and previous answers, generate ONE interactive validation question to ask next. - If the next question should be a Yes/No question, set question_type = "yes_no". - If it should be a short multiple-choice, set question_type = "choice" and provide 2-3 concise options. - If it should be a reflection prompt, set question_type = "reflection" and make it 1 short sentence.  Keep questions short, contextual, and directly tied to the journal & prior answers. Respond ONLY in JSON in this exact format (no extra text): {{   "question_type": "<yes_no | choice | reflection>",   "question": "<the question text>",   "options": ["opt1","opt2"]   # include only when question_type is "choice" }} """
+    return "next_question", prompt, parse_next_question
 
-    try:
-        data = request.get_json(silent=True)
-        if not data:
-            return jsonify({"error": "Invalid JSON body"}), 400
 
-        username = (data.get('username') or "").strip()
-        entry_text = (data.get('entry') or "").strip()
-        date = data.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
-        micro_checkin = data.get("micro")  # 🔥 Capture micro-checkin from frontend
-        print("🔥 Micro checkin received:", micro_checkin)
+def advice_call(journal_context, answers):
+    """(template, prompt, parse) of the final advice + affirmation."""
+    prompt = f"""
+You are a compassionate journaling coach. Do NOT reveal the detected emotion to the user.
 
+Context:
+Journal: \"\"\"{prompt_budget.journal_for('advice', journal_context)}\"\"\"
+Validation answers:
+{prompt_budget.answers_for(answers)}
 
+Task:
+1) Generate a short, practical piece of advice (2–3 sentences) directly based on the journal + answers.
+2) Generate a single-line supportive affirmation.
 
-        if not username:
-            return jsonify({'error': 'Missing username'}), 400
-        if not entry_text:
-            return jsonify({'error': 'Missing journal entry'}), 400
+Rules:
+- Respond ONLY in valid JSON.
+- Use EXACT keys: "advice", "affirmation".
+- NO commentary, NO markdown, NO explanation, NO extra text.
+- Do NOT talk about being an AI model.
 
-        journals_collection = mongo.db.journals
-        sessions_col = mongo.db.validation_sessions
-        timestamp_now = datetime.utcnow()
+JSON FORMAT:
+{{
+  "advice": "<2–3 sentences>",
+  "affirmation": "<1 short supportive sentence>"
+}}
+"""
+    return "advice", prompt, parse_advice
 
-        # Delete any old session for that date
-        sessions_col.delete_one({"username": username, "date": date})
 
-        # -----------------------------
-        # 1️⃣ SAVE JOURNAL ENTRY FIRST
-        # -----------------------------
-        new_entry = {
-            "date": date,
-            "text": encrypt_text(entry_text),
-            "micro_checkin": micro_checkin,   # 🔥 Save micro-checkin
-            "emotion_hidden": None,
-            "timestamp": timestamp_now,
-            "last_updated": timestamp_now
-        }
+def followup_call(journal_context, answers):
+    """The call that follows `answers`: the next question, or the advice after the last step."""
+    if answers and answers[-1]["step"] >= validation_session.MAX_STEPS:
+        return advice_call(journal_context, answers)
+    return next_question_call(journal_context, answers)
 
 
-        journals_collection.update_one(
-            {"username": username},
-            {"$setOnInsert": {"username": username, "entries": []},
-             "$set": {"last_updated": timestamp_now}},
-            upsert=True
-        )
+session_planner.configure(followup_call)
 
-        update_result = journals_collection.update_one(
-            {"username": username, "entries.date": date},
-            {"$set": {"entries.$": new_entry}}
-        )
 
-        if update_result.matched_count == 0:
-            journals_collection.update_one(
-                {"username": username},
-                {"$push": {"entries": new_entry}}
-            )
+# ------------------------------------------------------
+# EMOTION + FIRST QUESTION (background job)
+# ------------------------------------------------------
+FALLBACK_EMOTION_DATA = {
+    "emotion": "Unknown",
+    "question_type": "reflection",
+    "question": "Can you tell me more about how you're feeling?",
+    "options": []
+}
+
+
+def classify_journal_job(job, final_attempt):
+    """emotion_jobs handler: detect the emotion and the first validation question."""
+    username, date = job["username"], job["date"]
+    entry = journal_store.get_entry(mongo.db, username, date, {"text": 1, "micro_checkin": 1, "revision": 1})
+    if not entry:
+        return None
 
-        # -----------------------------
-        # 2️⃣ SINGLE AI CALL FOR EMOTION + QUESTION
-        # -----------------------------
-        emotion_prompt = f"""
+    entry_text = decrypt_text_safe(entry.get("text"))
+    micro_checkin = entry.get("micro_checkin")
+
+    emotion_prompt = f"""
         You are an emotionally intelligent journaling AI.
 
         User's micro check-in:
-        {json.dumps(micro_checkin, indent=2)}
+        {prompt_budget.compact_json(micro_checkin)}
 
         Tasks:
         1. Identify ONE dominant emotion from:
@@ -222,53 +309,147 @@ def save_journal():
             "options": ["opt1", "opt2"]
         }}
 
-        Journal: "{entry_text}"
+        Journal: "{prompt_budget.journal_for('emotion', entry_text)}"
         """
 
-        ai_raw = None
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": emotion_prompt}]
-            )
-            ai_raw = response.choices[0].message.content.strip()
-            ai_raw = ai_raw.replace("```json", "").replace("```", "").strip()
-            emotion_data = json.loads(ai_raw)
+    try:
+        emotion_data = llm_client.complete(emotion_prompt, template="emotion", parse=parse_emotion)
 
-        except Exception as e:
-            app.logger.error(f"AI JSON ERROR: {e}\nRAW: {ai_raw if ai_raw else 'NO AI OUTPUT'}")
-            emotion_data = {
-                "emotion": "Unknown",
-                "question_type": "reflection",
-                "question": "Can you tell me more about how you're feeling?",
-                "options": []
-            }
+    except Exception as e:
+        ai_raw = getattr(e, "raw", None)
+        logger.error("Emotion model output rejected: %s", e,
+                     extra={"fields": {"raw": ai_raw[:500] if ai_raw else None}})
+        if not final_attempt:
+            raise
+        emotion_data = FALLBACK_EMOTION_DATA
 
+    dominant_emotion = emotion_data.get("emotion", "Unknown")
 
+    # Update the journal entry with the detected emotion, unless it was re-saved
+    # meanwhile (the newer text has its own job)
+    journal_store.modify_entry(mongo.db, username, date, {"$set": {"emotion_hidden": dominant_emotion}},
+                               extra_filter={"revision": entry.get("revision")})
 
-        dominant_emotion = emotion_data.get("emotion", "Unknown")
+    result = {
+        "emotion_hidden": dominant_emotion,
+        "question_type": emotion_data.get("question_type"),
+        "question": emotion_data.get("question"),
+        "options": emotion_data.get("options") or []
+    }
+
+    # Start on the follow-ups of the first question while the client polls for it
+    session_planner.plan(validation_session.build_context(entry_text), [], result, 1)
+    return result
+
+
+emotion_jobs.configure(mongo.db, classify_journal_job)
+llm_cache.configure(mongo.db)
+
+
+@app.before_request
+def start_background_workers():
+    # Threads do not survive gunicorn's fork, so start them in each worker
+    emotion_jobs.ensure_workers()
+    instrumentation.set_route(request.url_rule.rule if request.url_rule else None)
+
+
+# ------------------------------------------------------
+# SAVE JOURNAL ENTRY (with Gemini AI)
+# ------------------------------------------------------
+@app.route('/save-journal', methods=['POST'])
+def save_journal():
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"error": "Invalid JSON body"}), 400
+
+        username = (data.get('username') or "").strip()
+        entry_text = (data.get('entry') or "").strip()
+        date = data.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
+        micro_checkin = data.get("micro")  # 🔥 Capture micro-checkin from frontend
+
+
+
+        if not username:
+            return jsonify({'error': 'Missing username'}), 400
+        if not entry_text:
+            return jsonify({'error': 'Missing journal entry'}), 400
+        try:
+            # Dates key the entry, its rollup buckets and the streak
+            datetime.strptime(date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+
+        timestamp_now = datetime.utcnow()
 
         # -----------------------------
-        # 3️⃣ UPDATE JOURNAL WITH EMOTION
+        # 1️⃣ SAVE JOURNAL ENTRY FIRST
         # -----------------------------
-        journals_collection.update_one(
-            {"username": username, "entries.date": date},
-            {"$set": {"entries.$.emotion_hidden": dominant_emotion}}
-        )
+        new_entry = {
+            "text": encrypt_text(entry_text),
+            "micro_checkin": micro_checkin,   # 🔥 Save micro-checkin
+            "emotion_hidden": None,
+            "timestamp": timestamp_now,
+            "last_updated": timestamp_now
+        }
+
+        # One atomic write per (username, date): replaces the entry for that day
+        # and resets its embedded validation session
+        previous = journal_store.save_entry(mongo.db, username, date, new_entry, timestamp_now)
+        if previous:
+            decrypt_cache.invalidate(previous.get("text"))
 
         # -----------------------------
-        # 4️⃣ RETURN FIRST VALIDATION QUESTION
+        # 2️⃣ QUEUE EMOTION + QUESTION (runs in emotion_jobs workers)
         # -----------------------------
+        emotion_jobs.enqueue(mongo.db, username, date)
+
+        # The client polls /journal-question for the first validation question
         return jsonify({
             "message": "Journal saved",
-            "emotion_hidden": dominant_emotion,
-            "question_type": emotion_data.get("question_type"),
-            "question": emotion_data.get("question"),
-            "options": emotion_data.get("options") or []
+            "status": emotion_jobs.STATUS_PENDING
+        }), 202
+
+    except Exception as e:
+        logger.exception("SERVER ERROR (/save-journal): %s", e)
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/journal-question', methods=['GET'])
+def journal_question():
+    """
+    GET /journal-question?username=...&date=YYYY-MM-DD&wait=20
+    Returns the first validation question once emotion detection is done.
+    `wait` (seconds, max 25) turns the call into a long-poll.
+    """
+    try:
+        username = (request.args.get("username") or "").strip()
+        date = request.args.get("date") or datetime.utcnow().strftime('%Y-%m-%d')
+        if not username:
+            return jsonify({'error': 'Missing username'}), 400
+
+        try:
+            wait = min(max(float(request.args.get("wait", 0)), 0.0), 25.0)
+        except ValueError:
+            wait = 0.0
+
+        job = emotion_jobs.wait_for_job(mongo.db, username, date, wait)
+        if not job:
+            return jsonify({"error": "No journal saved for that date"}), 404
+
+        if job.get("status") != emotion_jobs.STATUS_DONE:
+            return jsonify({"status": job.get("status")}), 202
+
+        result = job.get("result") or FALLBACK_EMOTION_DATA
+        return jsonify({
+            "status": emotion_jobs.STATUS_DONE,
+            "question_type": result.get("question_type"),
+            "question": result.get("question"),
+            "options": result.get("options") or []
         }), 200
 
     except Exception as e:
-        app.logger.error("SERVER ERROR (/save-journal): %s\n%s", e, traceback.format_exc())
+        logger.exception("SERVER ERROR (/journal-question): %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -282,99 +463,72 @@ def answer_question():
         username = (data.get('username') or "").strip()
         date = data.get('date') or datetime.utcnow().strftime('%Y-%m-%d')
         answer_text = (data.get('answer') or "").strip()
+        # Step being answered (1-based); lets a retried request be recognised
+        step = data.get('step')
 
         if not username:
             return jsonify({'error': 'Missing username'}), 400
         if not answer_text:
             return jsonify({'error': 'Missing answer'}), 400
+        if step is not None and (not isinstance(step, int) or isinstance(step, bool)
+                                 or not 1 <= step <= validation_session.MAX_STEPS):
+            return jsonify({'error': 'Invalid step'}), 400
 
-        sessions_col = mongo.db.validation_sessions
-        journals_col = mongo.db.journals
         timestamp_now = datetime.utcnow()
 
-        # Try to find existing session
-        session_doc = sessions_col.find_one({"username": username, "date": date})
-
-        # If no session exists, create one from the saved journal entry (upsert-style so duplicate requests are OK)
-        if not session_doc:
-            user_doc = journals_col.find_one({"username": username})
-            if not user_doc:
-                return jsonify({"error": "No journal found for user"}), 404
-
-            entry_obj = next((e for e in user_doc.get("entries", []) if e.get("date") == date), None)
-            if not entry_obj:
-                return jsonify({"error": "No journal entry for that date"}), 404
-
-            encrypted = entry_obj.get("text", "") or ""
-            journal_text = decrypt_text_safe(encrypted) or ""
-            emotion_hidden = entry_obj.get("emotion_hidden", "Unknown")
-
-            # Upsert a session doc
-            sessions_col.update_one(
-                {"username": username, "date": date},
-                {"$setOnInsert": {
-                    "username": username,
-                    "date": date,
-                    "journal_text": journal_text,
-                    "emotion_hidden": emotion_hidden,
-                    "answers": [],
-                    "last_answered_step": 0,
-                    "created_at": timestamp_now,
-                    "updated_at": timestamp_now,
-                    "completed": False
-                }},
-                upsert=True
-            )
-            session_doc = sessions_col.find_one({"username": username, "date": date})
+        # 1st write: append the answer and advance the session atomically
+        status, entry_obj = validation_session.record_answer(
+            mongo.db, username, date, answer_text, step=step, now=timestamp_now
+        )
+        if status is None:
+            return jsonify({"error": "No journal entry for that date"}), 404
+        session_doc = entry_obj["session"]
 
-        # if session completed
-        if session_doc.get("completed"):
+        if status == validation_session.COMPLETED:
             return jsonify({"error": "Validation session already completed. Call /complete or start a new journal."}), 400
+        if status == validation_session.OUT_OF_ORDER:
+            return jsonify({
+                "error": "Answer the current question first",
+                "step": session_doc.get("last_answered_step", 0) + 1
+            }), 409
 
-        last_step = int(session_doc.get("last_answered_step", 0))
-        next_step = last_step + 1
-
-        # limit to 3 steps
-        if next_step > 3:
-            return jsonify({"message": "All questions already answered. Call /complete to finish.", "complete": True}), 200
-
-        # append answer
-        sessions_col.update_one(
-            {"username": username, "date": date},
-            {"$push": {"answers": {"step": next_step, "answer": answer_text}}, "$set": {"last_answered_step": next_step, "updated_at": timestamp_now}}
-        )
+        answered = validation_session.answered_step(session_doc, step)
 
         # after saving, if we've reached 3 answers => ask client to call /complete
-        if next_step >= 3:
+        if answered >= validation_session.MAX_STEPS:
             return jsonify({
                 "message": "All questions answered. Call /complete to generate your affirmation and advice.",
                 "complete": True
             }), 200
 
+        # A retried answer gets the follow-up question that was already generated
+        pending = validation_session.pending_question(session_doc, answered)
+        if pending:
+            return jsonify({
+                "message": "Next question",
+                "question_type": pending.get("question_type"),
+                "question": pending.get("question"),
+                "options": pending.get("options") or []
+            }), 200
+
         # otherwise generate the next question
-        session_doc = sessions_col.find_one({"username": username, "date": date})  # refresh
-        answers_list = session_doc.get("answers", []) or []
-        answers_context = "\n".join([f"Q{a['step']}_answer: {a['answer']}" for a in answers_list])
+        journal_context, context_token = validation_session.journal_context(
+            entry_obj, decrypt_text_safe, encrypt_text
+        )
+        answers_list = [a for a in session_doc.get("answers", []) if a.get("step", 0) <= answered]
 
         # ask for the next question
-        question_prompt = f""" You are an emotionally intelligent journaling assistant. Do NOT reveal the detected emotion to the user.  Context: Journal: \"\"\"{session_doc.get('journal_text','')}\"\"\" Previous answers: {answers_context}  Task: Based on the journal and previous answers, generate ONE interactive validation question to ask next. - If the next question should be a Yes/No question, set question_type = "yes_no". - If it should be a short multiple-choice, set question_type = "choice" and provide 2-3 concise options. - If it should be a reflection prompt, set question_type = "reflection" and make it 1 short sentence.  Keep questions short, contextual, and directly tied to the journal & prior answers. Respond ONLY in JSON in this exact format (no extra text): {{   "question_type": "<yes_no | choice | reflection>",   "question": "<the question text>",   "options": ["opt1","opt2"]   # include only when question_type is "choice" }} """
-
-        ai_raw = None
+        template, question_prompt, parse = next_question_call(journal_context, answers_list)
 
         try:
-            # Use Groq instead of Gemini
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": question_prompt}]
-            )
-
-            ai_raw = response.choices[0].message.content.strip()
-            ai_raw = ai_raw.replace("```json", "").replace("```", "").strip()
-
-            q_data = json.loads(ai_raw)
+            # Runs on the bounded model pool; identical context is served from llm_cache
+            # (or handed over from the session planner's prefetch for this answer)
+            q_data = session_planner.complete(question_prompt, template=template, parse=parse)
 
         except Exception as e:
-            app.logger.error("NEXT QUESTION JSON ERROR: %s\nRAW: %s", e, ai_raw if ai_raw else "NO AI OUTPUT")
+            ai_raw = getattr(e, "raw", None)
+            logger.error("Next-question model output rejected: %s", e,
+                         extra={"fields": {"raw": ai_raw[:500] if ai_raw else None}})
             
             # Fallback question
             q_data = {
@@ -389,24 +543,16 @@ def answer_question():
         q_text = q_data.get("question", "How did that make you feel?")
         q_options = q_data.get("options") or []
 
-        # Save next question into session
-        upcoming_step = int(session_doc.get("last_answered_step", 0)) + 2
-
-        sessions_col.update_one(
-            {"username": username, "date": date},
-            {
-                "$set": {
-                    "next_question": {
-                        "step": upcoming_step,
-                        "question_type": q_type,
-                        "question": q_text,
-                        "options": q_options
-                    },
-                    "updated_at": timestamp_now
-                }
-            }
-        )
+        # 2nd write: the next question (and, the first time, the encrypted context)
+        validation_session.store_next_question(mongo.db, username, date, answered, {
+            "question_type": q_type,
+            "question": q_text,
+            "options": q_options
+        }, context_token=context_token, now=timestamp_now)
 
+        # Prefetch the follow-ups of this question while the user answers it
+        session_planner.plan(journal_context, answers_list,
+                             {"question_type": q_type, "options": q_options}, answered + 1)
 
         response_payload = {
             "message": "Next question",
@@ -418,10 +564,180 @@ def answer_question():
         return jsonify(response_payload), 200
 
     except Exception as e:
-        app.logger.error("SERVER ERROR (/answer-question): %s\n%s", e, traceback.format_exc())
+        logger.exception("SERVER ERROR (/answer-question): %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
+RECENT_TASK_DAYS = 3
+
+
+def finish_validation(username, date, emotion_hidden, advice_text, affirmation_text):
+    """
+    Store the advice, close the session, log the emotion and assign tasks.
+    Returns the tasks, or None when another request completed the session
+    first (the emotion is then not logged twice).
+    """
+    # -----------------------------
+    # UPDATE JOURNAL ENTRY + MARK VALIDATION AS COMPLETE (one write)
+    # -----------------------------
+    timestamp_now = datetime.utcnow()
+    completed = journal_store.modify_entry(mongo.db, username, date, {"$set": {
+        "ai_advice": advice_text,
+        "ai_affirmation": affirmation_text,
+        "last_updated": timestamp_now,
+        "session.completed": True,
+        "session.completed_at": timestamp_now,
+        "session.result": {"advice": advice_text, "affirmation": affirmation_text}
+    }}, extra_filter={"session.completed": {"$ne": True}})
+    if not completed.matched_count:
+        return None
+
+    # -----------------------------
+    # LOG EMOTION HISTORY (+ rollups and streak)
+    # -----------------------------
+    mood_stats.record_emotion(mongo.db, username, date, emotion_hidden)
+
+    # -----------------------------
+    # ASSIGN WELLBEING TASKS
+    # -----------------------------
+    from task_library import pick_tasks
+    tasks_col = mongo.db.wellbeing_tasks
+
+    # Avoid repeating what the user got on their last few days
+    recent_ids = {
+        t["id"]
+        for doc in tasks_col.find(
+            {"username": username, "date": {"$ne": date}}, {"_id": 0, "tasks.id": 1}
+        ).sort("date", -1).limit(RECENT_TASK_DAYS)
+        for t in doc.get("tasks", [])
+    }
+    selected_tasks = pick_tasks(emotion_hidden, count=3, exclude_ids=recent_ids)
+
+    expires_at = datetime.utcnow() + timedelta(minutes=30)
+
+    tasks_payload = {
+        "username": username,
+        "date": date,
+        "emotion": emotion_hidden,
+        "tasks": [
+            {
+                "id": t["id"],
+                "title": t["title"],
+                "duration": t["duration"],
+                "type": t["type"],
+                "expires_at": expires_at,
+                "status": "pending"
+            }
+            for t in selected_tasks
+        ],
+        "created_at": datetime.utcnow()
+    }
+
+    # -----------------------------
+    # UPSERT WELLBEING TASKS
+    # -----------------------------
+    tasks_col.update_one(
+        {"username": username, "date": date},   # match today's tasks for this user
+        {
+            "$set": {
+                "emotion": emotion_hidden,
+                "tasks": tasks_payload["tasks"],
+                "created_at": datetime.utcnow()
+            }
+        },
+        upsert=True
+    )
+
+    return tasks_payload["tasks"]
+
+
+def _already_completed(session_doc):
+    """/complete body for a session whose result is already stored."""
+    result = (session_doc or {}).get("result") or {}
+    return {
+        "message": "Already completed",
+        "advice": result.get("advice"),
+        "affirmation": result.get("affirmation")
+    }
+
+
+def _stored_completion(username, date):
+    entry = journal_store.get_entry(mongo.db, username, date, {"_id": 0, "session": 1})
+    return _already_completed((entry or {}).get("session"))
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {app.json.dumps(data)}\n\n"
+
+
+def _complete_events(username, date, emotion_hidden, model_stream, final_data=None):
+    """
+    Body of the streaming /complete: `advice` events carry the advice text as
+    the model produces it, then `done` (the JSON /complete body) once
+    everything is stored, or `error`. A reader that disconnects does not
+    cancel anything: the rest of the completion is read and stored anyway.
+    """
+    connected = True
+    if final_data is not None:
+        # Served from the session planner's prefetch
+        try:
+            yield _sse("advice", {"delta": (final_data.get("advice") or "").strip()})
+        except GeneratorExit:
+            connected = False
+    else:
+        scanner = ai_parsing.JsonObjectScanner()
+        sent = ""
+        try:
+            for piece in model_stream:
+                scanner.feed(piece)
+                advice = ai_parsing.partial_fields(scanner).get("advice")
+                if not connected or not isinstance(advice, str) or len(advice) <= len(sent) \
+                        or not advice.startswith(sent):
+                    continue
+                try:
+                    yield _sse("advice", {"delta": advice[len(sent):]})
+                except GeneratorExit:
+                    connected = False
+                sent = advice
+            final_data = model_stream.result()
+
+        except llm_client.ModelUnavailable as e:
+            logger.warning("Advice model unavailable: %s", e)
+            if connected:
+                yield _sse("error", {"error": "AI is busy, please try again", "status": 503})
+            return
+
+        except Exception as e:
+            ai_raw = getattr(e, "raw", None)
+            logger.error("Advice model output rejected: %s", e,
+                         extra={"fields": {"raw": ai_raw[:500] if ai_raw else None}})
+            if connected:
+                yield _sse("error", {"error": "Invalid AI JSON", "status": 500})
+            return
+
+    advice_text = final_data.get("advice", "").strip()
+    affirmation_text = final_data.get("affirmation", "").strip()
+    try:
+        tasks_assigned = finish_validation(username, date, emotion_hidden, advice_text, affirmation_text)
+        # A concurrent /complete (or a retry after a disconnect) stored its result first
+        body = _stored_completion(username, date) if tasks_assigned is None else None
+    except Exception as e:
+        logger.exception("SERVER ERROR (/complete stream): %s", e)
+        if connected:
+            yield _sse("error", {"error": "Internal server error", "status": 500})
+        return
+
+    if connected and body is not None:
+        yield _sse("done", body)
+    elif connected:
+        yield _sse("done", {
+            "message": "Validation complete",
+            "advice": advice_text,
+            "affirmation": affirmation_text,
+            "tasks_assigned": tasks_assigned
+        })
+
+
 @app.route('/complete', methods=['POST'])
 def complete_validation_and_create_advice():
     try:
@@ -432,75 +748,56 @@ def complete_validation_and_create_advice():
         if not username:
             return jsonify({'error': 'Missing username'}), 400
 
-        sessions_col = mongo.db.validation_sessions
-        journals_col = mongo.db.journals
-        tasks_col = mongo.db.wellbeing_tasks
-        history_col = mongo.db.emotion_history
-
-        session_doc = sessions_col.find_one({"username": username, "date": date})
+        entry_obj = journal_store.get_entry(
+            mongo.db, username, date, {"_id": 0, "text": 1, "emotion_hidden": 1, "session": 1}
+        )
+        session_doc = (entry_obj or {}).get("session")
         if not session_doc:
             return jsonify({"error": "No active validation session found"}), 404
 
         if session_doc.get("completed"):
-            result = session_doc.get("result", {})
-            return jsonify({
-                "message": "Already completed",
-                "advice": result.get("advice"),
-                "affirmation": result.get("affirmation")
-            }), 200
+            return jsonify(_already_completed(session_doc)), 200
 
         answers = session_doc.get("answers", [])
         if len(answers) < 1:
             return jsonify({"error": "At least one validation answer required"}), 400
 
-        journal_text = session_doc.get("journal_text", "")
-        emotion_hidden = session_doc.get("emotion_hidden", "Unknown")
-        answers_context = "\n".join([f"Q{a['step']}_answer: {a['answer']}" for a in answers])
+        journal_text, _ = validation_session.journal_context(entry_obj, decrypt_text_safe)
+        emotion_hidden = entry_obj.get("emotion_hidden") or "Unknown"
 
         # -----------------------------
         # GENERATE FINAL ADVICE
         # -----------------------------
-        final_prompt = f"""
-You are a compassionate journaling coach. Do NOT reveal the detected emotion to the user.
-
-Context:
-Journal: \"\"\"{journal_text}\"\"\"
-Validation answers:
-{answers_context}
-
-Task:
-1) Generate a short, practical piece of advice (2–3 sentences) directly based on the journal + answers.
-2) Generate a single-line supportive affirmation.
-
-Rules:
-- Respond ONLY in valid JSON.
-- Use EXACT keys: "advice", "affirmation".
-- NO commentary, NO markdown, NO explanation, NO extra text.
-- Do NOT talk about being an AI model.
-
-JSON FORMAT:
-{{
-  "advice": "<2–3 sentences>",
-  "affirmation": "<1 short supportive sentence>"
-}}
-"""
-
-        ai_raw = None
+        template, final_prompt, parse = advice_call(journal_text, answers)
+
+        # Server-sent events: the advice is shown as it is generated, the
+        # results are stored once the model stream has finished
+        if request.args.get("stream") == "1" or "text/event-stream" in request.headers.get("Accept", ""):
+            final_data = session_planner.prefetched(final_prompt, template)
+            model_stream = None
+            if final_data is None:
+                try:
+                    model_stream = llm_client.stream(final_prompt, template=template, parse=parse)
+                except llm_client.ModelUnavailable as e:
+                    logger.warning("Advice model unavailable: %s", e)
+                    return jsonify({"error": "AI is busy, please try again"}), 503
+            events = _complete_events(username, date, emotion_hidden, model_stream, final_data)
+            return Response(stream_with_context(events), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
         try:
-            # Groq API call instead of Gemini
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[{"role": "user", "content": final_prompt}]
-            )
+            # Runs on the bounded model pool; identical context is served from llm_cache
+            # (or handed over from the session planner's prefetch for this answer)
+            final_data = session_planner.complete(final_prompt, template=template, parse=parse)
 
-            ai_raw = response.choices[0].message.content.strip()
-            ai_raw = ai_raw.replace("```json", "").replace("```", "").strip()
-
-            final_data = json.loads(ai_raw)
+        except llm_client.ModelUnavailable as e:
+            logger.warning("Advice model unavailable: %s", e)
+            return jsonify({"error": "AI is busy, please try again"}), 503
 
         except Exception as e:
-            app.logger.error("FINAL JSON ERROR: %s\nRAW FINAL: %s", e, ai_raw if ai_raw else "NO AI OUTPUT")
+            ai_raw = getattr(e, "raw", None)
+            logger.error("Advice model output rejected: %s", e,
+                         extra={"fields": {"raw": ai_raw[:500] if ai_raw else None}})
             return jsonify({"error": "Invalid AI JSON"}), 500
 
 
@@ -509,85 +806,10 @@ JSON FORMAT:
         affirmation_text = final_data.get("affirmation", "").strip()
 
 
-        # -----------------------------
-        # UPDATE JOURNAL ENTRY
-        # -----------------------------
-        user_doc = journals_col.find_one({"username": username})
-        entry_obj = next(e for e in user_doc["entries"] if e["date"] == date)
-
-        updated_entry = entry_obj.copy()
-        updated_entry["ai_advice"] = advice_text
-        updated_entry["ai_affirmation"] = affirmation_text
-        updated_entry["last_updated"] = datetime.utcnow()
-
-        journals_col.update_one(
-            {"username": username, "entries.date": date},
-            {"$set": {"entries.$": updated_entry}}
-        )
-
-        # -----------------------------
-        # MARK VALIDATION AS COMPLETE
-        # -----------------------------
-        sessions_col.update_one(
-            {"username": username, "date": date},
-            {"$set": {
-                "completed": True,
-                "completed_at": datetime.utcnow(),
-                "result": {"advice": advice_text, "affirmation": affirmation_text}
-            }}
-        )
-
-        # -----------------------------
-        # LOG EMOTION HISTORY
-        # -----------------------------
-        history_col.insert_one({
-            "username": username,
-            "date": date,
-            "emotion": emotion_hidden,
-            "timestamp": datetime.utcnow()
-        })
-
-        # -----------------------------
-        # ASSIGN WELLBEING TASKS
-        # -----------------------------
-        from task_library import pick_tasks
-        selected_tasks = pick_tasks(emotion_hidden, count=3)
-
-        expires_at = datetime.utcnow() + timedelta(minutes=30)
-
-        tasks_payload = {
-            "username": username,
-            "date": date,
-            "emotion": emotion_hidden,
-            "tasks": [
-                {
-                    "id": t["id"],
-                    "title": t["title"],
-                    "duration": t["duration"],
-                    "type": t["type"],
-                    "expires_at": expires_at,
-                    "status": "pending"
-                }
-                for t in selected_tasks
-            ],
-            "created_at": datetime.utcnow()
-        }
-
-        # -----------------------------
-        # UPSERT WELLBEING TASKS
-        # -----------------------------
-        tasks_col.update_one(
-            {"username": username, "date": date},   # match today's tasks for this user
-            {
-                "$set": {
-                    "emotion": emotion_hidden,
-                    "tasks": tasks_payload["tasks"],
-                    "created_at": datetime.utcnow()
-                }
-            },
-            upsert=True
-        )
-
+        tasks_assigned = finish_validation(username, date, emotion_hidden, advice_text, affirmation_text)
+        if tasks_assigned is None:
+            # A concurrent /complete stored its result first
+            return jsonify(_stored_completion(username, date)), 200
 
         # -----------------------------
         # RETURN FINAL RESPONSE
@@ -596,11 +818,11 @@ JSON FORMAT:
             "message": "Validation complete",
             "advice": advice_text,
             "affirmation": affirmation_text,
-            "tasks_assigned": tasks_payload["tasks"]
+            "tasks_assigned": tasks_assigned
         }), 200
 
     except Exception as e:
-        app.logger.error("SERVER ERROR (/complete): %s\n%s", e, traceback.format_exc())
+        logger.exception("SERVER ERROR (/complete): %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
@@ -623,19 +845,14 @@ def get_tasks():
 def complete_task():
     
     try:
-        print("📥 RAW DATA:", request.data)
-        print("📥 HEADERS:", request.headers)
-
         data = request.get_json(force=True, silent=False)
     except Exception as e:
-        print("❌ JSON parse error:", e)
+        logger.warning("Invalid JSON body: %s", e)
         return jsonify({"error": "Invalid JSON"}), 400
 
     username = data.get("username")
     task_id = data.get("task_id")
-
-    print("🔥 DEBUG username:", username)
-    print("🔥 DEBUG task_id:", task_id)
+    logger.debug("Completing task", extra={"fields": {"task_id": task_id}})
 
     if not username or not task_id:
         return jsonify({"error": "Missing username or task_id"}), 400
@@ -673,17 +890,19 @@ def get_task():
         return jsonify({"task": task}), 200
 
     except Exception as e:
-        print("ERROR /get-task:", e)
+        logger.exception("ERROR /get-task: %s", e)
         return jsonify({"error": "Internal server error"}), 500
 
 
 
 
+AFFIRMATIONS_MAX_PAGE = 1000
+
+
 @app.route('/affirmations', methods=['POST'])
 def get_journals():
     try:
         data = request.get_json(force=True)
-        print("✅ Received data:", data)
 
         if not isinstance(data, dict):
             return jsonify({'message': 'Invalid JSON format'}), 400
@@ -692,106 +911,229 @@ def get_journals():
         if not username:
             return jsonify({'message': 'Username is required'}), 400
 
-        # Fetch all journals of this user
-        journals = list(mongo.db.journals.find({'username': username}))
-        response_data = []
-
-        for journal in journals:
-            entries = journal.get('entries', [])
-
-            for entry in entries:
-                if not isinstance(entry, dict):
-                    print("⚠️ Skipping malformed entry:", entry)
-                    continue
+        # Optional paging / field selection:
+        #   fields: "meta" → dates + emotions only (no decryption)
+        #   from / to: inclusive YYYY-MM-DD bounds, order: "asc" | "desc"
+        #   limit + cursor: page size and the next_cursor of the previous page
+        include_text = data.get('fields') != 'meta'
+        descending = data.get('order') == 'desc'
+        cursor = data.get('cursor')
+        try:
+            limit = min(int(data.get('limit') or 0), AFFIRMATIONS_MAX_PAGE)
+        except (TypeError, ValueError):
+            return jsonify({'message': 'limit must be a number'}), 400
+        if limit < 0:
+            return jsonify({'message': 'limit must not be negative'}), 400
+
+        projection = {"_id": 0, "date": 1, "timestamp": 1, "sentiment": 1, "emotion_hidden": 1}
+        if include_text:
+            projection.update({"text": 1, "ai_affirmation": 1, "ai_advice": 1})
+
+        # Fetch the user's journal entries (one document per day)
+        entries = list(journal_store.find_entries(
+            mongo.db, username, projection,
+            date_from=data.get('from'), date_to=data.get('to'),
+            after=None if descending else cursor,
+            before=cursor if descending else None,
+            descending=descending,
+            limit=limit + 1 if limit else 0
+        ))
+
+        has_more = bool(limit) and len(entries) > limit
+        if has_more:
+            entries = entries[:limit]
+
+        # ----------------------------------------------------
+        # DECRYPT THE TEXTS SAFELY (batched across the decrypt pool)
+        # ----------------------------------------------------
+        if include_text:
+            with instrumentation.stage("crypto"):
+                texts = journal_crypto.decrypt_many(
+                    [entry.get("text", "") for entry in entries], decrypt_text_safe
+                )
+        else:
+            texts = [None] * len(entries)
 
-                # ----------------------------------------------------
-                # 1️⃣ Determine correct date
-                # ----------------------------------------------------
-                entry_date = entry.get("date") or entry.get("timestamp")
-                if entry_date:
-                    if isinstance(entry_date, str) and "T" in entry_date:
-                        entry_date = entry_date.split("T")[0]  # Extract YYYY-MM-DD
-                    else:
-                        entry_date = str(entry_date)
-                else:
-                    print("⚠️ Skipping entry without date:", entry)
-                    continue
+        response_data = []
+        for entry, text_plain in zip(entries, texts):
+            # Make timestamp ISO (JSON safe)
+            ts = entry.get("timestamp")
+            if isinstance(ts, datetime):
+                ts = ts.isoformat()
+            else:
+                ts = str(ts) if ts is not None else None
 
-                # ----------------------------------------------------
-                # 2️⃣ DECRYPT THE TEXT SAFELY
-                # ----------------------------------------------------
-                encrypted_text = entry.get("text", "")
-                text_plain = decrypt_text_safe(encrypted_text)
-
-                # ----------------------------------------------------
-                # 3️⃣ Make timestamp ISO (JSON safe)
-                # ----------------------------------------------------
-                ts = entry.get("timestamp")
-                if isinstance(ts, datetime):
-                    ts = ts.isoformat()
-                else:
-                    ts = str(ts) if ts is not None else None
-
-                # ----------------------------------------------------
-                # 4️⃣ Prepare final response object
-                # ----------------------------------------------------
-                response_data.append({
-                    "date": entry_date,
+            item = {
+                "date": entry["date"],
+                "sentiment": entry.get("sentiment") or entry.get("emotion_hidden") or "Unknown",
+                "emotion_hidden": entry.get("emotion_hidden"),
+                "timestamp": ts
+            }
+            if include_text:
+                item.update({
                     "text": text_plain,  # decrypted text
-                    "sentiment": entry.get("sentiment") or entry.get("emotion_hidden") or "Unknown",
-                    "emotion_hidden": entry.get("emotion_hidden"),
                     "affirmation": (entry.get("ai_affirmation") or "").strip(),
-                    "advice": (entry.get("ai_advice") or "").strip(),
-                    "timestamp": ts
+                    "advice": (entry.get("ai_advice") or "").strip()
                 })
+            response_data.append(item)
 
-        return jsonify({"journals": response_data}), 200
+        return jsonify({
+            "journals": response_data,
+            "has_more": has_more,
+            "next_cursor": response_data[-1]["date"] if has_more else None
+        }), 200
 
     except Exception as e:
-        print("🔥 Error fetching journals:", e)
+        logger.exception("Error fetching journals: %s", e)
         return jsonify({"message": "Error fetching journals"}), 500
 
+# ------------------------- EXPORT (STREAMING NDJSON) -------------------------
+EXPORT_BATCH = 200  # cursor batch size = entries held in memory at once
+
+
+def _export_lines(username, after):
+    """One JSON line per entry, decrypted as it is read; then an end marker."""
+    entries = journal_store.find_entries(
+        mongo.db, username,
+        {"_id": 0, "date": 1, "timestamp": 1, "text": 1, "emotion_hidden": 1,
+         "ai_affirmation": 1, "ai_advice": 1},
+        after=after
+    ).batch_size(EXPORT_BATCH)
+
+    count, last_date = 0, after
+    for entry in entries:
+        ts = entry.get("timestamp")
+        text, ok = "", True
+        if entry.get("text"):
+            # Straight to fernet: an export should not evict the hot read cache
+            try:
+                with instrumentation.stage("crypto"):
+                    text = fernet.decrypt(entry["text"].encode()).decode()
+            except Exception:
+                ok = False
+        item = {
+            "date": entry["date"],
+            "timestamp": ts.isoformat() if isinstance(ts, datetime) else ts,
+            "emotion": entry.get("emotion_hidden") or "Unknown",
+            "text": text,
+            "affirmation": (entry.get("ai_affirmation") or "").strip(),
+            "advice": (entry.get("ai_advice") or "").strip(),
+        }
+        if not ok:
+            item["decrypt_failed"] = True
+        count += 1
+        last_date = entry["date"]
+        yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    # Lets clients tell a complete export from a dropped connection;
+    # resume with ?after=<date of the last line received>
+    yield json.dumps({"end": True, "count": count, "last_date": last_date}) + "\n"
+
+
+def _gzip_stream(lines, flush_every=EXPORT_BATCH):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for i, line in enumerate(lines, 1):
+        chunk = compressor.compress(line.encode("utf-8"))
+        if i % flush_every == 0:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+@app.route('/export', methods=['GET'])
+def export_journals():
+    """
+    GET /export?username=...&after=YYYY-MM-DD&gzip=1
+    Streams the user's full history as NDJSON (oldest first). `after` resumes
+    an interrupted export; gzip=1 (or Accept-Encoding: gzip) compresses it.
+    """
+    username = (request.args.get("username") or "").strip()
+    if not username:
+        return jsonify({"message": "username query param required"}), 400
+
+    after = request.args.get("after") or None
+    lines = _export_lines(username, after)
+
+    # Usernames are free text; keep quotes and line breaks out of the header
+    filename = secure_filename(f"journal-{username}.ndjson") or "journal.ndjson"
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Cache-Control": "no-store",
+        "X-Accel-Buffering": "no",
+        "Vary": "Accept-Encoding",
+    }
+    use_gzip = (request.args.get("gzip") == "1"
+                or "gzip" in (request.headers.get("Accept-Encoding") or ""))
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+        body = _gzip_stream(lines)
+    else:
+        body = lines
+
+    return Response(stream_with_context(body), mimetype="application/x-ndjson", headers=headers)
+
+
 # Flask example
 # ------------------------- GET SINGLE JOURNAL (DAILY) -------------------------
+GET_JOURNAL_DEFAULT_PAGE = 31   # a whole month
+GET_JOURNAL_MAX_PAGE = 100
+
+
 @app.route("/get-journal")
 def get_journal():
+    """
+    GET /get-journal?username=...&date=YYYY-MM-DD          → {"text"}
+    GET /get-journal?username=...&datePrefix=YYYY-MM       → {"entries", "has_more", "next_cursor"}
+    GET /get-journal?username=...&from=YYYY-MM-DD&to=...   (same shape)
+    Range queries accept order=asc|desc, limit (max 100) and cursor (the
+    previous page's next_cursor); the date range is answered from the
+    (username, date) index and only the returned page is decrypted.
+    """
     username = request.args.get("username")
     date = request.args.get("date")            # format: YYYY-MM-DD
     date_prefix = request.args.get("datePrefix")  # format: YYYY-MM
+    date_from = request.args.get("from")
+    date_to = request.args.get("to")
 
     if not username:
         return jsonify({"error": "username missing"}), 400
 
-    journals = mongo.db.journals.find_one({"username": username})
-    if not journals:
-        return jsonify({"entries": []})
-
-    entries = journals.get("entries", [])
-
     # CASE 1: Daily Fetch
     if date:
-        for e in entries:
-            if e["date"] == date:
-                encrypted_text = e.get("text", "")
-                if encrypted_text:
-                    decrypted_text = fernet.decrypt(encrypted_text.encode()).decode()
-                else:
-                    decrypted_text = ""
-                return jsonify({"text": decrypted_text})
-        return jsonify({"text": ""})
-
-    # CASE 2: Monthly Fetch
-    if date_prefix:
-        filtered = []
-        for e in entries:
-            if e["date"].startswith(date_prefix):
-                encrypted_text = e.get("text", "")
-                decrypted_text = fernet.decrypt(encrypted_text.encode()).decode()
-                filtered.append({
-                    "date": e["date"],
-                    "text": decrypted_text
-                })
-        return jsonify({"entries": filtered})
+        e = journal_store.get_entry(mongo.db, username, date, {"text": 1})
+        return jsonify({"text": decrypt_text_safe(e.get("text", "")) if e else ""})
+
+    # CASE 2: Monthly / Range Fetch
+    if date_prefix or date_from or date_to:
+        descending = request.args.get("order") == "desc"
+        cursor = request.args.get("cursor")
+        try:
+            limit = min(int(request.args.get("limit") or GET_JOURNAL_DEFAULT_PAGE), GET_JOURNAL_MAX_PAGE)
+        except ValueError:
+            return jsonify({"error": "limit must be a number"}), 400
+        if limit < 1:
+            return jsonify({"error": "limit must be at least 1"}), 400
+
+        entries = list(journal_store.find_entries(
+            mongo.db, username, {"_id": 0, "date": 1, "text": 1},
+            date_prefix=date_prefix, date_from=date_from, date_to=date_to,
+            after=None if descending else cursor,
+            before=cursor if descending else None,
+            descending=descending,
+            limit=limit + 1
+        ))
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        # Undecryptable entries come back with empty text instead of failing the page
+        with instrumentation.stage("crypto"):
+            texts = journal_crypto.decrypt_many([e.get("text", "") for e in entries], decrypt_text_safe)
+        return jsonify({
+            "entries": [{"date": e["date"], "text": text} for e, text in zip(entries, texts)],
+            "has_more": has_more,
+            "next_cursor": entries[-1]["date"] if has_more else None
+        })
 
 
     return jsonify({"error": "No valid query parameter provided"}), 400
@@ -801,26 +1143,21 @@ def get_journal():
 def update_calm_quest():
     try:
         data = request.get_json()
-        print("Received update-calm-quest data:", data)
         username = data.get("username")
 
         if not username:
-            print("No username in request")
             return jsonify({'message': 'Username required'}), 400
 
         today = datetime.now().strftime("%Y-%m-%d")
         collection = mongo.db.calm_quest
         record = collection.find_one({"username": username})
-        print("Existing record:", record)
 
         if not record:
             new_doc = {"username": username, "streak": 1, "last_completed": today}
             collection.insert_one(new_doc)
-            print("Inserted new record:", new_doc)
             return jsonify(new_doc), 200
 
         last_date = record.get("last_completed")  # could be None
-        print("last_date:", last_date, "today:", today)
 
         if last_date == today:
             # already done today
@@ -839,7 +1176,7 @@ def update_calm_quest():
             else:
                 delta_days = None
         except Exception as e:
-            print("Error parsing last_date:", e)
+            logger.warning("Unparseable calm-quest last_completed %r: %s", last_date, e)
             delta_days = None
 
         if delta_days == 1:
@@ -852,7 +1189,7 @@ def update_calm_quest():
             {"$set": {"streak": new_streak, "last_completed": today}}
         )
 
-        print("Updated streak to", new_streak)
+        logger.debug("Calm-quest streak updated", extra={"fields": {"streak": new_streak}})
         return jsonify({
             "username": username,
             "streak": new_streak,
@@ -860,7 +1197,7 @@ def update_calm_quest():
         }), 200
 
     except Exception as e:
-        print("🔥 Error in update-calm-quest:", e)
+        logger.exception("Error in update-calm-quest: %s", e)
         return jsonify({"message": "Error updating streak"}), 500
 
 
@@ -891,7 +1228,7 @@ def get_calm_quest():
         return jsonify(record), 200
 
     except Exception as e:
-        print("🔥 Error:", e)
+        logger.exception("Error in get-calm-quest: %s", e)
         return jsonify({"message": "Error retrieving streak"}), 500
 
 
@@ -902,56 +1239,91 @@ def get_username():
     return jsonify({'username': 'your_test_username'})
 
 
-from calendar import month_name
-from operator import itemgetter
+MOOD_STATS_MAX_BUCKETS = 366
+
+
+@app.route('/mood-stats', methods=['GET'])
+def get_mood_stats():
+    """
+    GET /mood-stats?username=...&granularity=day|week|month&from=YYYY-MM-DD&to=YYYY-MM-DD&limit=N
+    Emotion counts per bucket (oldest first), their totals and the current /
+    best same-emotion streaks, read from the pre-aggregated rollups.
+    """
+    try:
+        username = (request.args.get("username") or "").strip()
+        if not username:
+            return jsonify({"error": "username query param required"}), 400
+
+        granularity = request.args.get("granularity", "day")
+        if granularity not in mood_stats.GRANULARITIES:
+            return jsonify({"error": "granularity must be day, week or month"}), 400
+        try:
+            limit = min(int(request.args.get("limit") or MOOD_STATS_MAX_BUCKETS), MOOD_STATS_MAX_BUCKETS)
+            stats = mood_stats.get_stats(
+                mongo.db, username, granularity,
+                date_from=request.args.get("from"), date_to=request.args.get("to"), limit=limit
+            )
+        except ValueError:
+            return jsonify({"error": "from/to must be YYYY-MM-DD and limit a number"}), 400
+
+        return jsonify({"username": username, **stats}), 200
+
+    except Exception as e:
+        logger.exception("Error in /mood-stats: %s", e)
+        return jsonify({"error": "Error fetching mood stats"}), 500
+
+
+SUMMARIES_MAX_PAGE = 120
+
 
 @app.route('/summaries/<username>', methods=['GET'])
 def get_summaries_by_username(username):
     """
-    GET /summaries/<username>
+    GET /summaries/<username>?from=YYYY-MM&to=YYYY-MM&order=asc|desc&limit=N&cursor=YYYY-MM
     Returns JSON:
-      { "username": "...", "summaries": [ {month, year, summary, last_journal_date}, ... ] }
-    If no document exists returns { "username": username, "summaries": [] }
+      { "username": "...", "summaries": [ {month, year, period, summary, last_journal_date}, ... ],
+        "has_more": bool, "next_cursor": "YYYY-MM" | null }
+    Sorted by (year, month) in Mongo from the (username, period) index; without
+    a limit the full history is returned (oldest first), as before.
     """
     try:
         if not username:
             return jsonify({"error": "Username required"}), 400
 
-        doc = summaries_collection.find_one({"username": username}, {"_id": 0})
-        if not doc:
-            return jsonify({"username": username, "summaries": []}), 200
-
-        summaries = doc.get("summaries", []) or []
-
-        # Normalize months to consistent dicts and sort chronologically (year then month index)
-        def month_index(m):
-            # handle both full month names and numeric months if supplied
-            try:
-                # if 'month' is a string like "November"
-                return list(month_name).index(m.get("month")) if isinstance(m.get("month"), str) else int(m.get("month"))
-            except Exception:
-                return 0
-
-        # Ensure all entries have year as int
-        for s in summaries:
-            try:
-                s["year"] = int(s.get("year", 0))
-            except:
-                s["year"] = 0
-
-        # sort by year ascending, month index ascending
-        summaries_sorted = sorted(
-            summaries,
-            key=lambda s: (s.get("year", 0), month_index(s))
-        )
+        args = request.args
+        descending = args.get("order") == "desc"
+        try:
+            period_from = summary_store.parse_period(args["from"]) if args.get("from") else None
+            period_to = summary_store.parse_period(args["to"]) if args.get("to") else None
+            cursor = summary_store.parse_period(args["cursor"]) if args.get("cursor") else None
+            limit = min(int(args.get("limit") or 0), SUMMARIES_MAX_PAGE)
+        except (TypeError, ValueError):
+            return jsonify({"error": "from/to/cursor must be YYYY-MM and limit a number"}), 400
+        if limit < 0:
+            return jsonify({"error": "limit must not be negative"}), 400
+
+        docs = list(summary_store.find_summaries(
+            mongo.db, username, period_from, period_to,
+            after=None if descending else cursor,
+            before=cursor if descending else None,
+            descending=descending,
+            limit=limit + 1 if limit else 0
+        ))
+
+        has_more = bool(limit) and len(docs) > limit
+        if has_more:
+            docs = docs[:limit]
+        summaries = [summary_store.to_response(d) for d in docs]
 
         return jsonify({
             "username": username,
-            "summaries": summaries_sorted
+            "summaries": summaries,
+            "has_more": has_more,
+            "next_cursor": summaries[-1]["period"] if has_more else None
         }), 200
 
     except Exception as e:
-        print("🔥 Error in /summaries/<username>:", e)
+        logger.exception("Error in /summaries/<username>: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
@@ -959,7 +1331,7 @@ def get_summaries_by_username(username):
 def get_summaries_query():
     """
     GET /get-summaries?username=...
-    Backwards-compatible wrapper.
+    Backwards-compatible wrapper (accepts the same range parameters).
     """
     username = request.args.get("username")
     if not username:
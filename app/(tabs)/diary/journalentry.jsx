@@ -154,7 +154,7 @@ function ValidationModal({ isVisible, closeModal, journalEntry, initialQuestionD
       const resp = await fetch("http://192.168.29.215:5010/answer-question", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ username: u, date, answer }),
+        body: JSON.stringify({ username: u, date, answer, step: currentStep }),
       });
       const data = await resp.json();
 
@@ -419,6 +419,24 @@ export default function JournalEntry() {
     setMicroVisible(true);
   };
 
+  // poll /journal-question until the background job has produced the first question
+  const waitForFirstQuestion = async (u, date, attempts = 4) => {
+    for (let i = 0; i < attempts; i++) {
+      try {
+        const resp = await fetch(
+          `http://192.168.29.215:5010/journal-question?username=${encodeURIComponent(u)}&date=${date}&wait=20`
+        );
+        const data = await resp.json();
+        if (resp.status === 200 && data.status === "done") return data;
+        if (!resp.ok) return null;
+      } catch (err) {
+        console.log("Error polling question:", err);
+        return null;
+      }
+    }
+    return null;
+  };
+
   // handle micro-complete; 'value' depends on microType format:
   // emoji => string label, tags => array of strings, happimeter => number
   const handleMicroComplete = async (type, value) => {
@@ -447,11 +465,14 @@ export default function JournalEntry() {
         return;
       }
 
+      // Emotion detection runs in the background; long-poll for the first question
+      const question = await waitForFirstQuestion(username, date);
+
       // Backend returns question_type, question, options
       setValidationInitialData({
-        question_type: data.question_type,
-        question: data.question,
-        options: data.options || []
+        question_type: question?.question_type || "reflection",
+        question: question?.question || "Can you tell me more about how you're feeling?",
+        options: question?.options || []
       });
 
       // open validation modal
@@ -75,7 +75,10 @@ const JournalView = () => {
 
     const loadData = async () => {
       try {
-        const res = await fetch(`http://192.168.29.215:5010/summaries/${username}`);
+        // Only the selected year; the server sorts and filters by (year, month)
+        const res = await fetch(
+          `http://192.168.29.215:5010/summaries/${username}?from=${selectedYear}-01&to=${selectedYear}-12`
+        );
         const json = await res.json();
         setSummaries(json?.summaries || []);
       } catch (err) {
@@ -86,7 +89,7 @@ const JournalView = () => {
     };
 
     loadData();
-  }, [username]);
+  }, [username, selectedYear]);
 
   // 🟩 Filter based on selected year
   const yearCards = summaries
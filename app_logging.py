@@ -0,0 +1,210 @@
+# app_logging.py
+# Structured, non-blocking logging for the web process.
+#
+# Records are put on a bounded in-memory queue by the request threads and
+# written to stderr as one JSON object per line by a single listener thread,
+# so a slow terminal or log pipe never stalls a request (when the queue is
+# full, records are dropped and counted instead). Every record carries the
+# Flask route it was logged from. Structured fields go in `extra`:
+#
+#     logger.info("Task completed", extra={"fields": {"task_id": task_id}})
+#
+# Tunables (env):
+#   LOG_LEVEL        minimum level (default INFO)
+#   LOG_QUEUE_SIZE   records buffered before dropping (default 10000)
+#   LOG_RATE_LIMIT   "N/SECONDS": at most N records per message per window,
+#                    the rest are counted and reported on the next one (default 20/60)
+#   LOG_SAMPLE       per-route share of DEBUG / INFO records kept,
+#                    e.g. "/affirmations=0.1,/get-tasks=0.05" (warnings are never sampled)
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+import instrumentation
+
+ROOT_LOGGER = "studentsphere"
+
+
+def _parse_rate_limit(spec):
+    try:
+        count, window = (spec or "20/60").split("/")
+        return int(count), float(window)
+    except ValueError:
+        return 20, 60.0
+
+
+def _parse_sampling(spec):
+    rates = {}
+    for part in (spec or "").split(","):
+        route, _, rate = part.partition("=")
+        try:
+            rates[route.strip()] = min(max(float(rate), 0.0), 1.0)
+        except ValueError:
+            continue
+    return rates
+
+
+# ------------------------------------------------------
+# FILTERS
+# ------------------------------------------------------
+class RouteFilter(logging.Filter):
+    """Tag records with the route of the request running on this thread."""
+
+    def filter(self, record):
+        timings = instrumentation.current()
+        record.route = timings.route if timings is not None else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self.rates.get(getattr(record, "route", None))
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """At most `count` records per (logger, message template) per window."""
+
+    def __init__(self, count, window):
+        super().__init__()
+        self.count = count
+        self.window = window
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.count <= 0:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg).__name__)
+        now = time.monotonic()
+        with self._lock:
+            started, seen, suppressed = self._buckets.get(key, (now, 0, 0))
+            if now - started >= self.window:
+                started, seen = now, 0
+            if seen >= self.count:
+                self._buckets[key] = (started, seen, suppressed + 1)
+                return False
+            self._buckets[key] = (started, seen + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+# ------------------------------------------------------
+# FORMAT + QUEUE
+# ------------------------------------------------------
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "route", None):
+            payload["route"] = record.route
+        if getattr(record, "fields", None):
+            payload.update(record.fields)
+        if getattr(record, "suppressed", 0):
+            payload["suppressed"] = record.suppressed
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks: a full queue drops the record. Restarts its listener after fork."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+        super().__init__(queue.Queue(maxsize))
+
+    def _ensure_listener(self):
+        # gunicorn --preload forks after import; threads do not survive the fork
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.maxsize)
+            output = logging.StreamHandler(sys.stderr)
+            output.setFormatter(JsonFormatter())
+            self._listener = QueueListener(self.queue, output)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Only freeze what may change later; the JSON is built on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def stop(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+
+
+_handler = None
+_configure_lock = threading.Lock()
+
+
+def configure():
+    """
+    Install the queue handler on the app's logger tree. Idempotent. Reads the
+    env when called, so call it after load_dotenv().
+    """
+    global _handler
+    with _configure_lock:
+        if _handler is not None:
+            return _handler
+        _handler = DroppingQueueHandler(int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _handler.addFilter(RouteFilter())
+        _handler.addFilter(SamplingFilter(_parse_sampling(os.getenv("LOG_SAMPLE"))))
+        _handler.addFilter(RateLimitFilter(*_parse_rate_limit(os.getenv("LOG_RATE_LIMIT"))))
+
+        logger = logging.getLogger(ROOT_LOGGER)
+        logger.setLevel(getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO))
+        logger.addHandler(_handler)
+        logger.propagate = False
+        atexit.register(_handler.stop)
+        return _handler
+
+
+def get_logger(name):
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def stats():
+    handler = _handler
+    if handler is None:
+        return {"configured": False}
+    return {"configured": True, "queued": handler.queue.qsize(), "dropped": handler.dropped}
@@ -0,0 +1,580 @@
+# bench.py
+# Load / latency benchmark for the Flask routes, with local stand-ins.
+#
+#     python bench.py --users 20 --years 2 --duration 60 --concurrency 8
+#     python bench.py --save-baseline bench_baseline.json
+#     python bench.py --compare bench_baseline.json --tolerance 0.2   # exit 1 on regression
+#     python bench.py --mongomock --duration 10                        # no mongod needed
+#     python bench.py --mix journal=1 --model-jitter 0 --think-time 2 [--planner]
+#     python bench.py --mix journal=1 --stream-complete --model-token-delay 0.02
+#
+# A fake Groq server (fake_groq.py) is started in-process with the requested
+# latency / error distribution and app.py is imported against it and a local
+# mongod (MONGO_URI, default a throwaway `studentsphere_bench` database) or
+# mongomock. Synthetic users get N years of encrypted journal history, emotion
+# history, summaries, tasks and a calm-quest record. Client threads then replay
+# the React Native screens (journal entry, diary month view, home widgets,
+# tasks, calm quest) with weighted mixes and every request is timed per route.
+#
+# Reported per route: count, errors, p50/p95/p99/mean latency and, from a
+# separate sequential pass under tracemalloc, the median peak allocation per
+# request. --url runs the same mix against an already running server over HTTP
+# (it must share MONGO_URI and FERNET_KEY with this process for the seeding).
+#
+# The journal flow answers like the app (taps an offered option, types for
+# reflection questions). With a fixed model latency (--model-jitter 0) and a
+# --think-time per question, runs with and without --planner show what the
+# session planner's prefetching saves on /answer-question and /complete.
+#
+# mongomock lacks some server features (pipeline updates, parts of the
+# aggregation language), so its numbers are for smoke runs, not baselines.
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from calendar import monthrange
+from datetime import datetime, timedelta
+
+import fake_groq
+
+DEFAULT_MONGO_URI = "mongodb://127.0.0.1:27017/studentsphere_bench"
+DEFAULT_MIX = "journal=1,diary=3,home=4,tasks=1,calm=1"
+
+# Future days handed out to journal flows (next() on a count is atomic in CPython)
+_journal_days = itertools.count(1)
+
+WORDS = ("today felt long and I kept thinking about exams friends family sleep music "
+         "walked outside coffee deadline proud tired hopeful worried calm lonely grateful "
+         "project lecture gym dinner phone call mom laughed cried finished started").split()
+EMOTIONS = ["Happy", "Sad", "Anxious", "Stressed", "Angry", "Lonely",
+            "Grateful", "Hopeful", "Guilty", "Conflicted"]
+
+
+# ------------------------------------------------------
+# CLIENTS
+# ------------------------------------------------------
+class InProcessClient:
+    """Flask test client; no sockets, so allocations can be traced per request."""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self._client.open(path, method=method, json=body)
+        data = response.get_data()
+        return response.status_code, data
+
+    def request_stream(self, method, path, body=None):
+        """(status, seconds to the first chunk, body) for a streamed response."""
+        started = time.perf_counter()
+        response = self._client.open(path, method=method, json=body, buffered=False)
+        chunks, first = [], None
+        try:
+            for chunk in response.iter_encoded():
+                if first is None:
+                    first = time.perf_counter() - started
+                chunks.append(chunk)
+        finally:
+            response.close()
+        return response.status_code, first, b"".join(chunks)
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def request_stream(self, method, path, body=None):
+        started = time.perf_counter()
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                head = resp.readline()
+                first = time.perf_counter() - started
+                return resp.status, first, head + resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, None, e.read()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def _record(self, route, elapsed, status):
+        with self._lock:
+            self.samples.setdefault(route, []).append(elapsed)
+            if status >= 500:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+    def call(self, client, route, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body)
+        except Exception:
+            status, data = 599, b""
+        self._record(route, time.perf_counter() - started, status)
+        try:
+            return status, json.loads(data or b"null")
+        except ValueError:
+            return status, None
+
+    def call_stream(self, client, route, method, path, body=None):
+        """Streamed response: total time under `route`, time to first byte under `route` + " ttfb"."""
+        started = time.perf_counter()
+        try:
+            status, first, data = client.request_stream(method, path, body)
+        except Exception:
+            status, first, data = 599, None, b""
+        self._record(route, time.perf_counter() - started, status)
+        if first is not None:
+            self._record(route + " ttfb", first, status)
+        # A stream that ends with an error event counts as failed
+        if b"event: error" in data:
+            with self._lock:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return status, data
+
+
+# ------------------------------------------------------
+# SEEDING
+# ------------------------------------------------------
+def _text(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def seed(db, fernet, users, years, density, rng, log=print):
+    """Synthetic history for `users`, ending yesterday. Returns their usernames."""
+    import journal_store
+    import mood_stats
+    import summary_store
+    from task_library import pick_tasks
+
+    usernames = [f"bench_user_{i:03d}" for i in range(users)]
+    today = datetime.utcnow().date()
+    start = today - timedelta(days=int(365 * years))
+
+    for username in usernames:
+        entries, history = [], []
+        day = start
+        while day < today:
+            if rng.random() < density:
+                date = day.isoformat()
+                emotion = rng.choice(EMOTIONS)
+                entries.append({
+                    "username": username, "date": date,
+                    "text": fernet.encrypt(_text(rng, rng.randint(30, 200)).encode()).decode(),
+                    "timestamp": datetime(day.year, day.month, day.day, 21),
+                    "emotion_hidden": emotion, "sentiment": emotion,
+                    "ai_advice": _text(rng, 25), "ai_affirmation": _text(rng, 10),
+                })
+                history.append({"username": username, "date": date, "emotion": emotion,
+                                "timestamp": datetime(day.year, day.month, day.day, 21)})
+            day += timedelta(days=1)
+
+        if entries:
+            journal_store.entries_collection(db).insert_many(entries, ordered=False)
+            db[mood_stats.HISTORY_COLLECTION].insert_many(history, ordered=False)
+
+        months = sorted({e["date"][:7] for e in entries})
+        for month_key in months[:-1]:
+            summary_store.upsert_summary(db, username, int(month_key[:4]), int(month_key[5:7]),
+                                         _text(rng, 60), f"{month_key}-28")
+
+        db.wellbeing_tasks.insert_one({
+            "username": username, "date": today.isoformat(),
+            "tasks": pick_tasks(rng.choice(EMOTIONS), count=3),
+        })
+        db.calm_quest.insert_one({"username": username, "streak": rng.randint(0, 20),
+                                  "last_completed": (today - timedelta(days=1)).isoformat()})
+
+    try:
+        mood_stats.backfill(db, users=usernames, log=lambda *_: None)
+    except ImportError:
+        log("⚠️ numpy missing: /mood-stats rollups not seeded")
+
+    log(f"🌱 Seeded {len(usernames)} users x {years} years of history")
+    return usernames
+
+
+# ------------------------------------------------------
+# SCENARIOS (one per app screen)
+# ------------------------------------------------------
+class Scenarios:
+    def __init__(self, recorder, usernames, years, rng_seed, think_time=0.0, stream_complete=False):
+        self.rec = recorder
+        self.usernames = usernames
+        self.years = years
+        self.think_time = think_time
+        self.stream_complete = stream_complete
+        self._local = threading.local()
+        self._rng_seed = rng_seed
+
+    @property
+    def rng(self):
+        if not hasattr(self._local, "rng"):
+            self._local.rng = random.Random(self._rng_seed + threading.get_ident())
+        return self._local.rng
+
+    def _fresh_date(self):
+        # Each journal flow writes a day nobody has completed yet
+        return (datetime.utcnow().date() + timedelta(days=next(_journal_days))).isoformat()
+
+    def _past_month(self):
+        back = self.rng.randint(1, max(1, int(12 * self.years) - 1))
+        month = datetime.utcnow().date().replace(day=1) - timedelta(days=28 * back)
+        return month.year, month.month
+
+    def journal(self, c, user):
+        """journalentry.jsx: save, wait for the question, answer all three, complete."""
+        date = self._fresh_date()
+        self.rec.call(c, "POST /save-journal", "POST", "/save-journal",
+                      {"username": user, "entry": _text(self.rng, 120), "date": date,
+                       "micro": {"mood": self.rng.randint(1, 5)}})
+        _, question = self.rec.call(c, "GET /journal-question", "GET",
+                                    f"/journal-question?username={user}&date={date}&wait=20")
+        for step in (1, 2, 3):
+            self._think()
+            _, question = self.rec.call(c, "POST /answer-question", "POST", "/answer-question",
+                                        {"username": user, "date": date, "step": step,
+                                         "answer": self._answer(question)})
+        self._think()
+        if self.stream_complete:
+            self.rec.call_stream(c, "POST /complete?stream=1", "POST", "/complete?stream=1",
+                                 {"username": user, "date": date})
+        else:
+            self.rec.call(c, "POST /complete", "POST", "/complete", {"username": user, "date": date})
+        self.rec.call(c, "GET /get-tasks", "GET", f"/get-tasks?username={user}")
+
+    def _answer(self, question):
+        """Tap an offered answer like the app does; type one for reflection questions."""
+        question = question if isinstance(question, dict) else {}
+        if question.get("question_type") == "yes_no":
+            return self.rng.choice(["Yes", "No"])
+        if question.get("question_type") == "choice" and question.get("options"):
+            return self.rng.choice(question["options"])
+        return _text(self.rng, 15)
+
+    def _think(self):
+        # The user reading the question and answering it
+        if self.think_time:
+            time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    def diary(self, c, user):
+        """journalview.jsx + [month].jsx: year of summaries, a month, one day."""
+        year, month = self._past_month()
+        self.rec.call(c, "GET /summaries", "GET", f"/summaries/{user}?from={year}-01&to={year}-12")
+        self.rec.call(c, "GET /get-journal?datePrefix", "GET",
+                      f"/get-journal?username={user}&datePrefix={year}-{month:02d}")
+        day = self.rng.randint(1, monthrange(year, month)[1])
+        self.rec.call(c, "GET /get-journal?date", "GET",
+                      f"/get-journal?username={user}&date={year}-{month:02d}-{day:02d}")
+
+    def home(self, c, user):
+        """streakcalender.jsx, moodsnapshot.jsx and the mood widgets."""
+        self.rec.call(c, "POST /affirmations?meta", "POST", "/affirmations",
+                      {"username": user, "fields": "meta"})
+        self.rec.call(c, "POST /affirmations?latest", "POST", "/affirmations",
+                      {"username": user, "order": "desc", "limit": 1})
+        self.rec.call(c, "GET /mood-stats", "GET",
+                      f"/mood-stats?username={user}&granularity=week&limit=12")
+
+    def tasks(self, c, user):
+        _, body = self.rec.call(c, "GET /get-tasks", "GET", f"/get-tasks?username={user}")
+        pending = (body or {}).get("tasks") or []
+        if pending:
+            self.rec.call(c, "POST /complete-task", "POST", "/complete-task",
+                          {"username": user, "task_id": pending[0]["id"]})
+
+    def calm(self, c, user):
+        self.rec.call(c, "GET /get-calm-quest", "GET", f"/get-calm-quest?username={user}")
+        self.rec.call(c, "POST /update-calm-quest", "POST", "/update-calm-quest", {"username": user})
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            mix[name.strip()] = float(weight or 1)
+    unknown = [n for n in mix if not hasattr(Scenarios, n)]
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(unknown)}")
+    return mix
+
+
+def drive(make_client, scenarios, mix, concurrency, duration):
+    names, weights = list(mix), list(mix.values())
+    deadline = time.monotonic() + duration
+    done = [0]
+    done_lock = threading.Lock()
+
+    def worker():
+        client = make_client()
+        rng = scenarios.rng
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            getattr(scenarios, name)(client, rng.choice(scenarios.usernames))
+            with done_lock:
+                done[0] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return done[0], time.monotonic() - started
+
+
+def measure_allocations(make_client, scenarios, mix, rounds):
+    """Median peak bytes allocated per request, per route (sequential)."""
+    recorder = scenarios.rec
+    allocations = {}
+    original_call = recorder.call
+
+    def traced_call(client, route, method, path, body=None):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        result = original_call(client, route, method, path, body)
+        allocations.setdefault(route, []).append(tracemalloc.get_traced_memory()[1] - before)
+        return result
+
+    client = make_client()
+    recorder.call = traced_call
+    tracemalloc.start()
+    try:
+        for _ in range(rounds):
+            for name in mix:
+                getattr(scenarios, name)(client, scenarios.rng.choice(scenarios.usernames))
+    finally:
+        tracemalloc.stop()
+        recorder.call = original_call
+    return {route: statistics.median(values) for route, values in allocations.items()}
+
+
+# ------------------------------------------------------
+# REPORTING
+# ------------------------------------------------------
+def _quantile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[idx]
+
+
+def summarize(recorder, allocations, flows, elapsed, config):
+    routes = {}
+    total = 0
+    for route, values in sorted(recorder.samples.items()):
+        values = sorted(values)
+        total += len(values)
+        routes[route] = {
+            "count": len(values),
+            "errors": recorder.errors.get(route, 0),
+            "p50_ms": round(_quantile(values, 0.50) * 1000, 2),
+            "p95_ms": round(_quantile(values, 0.95) * 1000, 2),
+            "p99_ms": round(_quantile(values, 0.99) * 1000, 2),
+            "mean_ms": round(statistics.fmean(values) * 1000, 2),
+            "alloc_kb": round(allocations[route] / 1024, 1) if route in allocations else None,
+        }
+    return {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": config,
+        "throughput": {
+            "requests_per_s": round(total / elapsed, 2) if elapsed else 0.0,
+            "flows_per_s": round(flows / elapsed, 2) if elapsed else 0.0,
+            "requests": total,
+            "seconds": round(elapsed, 2),
+        },
+        "routes": routes,
+    }
+
+
+def print_report(result):
+    print(f"\n{'route':<30} {'count':>6} {'err':>4} {'p50':>9} {'p95':>9} {'p99':>9} {'alloc':>9}")
+    for route, r in result["routes"].items():
+        alloc = f"{r['alloc_kb']:.0f}KB" if r["alloc_kb"] is not None else "-"
+        print(f"{route:<30} {r['count']:>6} {r['errors']:>4} {r['p50_ms']:>7.1f}ms "
+              f"{r['p95_ms']:>7.1f}ms {r['p99_ms']:>7.1f}ms {alloc:>9}")
+    t = result["throughput"]
+    print(f"\n⚡ {t['requests_per_s']} req/s, {t['flows_per_s']} flows/s "
+          f"({t['requests']} requests in {t['seconds']}s)")
+    planner = result.get("session_planner")
+    if planner and planner.get("enabled"):
+        print(f"🔮 planner: {planner['hits']} hits, {planner['misses']} misses, "
+              f"{planner['prefetched']} prefetched, {planner['skipped_busy']} skipped (pool busy)")
+
+
+def compare(result, baseline, tolerance, min_count=20, slack_ms=5.0):
+    """Routes whose p95 regressed beyond tolerance (plus a small absolute slack)."""
+    regressions = []
+    for route, base in baseline.get("routes", {}).items():
+        current = result["routes"].get(route)
+        if not current or current["count"] < min_count or base["count"] < min_count:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance) + slack_ms
+        if current["p95_ms"] > limit:
+            regressions.append((route, base["p95_ms"], current["p95_ms"]))
+        base_err = base["errors"] / base["count"]
+        if current["errors"] / current["count"] > base_err + 0.01:
+            regressions.append((route + " (errors)", base["errors"], current["errors"]))
+    return regressions
+
+
+# ------------------------------------------------------
+# MAIN
+# ------------------------------------------------------
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Flask routes with local stand-ins")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--years", type=float, default=2.0)
+    parser.add_argument("--density", type=float, default=0.7, help="share of days with an entry")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--alloc-rounds", type=int, default=5, help="0 disables the allocation pass")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", DEFAULT_MONGO_URI))
+    parser.add_argument("--mongomock", action="store_true", help="in-memory mongomock instead of mongod")
+    parser.add_argument("--reuse-data", action="store_true", help="keep the existing bench database")
+    parser.add_argument("--url", help="benchmark a running server instead of importing app.py")
+    parser.add_argument("--model-delay", type=float, default=0.5)
+    parser.add_argument("--model-jitter", type=float, default=0.2)
+    parser.add_argument("--model-latency-dist", choices=("uniform", "lognormal"), default="uniform")
+    parser.add_argument("--model-error-rate", type=float, default=0.0)
+    parser.add_argument("--model-garbage-rate", type=float, default=0.0)
+    parser.add_argument("--model-port", type=int, default=8085)
+    parser.add_argument("--planner", action="store_true",
+                        help="enable the session planner's prefetching (SESSION_PLANNER=1)")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="mean seconds a user spends on each question in the journal flow")
+    parser.add_argument("--stream-complete", action="store_true",
+                        help="use the server-sent-events /complete (reports time to first byte too)")
+    parser.add_argument("--model-token-delay", type=float, default=0.0,
+                        help="seconds between the fake model's streamed chunks")
+    parser.add_argument("--save-baseline", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth (0.2 = 20%%)")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    fake = fake_groq.make_server(port=args.model_port, delay=args.model_delay, jitter=args.model_jitter,
+                                 error_rate=args.model_error_rate, garbage_rate=args.model_garbage_rate,
+                                 latency_dist=args.model_latency_dist, token_delay=args.model_token_delay)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.model_port}"
+    os.environ.setdefault("GROQ_API_KEY", "fake")
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["LLM_CACHE_POLICY"] = os.getenv("LLM_CACHE_POLICY", "emotion=off,next_question=off,advice=off")
+    if args.planner:
+        os.environ["SESSION_PLANNER"] = "1"
+    if not os.getenv("FERNET_KEY"):
+        if args.url:
+            raise SystemExit("❌ --url needs the server's FERNET_KEY in the environment")
+        from cryptography.fernet import Fernet
+        os.environ["FERNET_KEY"] = Fernet.generate_key().decode()
+
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+        import flask_pymongo
+        flask_pymongo.MongoClient = mongomock.MongoClient
+
+    if args.url:
+        import journal_crypto
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_uri).get_default_database()
+        fernet = journal_crypto.build_fernet(os.environ["FERNET_KEY"], os.getenv("FERNET_OLD_KEYS"))
+
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        import app as app_module
+        db = app_module.mongo.db
+        fernet = app_module.fernet
+
+        def make_client():
+            return InProcessClient(app_module.app)
+
+    if not args.mongomock and "bench" not in db.name:
+        # Seeding wipes the database first; never do that to a real one
+        raise SystemExit(f"❌ Refusing to use database {db.name!r}: its name must contain 'bench'")
+
+    if args.reuse_data:
+        usernames = sorted(u for u in db.calm_quest.distinct("username") if u.startswith("bench_user_"))
+    else:
+        for name in db.list_collection_names():
+            if not name.startswith("system."):
+                db[name].delete_many({})
+        usernames = seed(db, fernet, args.users, args.years, args.density, rng)
+    if not usernames:
+        raise SystemExit("❌ No bench users; run once without --reuse-data")
+
+    mix = parse_mix(args.mix)
+    recorder = Recorder()
+    scenarios = Scenarios(recorder, usernames, args.years, args.seed, think_time=args.think_time,
+                          stream_complete=args.stream_complete)
+
+    print(f"🏁 {args.concurrency} clients for {args.duration:.0f}s, mix {args.mix}")
+    flows, elapsed = drive(make_client, scenarios, mix, args.concurrency, args.duration)
+
+    allocations = {}
+    if args.alloc_rounds and not args.url:
+        alloc_recorder = Recorder()
+        allocations = measure_allocations(make_client, Scenarios(alloc_recorder, usernames, args.years,
+                                                                 args.seed + 1), mix, args.alloc_rounds)
+
+    config = {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare", "output")}
+    result = summarize(recorder, allocations, flows, elapsed, config)
+    if not args.url:
+        import session_planner
+        result["session_planner"] = session_planner.stats()
+    print_report(result)
+
+    for path in (args.save_baseline, args.output):
+        if path:
+            with open(path, "w") as f:
+                json.dump(result, f, indent=2)
+            print(f"💾 Results written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.tolerance)
+        for route, before, after in regressions:
+            print(f"❌ {route}: {before} → {after}")
+        if regressions:
+            sys.exit(1)
+        print(f"✅ No p95 regression beyond {args.tolerance:.0%} of {args.compare}")
+
+    fake.shutdown()
+
+
+if __name__ == "__main__":
+    main()
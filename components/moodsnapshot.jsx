@@ -47,7 +47,8 @@ const MoodSnapshot = () => {
         return;
       }
 
-      const res = await axios.post('http://192.168.29.215:5010/affirmations', { username });
+      // Only the latest entry is shown, so ask for a single newest-first page
+      const res = await axios.post('http://192.168.29.215:5010/affirmations', { username, order: 'desc', limit: 1 });
       // Access the entries array safely
       const entries = res?.data?.entries ?? res?.data?.journals ?? [];
       if (!Array.isArray(entries) || entries.length === 0) {
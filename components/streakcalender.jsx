@@ -79,7 +79,7 @@ const StreakCalendar = () => {
 
       const res = await axios.post(
         "http://192.168.29.215:5010/affirmations",
-        { username }
+        { username, fields: "meta" } // dates + emotions only, no decrypted text
       );
 
       
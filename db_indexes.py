@@ -0,0 +1,154 @@
+# db_indexes.py
+# Index bootstrap for every collection used by app.py, plus a query-plan check.
+#
+#     python db_indexes.py            # create / update indexes (idempotent)
+#     python db_indexes.py --verify   # also explain() every route's query shape
+#                                     # and exit 1 if any plan is a COLLSCAN
+#
+# app.py calls ensure_indexes() at startup; create_index is a no-op when the
+# index already exists, so repeated boots are cheap.
+
+import os
+import sys
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+import emotion_jobs
+import journal_store
+import llm_cache
+import mood_stats
+import summary_store
+
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "30"))
+
+# (collection, keys, options)
+INDEXES = [
+    ("users", [("email", ASCENDING)], {"unique": True, "name": "email_unique"}),
+    ("journals", [("username", ASCENDING)], {"name": "username"}),
+    # Legacy: sessions now live in journal_entries.session; the TTL drains the old
+    # documents, which kept the decrypted journal text
+    ("validation_sessions", [("username", ASCENDING), ("date", ASCENDING)],
+     {"unique": True, "name": "username_date_unique"}),
+    ("validation_sessions", [("created_at", ASCENDING)],
+     {"expireAfterSeconds": SESSION_TTL_DAYS * 24 * 3600, "name": "created_at_ttl"}),
+    ("wellbeing_tasks", [("username", ASCENDING), ("date", ASCENDING)],
+     {"unique": True, "name": "username_date_unique"}),
+    ("wellbeing_tasks", [("tasks.id", ASCENDING)], {"name": "tasks_id"}),
+    ("emotion_history", [("username", ASCENDING), ("date", ASCENDING)], {"name": "username_date"}),
+    ("calm_quest", [("username", ASCENDING)], {"unique": True, "name": "username_unique"}),
+    # Legacy layout, only read by the lazy migration in summary_store
+    ("summaries", [("username", ASCENDING)], {"unique": True, "name": "username_unique"}),
+]
+
+# (route, collection, filter, sort) — one entry per query the routes issue
+QUERY_SHAPES = [
+    ("/signup /signin", "users", {"email": "a@example.com"}, None),
+    ("/save-journal /get-journal", journal_store.ENTRIES_COLLECTION,
+     {"username": "u", "date": "2025-01-01"}, None),
+    ("/affirmations /get-journal?datePrefix&from&to", journal_store.ENTRIES_COLLECTION,
+     {"username": "u", "date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}, [("date", ASCENDING)]),
+    ("/affirmations?order=desc", journal_store.ENTRIES_COLLECTION,
+     {"username": "u"}, [("date", DESCENDING)]),
+    ("legacy migration", journal_store.LEGACY_COLLECTION,
+     {"username": "u", "entries_migrated_at": {"$exists": False}}, None),
+    ("/answer-question /complete", journal_store.ENTRIES_COLLECTION,
+     {"username": "u", "date": "2025-01-01", "session.last_answered_step": 1}, None),
+    ("/get-tasks", "wellbeing_tasks", {"username": "u"}, None),
+    ("/complete-task", "wellbeing_tasks", {"username": "u", "tasks.id": "t"}, None),
+    ("/get-task", "wellbeing_tasks", {"tasks.id": "t"}, None),
+    ("/complete", "wellbeing_tasks", {"username": "u", "date": "2025-01-01"}, None),
+    ("/get-calm-quest /update-calm-quest", "calm_quest", {"username": "u"}, None),
+    ("/summaries", summary_store.SUMMARIES_COLLECTION,
+     {"username": "u", "period": {"$gte": 202401, "$lte": 202412}}, [("period", DESCENDING)]),
+    ("/mood-stats", mood_stats.ROLLUPS_COLLECTION,
+     {"username": "u", "granularity": "day", "bucket": {"$gte": "2025-01-01"}}, [("bucket", DESCENDING)]),
+    ("/mood-stats streak", mood_stats.STREAKS_COLLECTION, {"username": "u"}, None),
+    ("mood backfill", mood_stats.HISTORY_COLLECTION, {"username": {"$in": ["u"]}}, None),
+    ("summary migration", summary_store.LEGACY_COLLECTION,
+     {"username": "u", "summaries_migrated_at": {"$exists": False}}, None),
+    ("/journal-question", emotion_jobs.JOBS_COLLECTION, {"username": "u", "date": "2025-01-01"}, None),
+    ("emotion job claim", emotion_jobs.JOBS_COLLECTION,
+     {"$or": [
+         {"status": emotion_jobs.STATUS_PENDING, "run_after": {"$lte": datetime(2025, 1, 1)}},
+         {"status": emotion_jobs.STATUS_RUNNING, "lease_until": {"$lt": datetime(2025, 1, 1)}},
+     ]},
+     [("run_after", ASCENDING)]),
+]
+
+
+def _create(db, collection, keys, options, log):
+    try:
+        db[collection].create_index(keys, **options)
+    except OperationFailure as e:
+        if e.code == 11000 and options.get("unique"):
+            # Existing duplicates block a unique index; keep the lookup fast anyway
+            log(f"⚠️ {collection}.{options['name']}: duplicates found, creating non-unique index")
+            relaxed = {k: v for k, v in options.items() if k != "unique"}
+            relaxed["name"] = options["name"].replace("_unique", "")
+            db[collection].create_index(keys, **relaxed)
+        elif e.code in (85, 86):
+            # IndexOptionsConflict / IndexKeySpecsConflict: an index with other options exists
+            log(f"⚠️ {collection}.{options['name']}: conflicting index exists, left unchanged ({e})")
+        else:
+            raise
+
+
+def ensure_indexes(db, log=print):
+    for collection, keys, options in INDEXES:
+        _create(db, collection, keys, options, log)
+    journal_store.ensure_indexes(db)
+    emotion_jobs.ensure_indexes(db)
+    llm_cache.ensure_indexes(db)
+    summary_store.ensure_indexes(db)
+    mood_stats.ensure_indexes(db)
+
+
+def _stages(plan):
+    """Yield every stage name of an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+
+
+def verify(db, log=print):
+    """explain() every query shape; return the routes whose plan uses a COLLSCAN."""
+    failures = []
+    for route, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_stages(plan))
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        log(f"{'❌' if status != 'ok' else '✅'} {route:<40} {collection:<22} {' > '.join(stages)}")
+        if status != "ok":
+            failures.append(route)
+    return failures
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Create and verify MongoDB indexes")
+    parser.add_argument("--verify", action="store_true", help="Fail if any route query is a COLLSCAN")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+
+    ensure_indexes(mongo_db)
+    print("✅ Indexes ensured")
+
+    if args.verify and verify(mongo_db):
+        sys.exit(1)
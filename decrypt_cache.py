@@ -0,0 +1,130 @@
+# decrypt_cache.py
+# Cache of decrypted journal text, keyed by a hash of the ciphertext.
+#
+# Fernet tokens are unique per encryption, so a key can never go stale: when an
+# entry is re-saved it gets a new token (and a new key), and the old plaintext
+# is dropped by `invalidate()` or ages out through the TTL.
+#
+# Tunables (env):
+#   DECRYPT_CACHE_BYTES       memory budget of the in-process tier (default 32 MB)
+#   DECRYPT_CACHE_TTL         seconds an entry stays cached (default 600)
+#   DECRYPT_CACHE_REDIS_URL   optional shared tier (needs the `redis` package).
+#                             It holds plaintext journals: only point it at a
+#                             private, non-persistent instance.
+
+import hashlib
+import logging
+import os
+import threading
+
+from cachetools import TTLCache
+
+logger = logging.getLogger("studentsphere.decrypt_cache")
+
+BYTE_BUDGET = int(os.getenv("DECRYPT_CACHE_BYTES", str(32 * 1024 * 1024)))
+TTL_SECONDS = int(os.getenv("DECRYPT_CACHE_TTL", "600"))
+REDIS_URL = os.getenv("DECRYPT_CACHE_REDIS_URL")
+
+_SHARED_PREFIX = "dec:"
+
+# Sizes are counted in UTF-8 bytes of the plaintext plus the 32-byte key
+_cache = TTLCache(maxsize=BYTE_BUDGET, ttl=TTL_SECONDS,
+                  getsizeof=lambda text: len(text.encode()) + 32)
+_lock = threading.Lock()
+_counters = {"hits": 0, "shared_hits": 0, "misses": 0, "invalidations": 0}
+
+_shared = None
+if REDIS_URL:
+    try:
+        import redis
+        _shared = redis.Redis.from_url(REDIS_URL)
+    except ImportError:
+        logger.warning("DECRYPT_CACHE_REDIS_URL is set but `redis` is not installed; shared tier disabled")
+
+
+def _key(token):
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(token).digest()
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def get_or_decrypt(token, decrypt):
+    """Return the plaintext for `token`, calling `decrypt(token)` only on a miss."""
+    key = _key(token)
+    with _lock:
+        text = _cache.get(key)
+        if text is not None:
+            _counters["hits"] += 1
+            return text
+
+    if _shared is not None:
+        try:
+            shared_text = _shared.get(_SHARED_PREFIX + key.hex())
+        except Exception:
+            shared_text = None
+        if shared_text is not None:
+            text = shared_text.decode()
+            _put_local(key, text)
+            _count("shared_hits")
+            return text
+
+    _count("misses")
+    text = decrypt(token)
+    put(token, text, key=key)
+    return text
+
+
+def _put_local(key, text):
+    with _lock:
+        try:
+            _cache[key] = text
+        except ValueError:
+            # A single value larger than the whole budget is simply not cached
+            pass
+
+
+def put(token, text, key=None):
+    """Seed the cache, e.g. with the plaintext we just encrypted."""
+    if not token or text is None:
+        return
+    key = key or _key(token)
+    _put_local(key, text)
+    if _shared is not None:
+        try:
+            _shared.setex(_SHARED_PREFIX + key.hex(), TTL_SECONDS, text.encode())
+        except Exception:
+            pass
+
+
+def invalidate(token):
+    """Forget the plaintext of a token that has been replaced."""
+    if not token:
+        return
+    key = _key(token)
+    with _lock:
+        _cache.pop(key, None)
+        _counters["invalidations"] += 1
+    if _shared is not None:
+        try:
+            _shared.delete(_SHARED_PREFIX + key.hex())
+        except Exception:
+            pass
+
+
+def stats():
+    with _lock:
+        result = dict(_counters)
+        result.update({
+            "entries": len(_cache),
+            "bytes": int(_cache.currsize),
+            "max_bytes": int(_cache.maxsize),
+            "shared_tier": _shared is not None
+        })
+    lookups = result["hits"] + result["shared_hits"] + result["misses"]
+    result["hit_rate"] = round((result["hits"] + result["shared_hits"]) / lookups, 4) if lookups else 0.0
+    return result
@@ -0,0 +1,216 @@
+# emotion_jobs.py
+# Mongo-backed job queue for emotion classification of saved journal entries.
+#
+# /save-journal only writes the entry and enqueues a job here; worker threads
+# inside each app process claim jobs, run the model and store the first
+# validation question on the job document, which the client polls through
+# /journal-question. Jobs live in Mongo, so pending or half-finished work is
+# picked up again after a restart (expired leases are re-claimed).
+#
+# Tunables (env):
+#   EMOTION_WORKERS        worker threads per process (default 2)
+#   EMOTION_MAX_ATTEMPTS   model attempts before falling back (default 3)
+#   EMOTION_LEASE_SECONDS  how long a claimed job is owned by one worker (default 120)
+#   EMOTION_JOB_TTL_DAYS   days a finished job is kept for /journal-question (default 7)
+
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger("studentsphere.emotion_jobs")
+
+JOBS_COLLECTION = "emotion_jobs"
+
+WORKERS = int(os.getenv("EMOTION_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("EMOTION_MAX_ATTEMPTS", "3"))
+LEASE_SECONDS = int(os.getenv("EMOTION_LEASE_SECONDS", "120"))
+JOB_TTL_DAYS = int(os.getenv("EMOTION_JOB_TTL_DAYS", "7"))
+POLL_INTERVAL = 2.0
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+
+_db = None
+_handler = None
+_started_pid = None
+_start_lock = threading.Lock()
+_wakeup = threading.Event()
+# Notified whenever a job finishes in this process (used by long-polls)
+_finished = threading.Condition()
+
+
+def jobs_collection(db):
+    return db[JOBS_COLLECTION]
+
+
+def ensure_indexes(db):
+    col = jobs_collection(db)
+    col.create_index([("username", ASCENDING), ("date", ASCENDING)],
+                     unique=True, name="username_date_unique")
+    col.create_index([("status", ASCENDING), ("run_after", ASCENDING)],
+                     name="status_run_after")
+    # Finished jobs only: a re-queued job leaves the partial index and is kept
+    col.create_index([("updated_at", ASCENDING)], name="done_updated_at_ttl",
+                     expireAfterSeconds=JOB_TTL_DAYS * 24 * 3600,
+                     partialFilterExpression={"status": STATUS_DONE})
+
+
+def configure(db, handler):
+    """
+    `handler(job, final_attempt)` classifies one job and returns the result
+    dict stored on it. It should raise to request a retry; on the final
+    attempt it should return a fallback instead. If it raises anyway, the job
+    is finished without a result.
+    """
+    global _db, _handler
+    _db = db
+    _handler = handler
+
+
+def enqueue(db, username, date):
+    """(Re)queue classification for (username, date). A newer save replaces older work."""
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    jobs_collection(db).update_one(
+        {"username": username, "date": date},
+        {"$set": {
+            "status": STATUS_PENDING,
+            "token": token,
+            "attempts": 0,
+            "run_after": now,
+            "lease_until": None,
+            "claim_id": None,
+            "result": None,
+            "error": None,
+            "updated_at": now
+        },
+         "$setOnInsert": {"username": username, "date": date, "created_at": now}},
+        upsert=True
+    )
+    ensure_workers()
+    _wakeup.set()
+    return token
+
+
+def get_job(db, username, date):
+    return jobs_collection(db).find_one({"username": username, "date": date}, {"_id": 0})
+
+
+def wait_for_job(db, username, date, timeout):
+    """Long-poll helper: return the job once it is done or `timeout` runs out."""
+    deadline = time.monotonic() + max(0.0, timeout)
+    while True:
+        job = get_job(db, username, date)
+        remaining = deadline - time.monotonic()
+        if not job or job.get("status") == STATUS_DONE or remaining <= 0:
+            return job
+        with _finished:
+            # Jobs finished by other processes are only seen on the re-read
+            _finished.wait(min(remaining, 0.5))
+
+
+# ------------------------------------------------------
+# WORKERS
+# ------------------------------------------------------
+def _claim(db):
+    # A fresh claim_id per claim: a worker whose lease expired cannot write
+    # over the one that re-claimed the job
+    now = datetime.utcnow()
+    return jobs_collection(db).find_one_and_update(
+        {"$or": [
+            {"status": STATUS_PENDING, "run_after": {"$lte": now}},
+            {"status": STATUS_RUNNING, "lease_until": {"$lt": now}}
+        ]},
+        {"$set": {
+            "status": STATUS_RUNNING,
+            "lease_until": now + timedelta(seconds=LEASE_SECONDS),
+            "claim_id": uuid.uuid4().hex,
+            "updated_at": now
+        },
+         "$inc": {"attempts": 1}},
+        sort=[("run_after", ASCENDING)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _process(db, job):
+    col = jobs_collection(db)
+    # Writes are guarded by the token so a re-save during processing wins, and
+    # by the claim so only the current lease holder writes
+    owned = {"_id": job["_id"], "token": job["token"], "claim_id": job.get("claim_id")}
+    final_attempt = job.get("attempts", 1) >= MAX_ATTEMPTS
+
+    try:
+        result = _handler(job, final_attempt)
+    except Exception as e:
+        if final_attempt:
+            # The handler failed outside the model call; stop retrying. A done
+            # job without a result is answered with the fallback question
+            logger.warning("Emotion job gave up after %s attempts: %s", job.get("attempts"), e)
+            col.update_one(owned, {"$set": {
+                "status": STATUS_DONE,
+                "result": None,
+                "lease_until": None,
+                "error": str(e),
+                "updated_at": datetime.utcnow()
+            }})
+            with _finished:
+                _finished.notify_all()
+            return
+        backoff = min(60, 2 ** job.get("attempts", 1))
+        col.update_one(owned, {"$set": {
+            "status": STATUS_PENDING,
+            "run_after": datetime.utcnow() + timedelta(seconds=backoff),
+            "lease_until": None,
+            "error": str(e),
+            "updated_at": datetime.utcnow()
+        }})
+        return
+
+    col.update_one(owned, {"$set": {
+        "status": STATUS_DONE,
+        "result": result,
+        "lease_until": None,
+        "updated_at": datetime.utcnow()
+    }})
+    with _finished:
+        _finished.notify_all()
+
+
+def _worker_loop():
+    while True:
+        try:
+            job = _claim(_db)
+        except Exception as e:
+            logger.warning("Emotion job claim failed: %s", e)
+            job = None
+
+        if job is None:
+            _wakeup.wait(POLL_INTERVAL)
+            _wakeup.clear()
+            continue
+
+        try:
+            _process(_db, job)
+        except Exception as e:
+            # Lease expiry will hand the job to another worker
+            logger.warning("Emotion job failed: %s", e)
+
+
+def ensure_workers():
+    """Start the worker threads once per process (safe with gunicorn --preload)."""
+    global _started_pid
+    if _started_pid == os.getpid() or _handler is None:
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for i in range(WORKERS):
+            threading.Thread(target=_worker_loop, name=f"emotion-job-{i}", daemon=True).start()
+        _started_pid = os.getpid()
@@ -0,0 +1,248 @@
+# fake_groq.py
+# Local stand-in for the Groq chat completions API, for load and latency testing.
+#
+#     python fake_groq.py --port 8085 --delay 3.0 --jitter 0.5
+#     GROQ_BASE_URL=http://127.0.0.1:8085 GROQ_API_KEY=fake python app.py
+#
+# Every completion sleeps `delay` (+/- `jitter`) seconds before answering, so
+# slow-model behaviour can be reproduced without touching the real provider.
+# With --latency-dist lognormal, `delay` is the median and `jitter` the sigma.
+# The reply is picked from the prompt so the app's JSON parsing still succeeds.
+# Requests with "stream": true get the reply as server-sent chunks: the delay
+# is then the time to the first chunk and --token-delay the gap between chunks.
+#
+# Fault injection (fractions of requests, checked in this order):
+#   --error-rate 0.3     answer with --error-status (default 503)
+#   --hang-rate 0.1      sleep --hang-seconds before answering (client timeouts)
+#   --garbage-rate 0.1   answer 200 with content that is not JSON
+#
+# FakeGroqClient gives the same replies in-process (no socket), for batch jobs
+# such as `summary_pipeline.py --fake-model`.
+
+import argparse
+import json
+import math
+import random
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+EMOTION_REPLY = {
+    "emotion": "Stressed",
+    "question_type": "yes_no",
+    "question": "Did something specific happen today that added to this?",
+    "options": []
+}
+
+QUESTION_REPLY = {
+    "question_type": "choice",
+    "question": "What would help most right now?",
+    "options": ["Rest", "Talking to someone", "A short walk"]
+}
+
+ADVICE_REPLY = {
+    "advice": "Break the day into one small next step and take a short pause before it. "
+              "Notice what you managed today, not only what is left.",
+    "affirmation": "I am doing enough, one step at a time."
+}
+
+
+SUMMARY_REPLY = ("This month had busy stretches and quieter days. You kept showing up for "
+                 "yourself, noticed what drained you and made room for small breaks.")
+
+
+def pick_reply(prompt):
+    if "monthly summary" in prompt:
+        return SUMMARY_REPLY
+    if '"advice"' in prompt:
+        return ADVICE_REPLY
+    if "dominant emotion" in prompt:
+        return EMOTION_REPLY
+    return QUESTION_REPLY
+
+
+def reply_text(prompt):
+    reply = pick_reply(prompt)
+    return reply if isinstance(reply, str) else json.dumps(reply)
+
+
+def split_pieces(content, size=4):
+    """Token-sized pieces of a reply, for streamed responses."""
+    return [content[i:i + size] for i in range(0, len(content), size)] or [""]
+
+
+class FakeGroqClient:
+    """
+    In-process stand-in for `groq.Groq` (only chat.completions.create), for
+    jobs and tests that should not open sockets. Sleeps `delay` per call.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        prompt = messages[-1].get("content", "") if messages else ""
+        if stream:
+            return (
+                SimpleNamespace(choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=piece),
+                                                         finish_reason=None)])
+                for piece in split_pieces(reply_text(prompt))
+            )
+        message = SimpleNamespace(role="assistant", content=reply_text(prompt))
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+
+def sample_delay(server):
+    """uniform: delay +/- jitter; lognormal: median delay, sigma jitter (long tail)."""
+    if server.latency_dist == "lognormal" and server.delay > 0:
+        return random.lognormvariate(math.log(server.delay), server.jitter)
+    return max(0.0, server.delay + random.uniform(-server.jitter, server.jitter))
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    server_version = "FakeGroq/1.0"
+
+    def log_message(self, fmt, *args):
+        if not self.server.quiet:
+            super().log_message(fmt, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, request_body, content):
+        """Server-sent chunks like the real API: the delay is the time to first token."""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        model = request_body.get("model", "llama-3.1-8b-instant")
+        pieces = split_pieces(content)
+        for i, piece in enumerate(pieces + [None]):
+            if i and self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"content": piece} if piece is not None else {},
+                    "finish_reason": None if piece is not None else "stop"
+                }]
+            }
+            try:
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        request_body = json.loads(self.rfile.read(length) or b"{}")
+        messages = request_body.get("messages") or []
+        prompt = messages[-1].get("content", "") if messages else ""
+
+        faults = self.server.faults
+        roll = random.random()
+        if roll < faults["error_rate"]:
+            self._send_json(faults["error_status"], {"error": {"message": "injected failure"}})
+            return
+        roll -= faults["error_rate"]
+
+        delay = sample_delay(self.server)
+        if roll < faults["hang_rate"]:
+            delay = faults["hang_seconds"]
+        roll -= faults["hang_rate"]
+        time.sleep(delay)
+
+        if roll < faults["garbage_rate"]:
+            content = "Sure! Here is what I think about your day..."
+        else:
+            content = reply_text(prompt)
+        if request_body.get("stream"):
+            self._send_stream(request_body, content)
+            return
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request_body.get("model", "llama-3.1-8b-instant"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4
+            }
+        })
+
+
+def make_server(host="127.0.0.1", port=8085, delay=0.0, jitter=0.0, quiet=True,
+                error_rate=0.0, error_status=503, hang_rate=0.0, hang_seconds=60.0,
+                garbage_rate=0.0, latency_dist="uniform", token_delay=0.0):
+    server = ThreadingHTTPServer((host, port), FakeGroqHandler)
+    server.daemon_threads = True
+    server.delay = delay
+    server.token_delay = token_delay
+    server.jitter = jitter
+    server.latency_dist = latency_dist
+    server.quiet = quiet
+    # Mutable so a running server can be switched between healthy and degraded
+    server.faults = {
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "hang_rate": hang_rate,
+        "hang_seconds": hang_seconds,
+        "garbage_rate": garbage_rate
+    }
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8085)
+    parser.add_argument("--delay", type=float, default=2.0, help="seconds per completion")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random delay")
+    parser.add_argument("--latency-dist", choices=("uniform", "lognormal"), default="uniform",
+                        help="lognormal: --delay is the median, --jitter the sigma")
+    parser.add_argument("--token-delay", type=float, default=0.0,
+                        help="seconds between streamed chunks (\"stream\": true requests)")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--garbage-rate", type=float, default=0.0)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    srv = make_server(args.host, args.port, args.delay, args.jitter, quiet=not args.verbose,
+                      error_rate=args.error_rate, error_status=args.error_status,
+                      hang_rate=args.hang_rate, hang_seconds=args.hang_seconds,
+                      garbage_rate=args.garbage_rate, latency_dist=args.latency_dist,
+                      token_delay=args.token_delay)
+    print(f"Fake Groq listening on http://{args.host}:{args.port} (delay {args.delay}s)")
+    srv.serve_forever()
@@ -0,0 +1,183 @@
+# instrumentation.py
+# Per-request timing: total latency plus time spent per stage.
+#
+# Stages: "mongo" (every command, via a PyMongo CommandListener), "crypto"
+# (Fernet encrypt / decrypt), "model" (waiting for the model pool, cache hits
+# excluded), "hashing" (bcrypt) and "serialization" (jsonify). Timings are
+# collected for the request running on the current thread and, when it
+# finishes, observed into the metrics.py histograms
+#
+#     http_request_seconds{route, method, status}
+#     http_stage_seconds{route, stage}
+#
+# that /metrics exposes. Requests slower than SLOW_REQUEST_MS are logged with
+# their stage breakdown and the slowest Mongo commands.
+#
+# Tunables (env):
+#   SLOW_REQUEST_MS   slow-request log threshold (default 1000, 0 disables)
+
+import functools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask.json.provider import DefaultJSONProvider
+from pymongo import monitoring
+from werkzeug.wsgi import ClosingIterator
+
+import metrics
+
+logger = logging.getLogger("studentsphere.instrumentation")
+
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+# Mongo commands kept per request for the slow-request trace
+MAX_TRACED_COMMANDS = 20
+
+_local = threading.local()
+
+
+class RequestTimings:
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.route = "unmatched"
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.active = set()
+        self.commands = []
+        self.pending_commands = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def current():
+    """Timings of the request running on this thread, or None."""
+    return getattr(_local, "timings", None)
+
+
+def set_route(rule):
+    timings = current()
+    if timings is not None and rule:
+        timings.route = rule
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as `name` for the current request. Nested blocks of the same
+    stage count once; outside a request (worker threads, jobs) it is a no-op.
+    """
+    timings = current()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started)
+        timings.active.discard(name)
+
+
+def timed(name):
+    """Decorator form of stage()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return inner
+    return wrap
+
+
+# ------------------------------------------------------
+# MONGO COMMAND MONITORING
+# ------------------------------------------------------
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    Adds each command's server round-trip to the "mongo" stage. PyMongo calls
+    listeners on the thread that issued the command, so the thread's request
+    is the one that waited for it.
+    """
+
+    def started(self, event):
+        timings = current()
+        if timings is not None:
+            timings.pending_commands[event.request_id] = event.command_name
+
+    def _finished(self, event):
+        timings = current()
+        if timings is None:
+            return
+        name = timings.pending_commands.pop(event.request_id, event.command_name)
+        seconds = event.duration_micros / 1e6
+        timings.add("mongo", seconds)
+        metrics.histogram("mongo_command_seconds", command=name).observe(seconds)
+        if len(timings.commands) < MAX_TRACED_COMMANDS:
+            timings.commands.append((name, seconds))
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that counts jsonify() encoding as "serialization"."""
+
+    def dumps(self, obj, **kwargs):
+        with stage("serialization"):
+            return super().dumps(obj, **kwargs)
+
+
+# ------------------------------------------------------
+# WSGI MIDDLEWARE
+# ------------------------------------------------------
+class TimingMiddleware:
+    """Wraps app.wsgi_app; finishes the timings when the body is closed (streams included)."""
+
+    def __init__(self, wsgi_app, log=None):
+        self.wsgi_app = wsgi_app
+        self.log = log or logger.warning
+
+    def __call__(self, environ, start_response):
+        timings = RequestTimings(environ.get("REQUEST_METHOD", "GET"), environ.get("PATH_INFO", ""))
+        _local.timings = timings
+        status_holder = {}
+
+        def _start_response(status, headers, exc_info=None):
+            status_holder["status"] = status.split(" ", 1)[0]
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, _start_response)
+        except Exception:
+            status_holder["status"] = "500"
+            self._finish(timings, status_holder)
+            raise
+        return ClosingIterator(body, [lambda: self._finish(timings, status_holder)])
+
+    def _finish(self, timings, status_holder):
+        if getattr(_local, "timings", None) is timings:
+            _local.timings = None
+        total = time.perf_counter() - timings.started
+        status = status_holder.get("status", "500")
+
+        metrics.histogram("http_request_seconds", route=timings.route, method=timings.method,
+                          status=status).observe(total)
+        for name, seconds in timings.stages.items():
+            metrics.histogram("http_stage_seconds", route=timings.route, stage=name).observe(seconds)
+
+        if SLOW_REQUEST_MS and total * 1000 >= SLOW_REQUEST_MS:
+            stages = ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in sorted(
+                timings.stages.items(), key=lambda kv: -kv[1]))
+            slowest = sorted(timings.commands, key=lambda c: -c[1])[:5]
+            commands = ", ".join(f"{n}={s * 1000:.0f}ms" for n, s in slowest)
+            self.log("Slow request %s %s (%s) %s %.0fms [%s] mongo: [%s]",
+                     timings.method, timings.path, timings.route, status, total * 1000,
+                     stages or "no stages", commands or "-")
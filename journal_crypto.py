@@ -0,0 +1,77 @@
+# journal_crypto.py
+# Fernet key handling and batch decryption shared by the API and the
+# re-encryption tool.
+#
+# FERNET_KEY is the current key: everything is encrypted with it.
+# FERNET_OLD_KEYS (comma separated) are previous keys that are still accepted
+# for decryption while `reencrypt.py --rotate` moves the data to FERNET_KEY.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# Fernet tokens are base64 of a 0x80 version byte, so they always start like this
+TOKEN_PREFIX = "gAAAA"
+
+
+def parse_old_keys(old_keys):
+    """Accept a comma separated string or an iterable of keys."""
+    if not old_keys:
+        return []
+    if isinstance(old_keys, str):
+        old_keys = old_keys.split(",")
+    return [k.strip() for k in old_keys if k and k.strip()]
+
+
+def build_fernet(primary_key, old_keys=None):
+    """MultiFernet that encrypts with `primary_key` and decrypts with any key."""
+    keys = [primary_key] + parse_old_keys(old_keys)
+    return MultiFernet([Fernet(k.encode()) for k in keys])
+
+
+def looks_encrypted(text):
+    return isinstance(text, str) and text.startswith(TOKEN_PREFIX)
+
+
+def is_current(primary, token):
+    """True when `token` was produced by the `primary` Fernet (HMAC check only, no AES)."""
+    try:
+        primary.extract_timestamp(token.encode())
+        return True
+    except InvalidToken:
+        return False
+
+
+# ------------------------------------------------------
+# BATCH DECRYPTION
+# ------------------------------------------------------
+DECRYPT_WORKERS = int(os.getenv("DECRYPT_WORKERS", "4"))
+# Below this many tokens the pool overhead is not worth it
+PARALLEL_THRESHOLD = 64
+
+_decrypt_pool = None
+
+
+def _get_pool():
+    global _decrypt_pool
+    if _decrypt_pool is None:
+        _decrypt_pool = ThreadPoolExecutor(max_workers=DECRYPT_WORKERS, thread_name_prefix="decrypt")
+    return _decrypt_pool
+
+
+def decrypt_many(tokens, decrypt_one):
+    """
+    Decrypt a list of tokens with `decrypt_one`, preserving order. Large
+    batches are split into one chunk per worker thread.
+    """
+    tokens = list(tokens)
+    if len(tokens) < PARALLEL_THRESHOLD or DECRYPT_WORKERS <= 1:
+        return [decrypt_one(t) for t in tokens]
+
+    size = -(-len(tokens) // DECRYPT_WORKERS)
+    chunks = [tokens[i:i + size] for i in range(0, len(tokens), size)]
+    results = []
+    for part in _get_pool().map(lambda chunk: [decrypt_one(t) for t in chunk], chunks):
+        results.extend(part)
+    return results
@@ -0,0 +1,257 @@
+# journal_store.py
+# Per-entry journal storage: one document per (username, date) in `journal_entries`.
+#
+# The legacy layout kept every entry of a user inside one `journals` document
+# ({"username", "entries": [...]}), which grows without limit. Entries are moved
+# over lazily (the first time a user is touched) or in bulk with:
+#
+#     python journal_store.py migrate [--prune]
+
+import re
+import threading
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+ENTRIES_COLLECTION = "journal_entries"
+LEGACY_COLLECTION = "journals"
+
+# Written by /complete from an entry's text; a re-save makes them stale
+DERIVED_FIELDS = ("ai_advice", "ai_affirmation", "sentiment")
+
+# Usernames whose legacy document has already been checked in this process
+_migrated_users = set()
+_migrated_lock = threading.Lock()
+
+
+def entries_collection(db):
+    return db[ENTRIES_COLLECTION]
+
+
+def ensure_indexes(db):
+    """Create the unique (username, date) index. Safe to call repeatedly."""
+    entries_collection(db).create_index(
+        [("username", ASCENDING), ("date", ASCENDING)],
+        unique=True,
+        name="username_date_unique",
+    )
+
+
+# ------------------------------------------------------
+# MIGRATION FROM THE EMBEDDED ARRAY
+# ------------------------------------------------------
+def _legacy_entry_date(entry):
+    """Legacy entries may lack `date`; fall back to the timestamp's day."""
+    date = entry.get("date")
+    if date:
+        return str(date)
+    ts = entry.get("timestamp")
+    if isinstance(ts, datetime):
+        return ts.strftime("%Y-%m-%d")
+    if isinstance(ts, str) and ts:
+        return ts.split("T")[0]
+    return None
+
+
+def migrate_user_doc(db, doc):
+    """
+    Copy the embedded entries of one legacy `journals` document into
+    `journal_entries`. Uses $setOnInsert so entries already written in the new
+    layout always win. Returns the number of entries inserted.
+    """
+    ops = []
+    for entry in doc.get("entries", []) or []:
+        if not isinstance(entry, dict):
+            continue
+        date = _legacy_entry_date(entry)
+        if not date:
+            continue
+        fields = {k: v for k, v in entry.items() if k != "date"}
+        fields["username"] = doc["username"]
+        fields["date"] = date
+        ops.append(UpdateOne(
+            {"username": doc["username"], "date": date},
+            {"$setOnInsert": fields},
+            upsert=True,
+        ))
+
+    inserted = 0
+    if ops:
+        try:
+            result = entries_collection(db).bulk_write(ops, ordered=False)
+            inserted = result.upserted_count
+        except BulkWriteError as e:
+            # A concurrent migration (or save) inserted the same (username, date)
+            # first; duplicate keys are expected, anything else is not.
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            inserted = e.details.get("nUpserted", 0)
+
+    db[LEGACY_COLLECTION].update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"entries_migrated_at": datetime.utcnow()}}
+    )
+    return inserted
+
+
+def ensure_migrated(db, username):
+    """Online migration: move a user's legacy entries on first access."""
+    if username in _migrated_users:
+        return
+
+    doc = db[LEGACY_COLLECTION].find_one(
+        {"username": username, "entries_migrated_at": {"$exists": False}},
+        {"username": 1, "entries": 1}
+    )
+    if doc:
+        migrate_user_doc(db, doc)
+
+    with _migrated_lock:
+        _migrated_users.add(username)
+
+
+def migrate_all(db, prune=False, log=print):
+    """Offline bulk migration of every legacy document that is not yet moved."""
+    legacy = db[LEGACY_COLLECTION]
+    total_docs = total_entries = 0
+
+    for doc in legacy.find({"entries_migrated_at": {"$exists": False}},
+                           {"username": 1, "entries": 1}):
+        total_entries += migrate_user_doc(db, doc)
+        total_docs += 1
+
+    if prune:
+        # Drop the embedded arrays once their entries live in journal_entries
+        legacy.update_many(
+            {"entries_migrated_at": {"$exists": True}, "entries": {"$exists": True}},
+            {"$unset": {"entries": ""}}
+        )
+
+    log(f"✅ Migrated {total_entries} entries from {total_docs} documents")
+    return total_docs, total_entries
+
+
+# ------------------------------------------------------
+# READS / WRITES
+# ------------------------------------------------------
+def get_entry(db, username, date, projection=None):
+    ensure_migrated(db, username)
+    return entries_collection(db).find_one({"username": username, "date": date}, projection)
+
+
+def new_session(now):
+    """Empty validation session, embedded in the entry as `session`."""
+    return {
+        "answers": [],
+        "last_answered_step": 0,
+        "completed": False,
+        "next_question": None,
+        "result": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def save_entry(db, username, date, fields, now=None):
+    """
+    Insert the entry for (username, date), or overwrite a saved one, in one
+    atomic pipeline upsert: `fields` are set, results derived from the previous
+    text (DERIVED_FIELDS) are removed, `revision` is bumped and the embedded
+    validation session is reset in the same write. Other fields are kept.
+    Returns the previous {"text", "revision"} or None for a new entry, so
+    callers can drop cached plaintext of the replaced ciphertext.
+    """
+    ensure_migrated(db, username)
+    now = now or datetime.utcnow()
+    stage = {key: "$$REMOVE" for key in DERIVED_FIELDS if key not in fields}
+    # $literal: values are data, never field paths or operators
+    stage.update({key: {"$literal": value} for key, value in fields.items()})
+    stage.update({
+        "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]},
+        "session": {"$literal": new_session(now)},
+    })
+    return entries_collection(db).find_one_and_update(
+        {"username": username, "date": date},
+        [{"$set": stage}],
+        projection={"_id": 0, "text": 1, "revision": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+
+
+def update_entry(db, username, date, fields):
+    """$set fields on an existing entry. Does not create one."""
+    ensure_migrated(db, username)
+    return entries_collection(db).update_one(
+        {"username": username, "date": date},
+        {"$set": fields}
+    )
+
+
+def modify_entry(db, username, date, update, extra_filter=None):
+    """Apply a raw update document (e.g. $push on session.answers) to one entry."""
+    ensure_migrated(db, username)
+    query = {"username": username, "date": date}
+    query.update(extra_filter or {})
+    return entries_collection(db).update_one(query, update)
+
+
+def date_filter(date_prefix=None, date_from=None, date_to=None, after=None, before=None):
+    """
+    Build the `date` condition for a range query. `date_from` / `date_to` are
+    inclusive, `after` / `before` exclusive (used as pagination cursors).
+    A `date_prefix` ("YYYY-MM") becomes an anchored regex. All of these are
+    answered from the (username, date) index.
+    """
+    cond = {}
+    if date_prefix:
+        cond["$regex"] = "^" + re.escape(date_prefix)
+    if date_from:
+        cond["$gte"] = date_from
+    if date_to:
+        cond["$lte"] = date_to
+    if after:
+        cond["$gt"] = after
+    if before:
+        cond["$lt"] = before
+    return cond
+
+
+def find_entries(db, username, projection=None, date_prefix=None, date_from=None,
+                 date_to=None, after=None, before=None, descending=False, limit=0):
+    """Entries of a user sorted by date, optionally restricted to a date range."""
+    ensure_migrated(db, username)
+    query = {"username": username}
+    cond = date_filter(date_prefix, date_from, date_to, after, before)
+    if cond:
+        query["date"] = cond
+    cursor = entries_collection(db).find(query, projection).sort(
+        "date", DESCENDING if descending else ASCENDING
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Journal storage maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate_cmd = sub.add_parser("migrate", help="Move embedded entries into journal_entries")
+    migrate_cmd.add_argument("--prune", action="store_true",
+                             help="Remove the embedded `entries` arrays after migrating")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+
+    ensure_indexes(mongo_db)
+    if args.command == "migrate":
+        migrate_all(mongo_db, prune=args.prune)
@@ -0,0 +1,108 @@
+# llm_cache.py
+# Content-addressed cache of model responses, stored in Mongo (`llm_responses`).
+#
+# The key is a SHA-256 over the prompt template name, the model and the
+# whitespace-normalised rendered prompt (which contains all inputs), so the same
+# journal + check-in or the same answers never pay for a second model call.
+# Documents expire through a TTL index on `created_at`.
+#
+# Tunables (env):
+#   LLM_CACHE_TTL      seconds a response is kept (default 7 days)
+#   LLM_CACHE_POLICY   per-template policy, e.g. "emotion=reuse,advice=refresh"
+#                      reuse   read and write the cache (default)
+#                      refresh always call the model, but store the answer
+#                      off     bypass the cache
+
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+
+from pymongo import ASCENDING
+
+logger = logging.getLogger("studentsphere.llm_cache")
+
+CACHE_COLLECTION = "llm_responses"
+TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+POLICY_REUSE = "reuse"
+POLICY_REFRESH = "refresh"
+POLICY_OFF = "off"
+
+DEFAULT_POLICIES = {
+    "emotion": POLICY_REUSE,
+    "next_question": POLICY_REUSE,
+    "advice": POLICY_REUSE,
+    "monthly_summary": POLICY_REUSE,
+}
+
+_db = None
+_policies = dict(DEFAULT_POLICIES)
+
+
+def _parse_policies(spec):
+    policies = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        name, policy = (p.strip() for p in part.split("=", 1))
+        if policy in (POLICY_REUSE, POLICY_REFRESH, POLICY_OFF):
+            policies[name] = policy
+    return policies
+
+
+_policies.update(_parse_policies(os.getenv("LLM_CACHE_POLICY")))
+
+
+def configure(db):
+    global _db
+    _db = db
+
+
+def ensure_indexes(db):
+    db[CACHE_COLLECTION].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=TTL_SECONDS,
+        name="created_at_ttl"
+    )
+
+
+def policy_for(template):
+    if not template or _db is None:
+        return POLICY_OFF
+    return _policies.get(template, POLICY_REUSE)
+
+
+def cache_key(template, model, prompt):
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    digest = hashlib.sha256()
+    for part in (template, model, normalized):
+        digest.update(part.encode())
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def lookup(key):
+    try:
+        doc = _db[CACHE_COLLECTION].find_one({"_id": key}, {"response": 1})
+    except Exception as e:
+        logger.warning("LLM cache lookup failed: %s", e)
+        return None
+    return doc.get("response") if doc else None
+
+
+def store(key, template, model, response):
+    try:
+        _db[CACHE_COLLECTION].update_one(
+            {"_id": key},
+            {"$set": {
+                "template": template,
+                "model": model,
+                "response": response,
+                "created_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("LLM cache store failed: %s", e)
@@ -0,0 +1,463 @@
+# llm_client.py
+# Shared wrapper for outbound Groq calls.
+#
+# Model calls run on a small bounded pool instead of directly on the request
+# thread that needs them. With gunicorn's threaded workers (see procfile) a slow
+# model round trip only parks the calling request thread; the worker keeps
+# serving cheap endpoints on its other threads, and the pool caps how many
+# completions are in flight towards the provider at once.
+#
+# Every call has a deadline: each attempt gets at most GROQ_CALL_TIMEOUT and the
+# whole call (queueing + retries) at most GROQ_WAIT_TIMEOUT. Transient provider
+# errors are retried with jittered exponential backoff, and a circuit breaker
+# fails fast with ModelUnavailable while the provider is unhealthy, so callers
+# drop straight to their fallback payloads.
+#
+# The prompt / completion token counts of every model call are logged and
+# totalled per template (see prompt_budget.py).
+#
+# stream() is the streaming variant of complete(): the same pool, breaker,
+# deadline and cache, with the text handed to the caller piece by piece.
+#
+# Tunables (env):
+#   GROQ_MAX_CONCURRENCY    outbound calls running at the same time (default 8)
+#   GROQ_MAX_QUEUE          calls allowed to wait for a free slot (default 32)
+#   GROQ_WAIT_TIMEOUT       total seconds budget of one call (default 60)
+#   GROQ_CALL_TIMEOUT       seconds per HTTP attempt (default 20)
+#   GROQ_MAX_RETRIES        retries after the first attempt (default 2)
+#   GROQ_BREAKER_FAILURES   consecutive failures that open the breaker (default 5)
+#   GROQ_BREAKER_COOLDOWN   seconds the breaker stays open (default 30)
+#   GROQ_BASE_URL           point the client at another server (e.g. fake_groq.py)
+
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import groq
+
+import instrumentation
+import llm_cache
+import prompt_budget
+
+logger = logging.getLogger("studentsphere.llm_client")
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+
+MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+MAX_QUEUE = int(os.getenv("GROQ_MAX_QUEUE", "32"))
+WAIT_TIMEOUT = float(os.getenv("GROQ_WAIT_TIMEOUT", "60"))
+CALL_TIMEOUT = float(os.getenv("GROQ_CALL_TIMEOUT", "20"))
+MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "2"))
+BREAKER_FAILURES = int(os.getenv("GROQ_BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.getenv("GROQ_BREAKER_COOLDOWN", "30"))
+
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 4.0
+
+
+class ModelUnavailable(Exception):
+    """Raised when a completion cannot be obtained in time (pool full, breaker open or slow model)."""
+
+
+class ModelOutputError(ValueError):
+    """The model answered, but `parse` rejected the output. `raw` keeps the text."""
+
+    def __init__(self, message, raw):
+        super().__init__(message)
+        self.raw = raw
+
+
+# ------------------------------------------------------
+# CIRCUIT BREAKER
+# ------------------------------------------------------
+class CircuitBreaker:
+    """
+    closed    → calls go through; `failure_threshold` consecutive failures open it
+    open      → calls fail fast until `cooldown` seconds have passed
+    half_open → a single probe call is let through; success closes, failure re-opens
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, cooldown):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self.transitions = {self.OPEN: 0, self.HALF_OPEN: 0, self.CLOSED: 0}
+        self.rejected = 0
+
+    def _move(self, state):
+        if state != self._state:
+            logger.warning("Model circuit breaker: %s → %s", self._state, state)
+            self._state = state
+            self.transitions[state] += 1
+
+    def allow(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    self.rejected += 1
+                    return False
+                self._move(self.HALF_OPEN)
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._probe_in_flight = False
+            self._move(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                self._move(self.OPEN)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "transitions": dict(self.transitions),
+                "rejected": self.rejected
+            }
+
+
+breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_COOLDOWN)
+
+_client = None
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="groq")
+_pending = 0
+_retries = 0
+_pending_lock = threading.Lock()
+
+
+def configure(client):
+    """Set the Groq client used for all completions."""
+    global _client
+    _client = client
+
+
+def _is_transient(error):
+    # APIConnectionError also covers APITimeoutError
+    if isinstance(error, (groq.APIConnectionError, groq.RateLimitError)):
+        return True
+    return isinstance(error, groq.APIStatusError) and error.status_code >= 500
+
+
+def _call_model(messages, model, deadline):
+    """Runs on the pool: first attempt plus jittered retries, all inside `deadline`."""
+    global _retries
+    attempt = 0
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise ModelUnavailable(f"Model call exceeded {WAIT_TIMEOUT}s")
+        try:
+            response = _client.chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=min(CALL_TIMEOUT, remaining)
+            )
+            return response.choices[0].message.content.strip(), getattr(response, "usage", None)
+        except Exception as e:
+            if not _is_transient(e) or attempt >= MAX_RETRIES:
+                raise
+            # Full jitter: sleep somewhere in [0, base * 2^attempt]
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            if time.monotonic() + delay >= deadline:
+                raise
+            attempt += 1
+            with _pending_lock:
+                _retries += 1
+            time.sleep(delay)
+
+
+def complete(prompt, model=DEFAULT_MODEL, template=None, parse=None):
+    """
+    Run one chat completion for a single user prompt and return the text, or
+    `parse(text)` when a parser is given.
+
+    `template` names the prompt for the response cache (see llm_cache.py);
+    only outputs that `parse` accepts are cached. Raises ModelUnavailable when
+    the pool is saturated, the breaker is open or the deadline passes, and
+    ModelOutputError when `parse` fails.
+    """
+    policy = llm_cache.policy_for(template)
+    key = llm_cache.cache_key(template, model, prompt) if policy != llm_cache.POLICY_OFF else None
+
+    if policy == llm_cache.POLICY_REUSE:
+        cached = llm_cache.lookup(key)
+        if cached is not None:
+            try:
+                return parse(cached) if parse else cached
+            except Exception:
+                pass  # treat an unparsable cached answer as a miss
+
+    started = time.perf_counter()
+    with instrumentation.stage("model"):
+        text, usage = _complete_uncached(prompt, model)
+    _log_tokens(template, model, prompt, text, usage, time.perf_counter() - started)
+
+    if parse:
+        try:
+            result = parse(text)
+        except Exception as e:
+            raise ModelOutputError(str(e), text) from e
+    else:
+        result = text
+
+    if key is not None:
+        llm_cache.store(key, template, model, text)
+    return result
+
+
+def _acquire_slot():
+    global _pending
+    if _client is None:
+        raise RuntimeError("llm_client.configure() has not been called")
+
+    with _pending_lock:
+        if _pending >= MAX_CONCURRENCY + MAX_QUEUE:
+            raise ModelUnavailable("Model call queue is full")
+        _pending += 1
+
+    if not breaker.allow():
+        with _pending_lock:
+            _pending -= 1
+        raise ModelUnavailable("Model circuit breaker is open")
+
+
+def _complete_uncached(prompt, model):
+    _acquire_slot()
+    deadline = time.monotonic() + WAIT_TIMEOUT
+
+    # The slot is released when the call really finishes, not when the caller
+    # gives up waiting, so abandoned calls still count against the budget.
+    future = _executor.submit(_call_model, [{"role": "user", "content": prompt}], model, deadline)
+    future.add_done_callback(_release_slot)
+    try:
+        text, usage = future.result(timeout=max(0.0, deadline - time.monotonic()))
+    except FutureTimeout:
+        future.cancel()
+        breaker.record_failure()
+        raise ModelUnavailable(f"Model call exceeded {WAIT_TIMEOUT}s")
+    except ModelUnavailable:
+        breaker.record_failure()
+        raise
+    except Exception as e:
+        if _is_transient(e):
+            breaker.record_failure()
+            raise ModelUnavailable(f"Model provider error: {e}") from e
+        # The provider answered (e.g. a 4xx), so it is healthy
+        breaker.record_success()
+        raise
+
+    breaker.record_success()
+    return text, usage
+
+
+def _log_tokens(template, model, prompt, text, usage, seconds):
+    """Per-call token log; provider counts when the response has them, else estimates."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    estimated = prompt_tokens is None or completion_tokens is None
+    if estimated:
+        prompt_tokens = prompt_budget.approx_tokens(prompt)
+        completion_tokens = prompt_budget.approx_tokens(text)
+    prompt_budget.record(template, prompt_tokens, completion_tokens)
+    logger.info("Model call %s: %d prompt + %d completion tokens in %.0fms",
+                template, prompt_tokens, completion_tokens, seconds * 1000,
+                extra={"fields": {"template": template, "model": model, "prompt_tokens": prompt_tokens,
+                                  "completion_tokens": completion_tokens, "estimated": estimated}})
+
+
+# ------------------------------------------------------
+# STREAMING
+# ------------------------------------------------------
+_STREAM_END = object()
+
+
+def _stream_model(messages, model, deadline, pieces, cancelled):
+    """
+    Runs on the pool: puts text pieces on `pieces`, then _STREAM_END or the
+    error. The outcome is reported to the breaker here, so a stream its reader
+    abandons (or never starts reading) still releases a half-open probe.
+    """
+    global _retries
+    attempt = 0
+    sent = False
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            if remaining <= 0:
+                raise ModelUnavailable(f"Model call exceeded {WAIT_TIMEOUT}s")
+            response = _client.chat.completions.create(
+                model=model,
+                messages=messages,
+                stream=True,
+                timeout=min(CALL_TIMEOUT, remaining)
+            )
+            for chunk in response:
+                if cancelled.is_set():
+                    getattr(response, "close", lambda: None)()
+                    break
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    sent = True
+                    pieces.put(delta)
+            pieces.put(_STREAM_END)
+            # Finishing after the deadline means the reader has already timed out
+            if time.monotonic() < deadline:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+            return
+        except Exception as e:
+            # Retries are only invisible to the reader before the first piece
+            delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+            if (sent or not _is_transient(e) or attempt >= MAX_RETRIES
+                    or time.monotonic() + delay >= deadline):
+                if isinstance(e, ModelUnavailable) or _is_transient(e):
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                pieces.put(e)
+                return
+            attempt += 1
+            with _pending_lock:
+                _retries += 1
+            time.sleep(delay)
+
+
+class ModelStream:
+    """
+    Iterate for the completion's text pieces as they arrive; afterwards
+    `text` holds the whole completion and result() parses and caches it.
+    """
+
+    def __init__(self, prompt, model, template, parse, key, cached=None):
+        self.prompt = prompt
+        self.model = model
+        self.template = template
+        self.parse = parse
+        self.key = key
+        self.text = cached
+        self.cached = cached is not None
+        self._pieces = None
+        self._cancelled = threading.Event()
+        self._started = time.perf_counter()
+
+    def _start(self):
+        # Called by stream(): fails fast (ModelUnavailable) before any response is sent
+        _acquire_slot()
+        self._pieces = queue.Queue()
+        self._deadline = time.monotonic() + WAIT_TIMEOUT
+        future = _executor.submit(_stream_model, [{"role": "user", "content": self.prompt}],
+                                  self.model, self._deadline, self._pieces, self._cancelled)
+        future.add_done_callback(_release_slot)
+
+    def __iter__(self):
+        if self.cached:
+            yield self.text
+            return
+        received = []
+        try:
+            with instrumentation.stage("model"):
+                while True:
+                    try:
+                        item = self._pieces.get(timeout=max(0.0, self._deadline - time.monotonic()))
+                    except queue.Empty:
+                        raise ModelUnavailable(f"Model call exceeded {WAIT_TIMEOUT}s")
+                    if item is _STREAM_END:
+                        break
+                    if isinstance(item, Exception):
+                        if isinstance(item, ModelUnavailable) or _is_transient(item):
+                            raise ModelUnavailable(f"Model provider error: {item}") from item
+                        raise item
+                    received.append(item)
+                    yield item
+        finally:
+            # A reader that stops early frees the pool slot at the next chunk
+            self._cancelled.set()
+        self.text = "".join(received).strip()
+        _log_tokens(self.template, self.model, self.prompt, self.text, None,
+                    time.perf_counter() - self._started)
+
+    def result(self):
+        """Parse the finished completion (ModelOutputError when `parse` rejects it)."""
+        if self.text is None:
+            raise RuntimeError("ModelStream.result() before the stream finished")
+        try:
+            result = self.parse(self.text) if self.parse else self.text
+        except Exception as e:
+            raise ModelOutputError(str(e), self.text) from e
+        if self.key is not None and not self.cached:
+            llm_cache.store(self.key, self.template, self.model, self.text)
+        return result
+
+
+def stream(prompt, model=DEFAULT_MODEL, template=None, parse=None):
+    """
+    Streaming variant of complete(): returns a ModelStream. A cached answer
+    (policy "reuse") comes back as a single piece. Raises ModelUnavailable
+    right away when no call can be started.
+    """
+    policy = llm_cache.policy_for(template)
+    key = llm_cache.cache_key(template, model, prompt) if policy != llm_cache.POLICY_OFF else None
+
+    if policy == llm_cache.POLICY_REUSE:
+        cached = llm_cache.lookup(key)
+        if cached is not None:
+            try:
+                if parse:
+                    parse(cached)
+                return ModelStream(prompt, model, template, parse, key, cached=cached)
+            except Exception:
+                pass  # treat an unparsable cached answer as a miss
+
+    model_stream = ModelStream(prompt, model, template, parse, key)
+    model_stream._start()
+    return model_stream
+
+
+def _release_slot(_future):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def idle_slots():
+    """Pool slots not taken by running or queued calls (negative when calls are queueing)."""
+    with _pending_lock:
+        return MAX_CONCURRENCY - _pending
+
+
+def pool_stats():
+    with _pending_lock:
+        pending, retries = _pending, _retries
+    return {
+        "max_concurrency": MAX_CONCURRENCY,
+        "max_queue": MAX_QUEUE,
+        "pending": pending,
+        "retries": retries,
+        "breaker": breaker.stats()
+    }
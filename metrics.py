@@ -0,0 +1,131 @@
+# metrics.py
+# Minimal in-process latency histograms, exported in the Prometheus text format.
+
+import threading
+
+# Upper bounds in seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus style)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        idx = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                idx = i
+                break
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += seconds
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts, total, count = list(self._counts), self._sum, self._count
+        cumulative, running = [], 0
+        for bound, c in zip(self.buckets + (float("inf"),), counts):
+            running += c
+            cumulative.append((bound, running))
+        return {"buckets": cumulative, "sum": total, "count": count}
+
+    def quantile(self, q):
+        """Approximate quantile: upper bound of the bucket holding it."""
+        snap = self.snapshot()
+        if not snap["count"]:
+            return 0.0
+        target = q * snap["count"]
+        for bound, running in snap["buckets"]:
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def histogram(name, **labels):
+    """Get or create the histogram for `name` + labels."""
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        hist = _registry.get(key)
+        if hist is None:
+            hist = _registry[key] = Histogram()
+        return hist
+
+
+def all_histograms():
+    with _registry_lock:
+        return dict(_registry)
+
+
+# ------------------------------------------------------
+# PROMETHEUS TEXT FORMAT
+# ------------------------------------------------------
+def _labels(labels, extra=None):
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+def flatten_stats(prefix, stats, labels=None):
+    """
+    Turn a nested stats dict into gauges [(name, labels, value)]: numbers and
+    bools as values, strings as a `value` label set to 1.
+    """
+    gauges = []
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            gauges.extend(flatten_stats(name, value, labels))
+        elif isinstance(value, bool):
+            gauges.append((name, dict(labels or {}), int(value)))
+        elif isinstance(value, (int, float)):
+            gauges.append((name, dict(labels or {}), value))
+        elif isinstance(value, str):
+            gauges.append((name, dict(labels or {}, value=value), 1))
+    return gauges
+
+
+def render_prometheus(gauges=(), namespace="studentsphere"):
+    """All histograms plus the given gauges in the Prometheus text format."""
+    lines = []
+    by_name = {}
+    for (name, labels), hist in sorted(all_histograms().items()):
+        by_name.setdefault(name, []).append((labels, hist))
+    for name, series in by_name.items():
+        full = f"{namespace}_{name}"
+        lines.append(f"# TYPE {full} histogram")
+        for labels, hist in series:
+            snap = hist.snapshot()
+            for bound, running in snap["buckets"]:
+                lines.append(f"{full}_bucket{_labels(labels, {'le': _fmt(bound)})} {running}")
+            lines.append(f"{full}_sum{_labels(labels)} {_fmt(snap['sum'])}")
+            lines.append(f"{full}_count{_labels(labels)} {snap['count']}")
+
+    typed = set()
+    for name, labels, value in gauges:
+        full = f"{namespace}_{name}"
+        if full not in typed:
+            lines.append(f"# TYPE {full} gauge")
+            typed.add(full)
+        lines.append(f"{full}{_labels(sorted(labels.items()))} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,302 @@
+# mood_stats.py
+# Pre-aggregated mood analytics over `emotion_history`.
+#
+# Every completed session is recorded once (record_emotion) and, in the same
+# step, counted into per-user rollups in `emotion_rollups`:
+#
+#     {username, granularity: "day" | "week" | "month", bucket, counts: {emotion: n}, total}
+#
+# (bucket keys: "2025-01-31", ISO week "2025-W05", "2025-01"), maintained with
+# $inc upserts so /mood-stats reads O(buckets) documents instead of every entry.
+# Streaks of the same emotion on consecutive days live in `emotion_streaks`
+# ({username, emotion, length, last_date, best: {emotion: longest}}).
+#
+# The rollups can be rebuilt from the raw history at any time:
+#
+#     python mood_stats.py backfill [--user alice] [--batch-users 500]
+#
+# The backfill groups with NumPy, which only this job needs (imported lazily).
+
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DeleteMany, ReplaceOne, UpdateOne
+
+HISTORY_COLLECTION = "emotion_history"
+ROLLUPS_COLLECTION = "emotion_rollups"
+STREAKS_COLLECTION = "emotion_streaks"
+
+GRANULARITIES = ("day", "week", "month")
+
+logger = logging.getLogger("studentsphere.mood_stats")
+
+
+def ensure_indexes(db):
+    db[ROLLUPS_COLLECTION].create_index(
+        [("username", ASCENDING), ("granularity", ASCENDING), ("bucket", ASCENDING)],
+        unique=True,
+        name="username_granularity_bucket_unique",
+    )
+    db[STREAKS_COLLECTION].create_index([("username", ASCENDING)], unique=True, name="username_unique")
+
+
+def bucket_key(granularity, date):
+    """Bucket of a "YYYY-MM-DD" date for the given granularity."""
+    if granularity == "day":
+        return date[:10]
+    if granularity == "month":
+        return date[:7]
+    if granularity == "week":
+        year, week, _ = datetime.strptime(date[:10], "%Y-%m-%d").isocalendar()
+        return f"{year}-W{week:02d}"
+    raise ValueError(f"Unknown granularity {granularity!r}")
+
+
+def _day(date):
+    """The "YYYY-MM-DD" day of `date`, or None when it does not parse."""
+    try:
+        return datetime.strptime(str(date)[:10], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+
+def _label(emotion):
+    # Labels become field names under `counts` / `best`
+    label = str(emotion or "Unknown").strip() or "Unknown"
+    return label.replace(".", "_").replace("$", "_")
+
+
+# ------------------------------------------------------
+# WRITE PATH
+# ------------------------------------------------------
+def record_emotion(db, username, date, emotion):
+    """
+    Log one session's emotion and fold it into the rollups and streak. A date
+    that is not "YYYY-MM-DD" (entries saved before dates were validated) is
+    logged but not counted, rather than failing the caller.
+    """
+    emotion = _label(emotion)
+    db[HISTORY_COLLECTION].insert_one({
+        "username": username,
+        "date": date,
+        "emotion": emotion,
+        "timestamp": datetime.utcnow()
+    })
+    day = _day(date)
+    if day is None:
+        logger.warning("Not counting emotion of %s for unparseable date %r", username, date)
+        return
+    date = day
+
+    db[ROLLUPS_COLLECTION].bulk_write([
+        UpdateOne(
+            {"username": username, "granularity": g, "bucket": bucket_key(g, date)},
+            {"$inc": {f"counts.{emotion}": 1, "total": 1}},
+            upsert=True,
+        )
+        for g in GRANULARITIES
+    ], ordered=False)
+
+    _update_streak(db, username, date, emotion)
+
+
+def _update_streak(db, username, date, emotion):
+    """
+    Atomic pipeline update: extend the run when the same emotion follows the
+    previous day, restart it otherwise. Entries for dates not after the last
+    recorded one (back-filled days) leave the streak alone.
+    """
+    yesterday = (datetime.strptime(date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+    newer = {"$gt": [date, {"$ifNull": ["$last_date", ""]}]}
+    continues = {"$and": [{"$eq": ["$emotion", emotion]}, {"$eq": ["$last_date", yesterday]}]}
+
+    db[STREAKS_COLLECTION].update_one(
+        {"username": username},
+        [
+            {"$set": {
+                "length": {"$cond": [newer, {"$cond": [continues, {"$add": ["$length", 1]}, 1]}, "$length"]},
+                "emotion": {"$cond": [newer, emotion, "$emotion"]},
+                "last_date": {"$cond": [newer, date, "$last_date"]},
+            }},
+            {"$set": {
+                f"best.{emotion}": {"$cond": [
+                    {"$eq": ["$emotion", emotion]},
+                    {"$max": [{"$ifNull": [f"$best.{emotion}", 0]}, "$length"]},
+                    {"$ifNull": [f"$best.{emotion}", 0]},
+                ]},
+            }},
+        ],
+        upsert=True
+    )
+
+
+# ------------------------------------------------------
+# READ PATH
+# ------------------------------------------------------
+def get_stats(db, username, granularity="day", date_from=None, date_to=None, limit=0):
+    """Buckets (oldest first) in the date range, their summed counts and the streak."""
+    query = {"username": username, "granularity": granularity}
+    cond = {}
+    if date_from:
+        cond["$gte"] = bucket_key(granularity, date_from)
+    if date_to:
+        cond["$lte"] = bucket_key(granularity, date_to)
+    if cond:
+        query["bucket"] = cond
+
+    cursor = db[ROLLUPS_COLLECTION].find(query, {"_id": 0, "bucket": 1, "counts": 1, "total": 1})
+    if limit:
+        # The most recent `limit` buckets
+        buckets = list(cursor.sort("bucket", -1).limit(limit))[::-1]
+    else:
+        buckets = list(cursor.sort("bucket", 1))
+
+    totals = {}
+    for b in buckets:
+        for emotion, n in (b.get("counts") or {}).items():
+            totals[emotion] = totals.get(emotion, 0) + n
+
+    streak = db[STREAKS_COLLECTION].find_one({"username": username}, {"_id": 0, "username": 0}) or {}
+    return {
+        "granularity": granularity,
+        "buckets": buckets,
+        "totals": totals,
+        "dominant": max(totals, key=totals.get) if totals else None,
+        "streak": {
+            "emotion": streak.get("emotion"),
+            "length": streak.get("length", 0),
+            "last_date": streak.get("last_date"),
+            "best": streak.get("best", {}),
+        },
+    }
+
+
+# ------------------------------------------------------
+# BACKFILL (NumPy)
+# ------------------------------------------------------
+def _iso_weeks(days):
+    """ISO "YYYY-Www" keys for an array of datetime64[D], vectorised."""
+    import numpy as np
+
+    # 1970-01-01 was a Thursday: (days + 3) % 7 is 0 for Mondays
+    monday = days - ((days.astype("int64") + 3) % 7).astype("timedelta64[D]")
+    thursday = monday + np.timedelta64(3, "D")
+    iso_year = thursday.astype("datetime64[Y]")
+    week = (thursday - iso_year.astype("datetime64[D]")).astype("int64") // 7 + 1
+    years = iso_year.astype("int64") + 1970
+    return np.char.add(np.char.add(years.astype(str), "-W"), np.char.zfill(week.astype(str), 2))
+
+
+def rebuild(db, usernames, log=print):
+    """Recompute rollups and streaks of `usernames` from emotion_history."""
+    import numpy as np
+
+    rows = list(db[HISTORY_COLLECTION].find(
+        {"username": {"$in": list(usernames)}, "date": {"$type": "string"}},
+        {"_id": 0, "username": 1, "date": 1, "emotion": 1, "timestamp": 1}
+    ))
+    # Skipped on the write path too
+    rows = [r for r in rows if _day(r["date"]) is not None]
+    ops = [DeleteMany({"username": {"$in": list(usernames)}})]
+    streak_ops = []
+    if rows:
+        users = np.array([r["username"] for r in rows])
+        emotions = np.array([_label(r.get("emotion")) for r in rows])
+        days = np.array([r["date"][:10] for r in rows], dtype="datetime64[D]")
+        stamps = np.array([r.get("timestamp") or datetime.min for r in rows], dtype="datetime64[us]")
+
+        user_ids, user_idx = np.unique(users, return_inverse=True)
+        emotion_ids, emotion_idx = np.unique(emotions, return_inverse=True)
+
+        # ---- rollups: count (user, bucket, emotion) triples per granularity
+        bucket_arrays = {
+            "day": days.astype(str),
+            "week": _iso_weeks(days),
+            "month": days.astype("datetime64[M]").astype(str),
+        }
+        for granularity, buckets in bucket_arrays.items():
+            bucket_ids, bucket_idx = np.unique(buckets, return_inverse=True)
+            keys = np.stack([user_idx, bucket_idx, emotion_idx], axis=1)
+            triples, counts = np.unique(keys, axis=0, return_counts=True)
+
+            docs = {}
+            for (u, b, e), n in zip(triples.tolist(), counts.tolist()):
+                doc = docs.setdefault((u, b), {
+                    "username": str(user_ids[u]), "granularity": granularity,
+                    "bucket": str(bucket_ids[b]), "counts": {}, "total": 0,
+                })
+                doc["counts"][str(emotion_ids[e])] = n
+                doc["total"] += n
+            ops.extend(
+                ReplaceOne({"username": d["username"], "granularity": granularity, "bucket": d["bucket"]},
+                           d, upsert=True)
+                for d in docs.values()
+            )
+
+        # ---- streaks: one emotion per (user, day); the first recorded wins,
+        # as on the write path
+        order = np.lexsort((stamps, days, user_idx))
+        u, d, e = user_idx[order], days[order], emotion_idx[order]
+        first_of_day = np.r_[True, (u[1:] != u[:-1]) | (d[1:] != d[:-1])]
+        u, d, e = u[first_of_day], d[first_of_day], e[first_of_day]
+
+        breaks = np.r_[True, (u[1:] != u[:-1]) | (e[1:] != e[:-1])
+                       | ((d[1:] - d[:-1]).astype("int64") != 1)]
+        run_id = np.cumsum(breaks) - 1
+        run_len = np.bincount(run_id)
+        run_start = np.flatnonzero(breaks)
+        run_user, run_emotion = u[run_start], e[run_start]
+
+        best = np.zeros((len(user_ids), len(emotion_ids)), dtype="int64")
+        np.maximum.at(best, (run_user, run_emotion), run_len)
+        last_run = np.r_[run_user[1:] != run_user[:-1], True]
+        last_day = np.r_[u[1:] != u[:-1], True]
+
+        for (ui, ei, length), day in zip(
+                zip(run_user[last_run].tolist(), run_emotion[last_run].tolist(), run_len[last_run].tolist()),
+                d[last_day].astype(str).tolist()):
+            streak_ops.append(ReplaceOne({"username": str(user_ids[ui])}, {
+                "username": str(user_ids[ui]),
+                "emotion": str(emotion_ids[ei]),
+                "length": length,
+                "last_date": day,
+                "best": {str(emotion_ids[j]): int(n) for j, n in enumerate(best[ui]) if n},
+            }, upsert=True))
+
+    db[ROLLUPS_COLLECTION].bulk_write(ops, ordered=True)
+    db[STREAKS_COLLECTION].delete_many({"username": {"$in": list(usernames)}})
+    if streak_ops:
+        db[STREAKS_COLLECTION].bulk_write(streak_ops, ordered=False)
+    log(f"📊 Rebuilt mood stats for {len(usernames)} users from {len(rows)} history rows")
+    return len(rows)
+
+
+def backfill(db, users=None, batch_users=500, log=print):
+    users = sorted(users or db[HISTORY_COLLECTION].distinct("username"))
+    total = 0
+    for i in range(0, len(users), batch_users):
+        total += rebuild(db, users[i:i + batch_users], log)
+    log(f"✅ Backfill done: {total} rows, {len(users)} users")
+    return total
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Mood analytics maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill_cmd = sub.add_parser("backfill", help="Rebuild rollups and streaks from emotion_history")
+    backfill_cmd.add_argument("--user", action="append", help="Only these users (repeatable)")
+    backfill_cmd.add_argument("--batch-users", type=int, default=500)
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+
+    ensure_indexes(mongo_db)
+    if args.command == "backfill":
+        backfill(mongo_db, users=args.user, batch_users=args.batch_users)
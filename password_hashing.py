@@ -0,0 +1,130 @@
+# password_hashing.py
+# bcrypt hashing on a dedicated, bounded pool.
+#
+# bcrypt is deliberately slow CPU work (and releases the GIL while it runs), so
+# it is moved off the request threads onto a small pool. The pool admits at
+# most HASH_WORKERS + HASH_MAX_QUEUE jobs; beyond that callers get
+# HashingOverloaded immediately and the route answers 503 instead of letting a
+# login storm pile up behind the workers. Rehashes after login run on their own
+# single thread with a small backlog, so they never take a login's slot.
+#
+# Tunables (env):
+#   BCRYPT_ROUNDS     cost factor for new hashes (default 12). Users whose stored
+#                     hash has another cost are rehashed after a successful login.
+#   HASH_WORKERS      concurrent bcrypt operations (default 2)
+#   HASH_MAX_QUEUE    operations allowed to wait for a worker (default 16)
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+import instrumentation
+import metrics
+
+logger = logging.getLogger("studentsphere.password_hashing")
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "16"))
+
+# Seconds a 503 tells the client to wait before retrying
+RETRY_AFTER = 2
+# Rehashes waiting for the rehash thread; more are skipped (retried next login)
+REHASH_BACKLOG = 8
+
+
+class HashingOverloaded(Exception):
+    """The hashing pool is saturated; the request should be shed."""
+
+
+_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_MAX_QUEUE)
+_rehash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bcrypt-rehash")
+_rehash_slots = threading.BoundedSemaphore(1 + REHASH_BACKLOG)
+_shed = 0
+_shed_lock = threading.Lock()
+
+
+def _run(stage, fn, wait=True, executor=_executor, slots=_slots):
+    """
+    Run `fn` on the pool, timing queue wait and work separately. With
+    wait=False the future is returned (or None when the pool is full).
+    """
+    global _shed
+    if not slots.acquire(blocking=False):
+        if wait:
+            with _shed_lock:
+                _shed += 1
+            raise HashingOverloaded("Password hashing pool is saturated")
+        return None
+
+    enqueued = time.perf_counter()
+
+    def job():
+        started = time.perf_counter()
+        metrics.histogram("hash_queue_wait_seconds", stage=stage).observe(started - enqueued)
+        try:
+            return fn()
+        finally:
+            metrics.histogram("hash_work_seconds", stage=stage).observe(time.perf_counter() - started)
+            slots.release()
+
+    future = executor.submit(job)
+    if not wait:
+        return future
+    with instrumentation.stage("hashing"):
+        return future.result()
+
+
+def hash_password(password):
+    """bcrypt hash of `password` (str) at the configured cost. Returns bytes."""
+    return _run("hash", lambda: bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS)))
+
+
+def check_password(password, hashed):
+    """True when `password` matches the stored bcrypt hash."""
+    if isinstance(hashed, str):
+        hashed = hashed.encode("utf-8")
+    return _run("verify", lambda: bcrypt.checkpw(password.encode("utf-8"), hashed))
+
+
+def hash_cost(hashed):
+    """Cost factor encoded in a bcrypt hash ($2b$12$...), or None."""
+    if isinstance(hashed, bytes):
+        hashed = hashed.decode("utf-8", "ignore")
+    parts = (hashed or "").split("$")
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed):
+    return hash_cost(hashed) != BCRYPT_ROUNDS
+
+
+def rehash_in_background(password, on_hashed):
+    """
+    Best-effort upgrade to the configured cost: hash on the rehash thread and
+    hand the result to `on_hashed(new_hash)`. Skipped (None) when its backlog
+    is full; login hashing capacity is not used.
+    """
+    def job():
+        new_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(BCRYPT_ROUNDS))
+        try:
+            on_hashed(new_hash)
+        except Exception as e:
+            logger.warning("Password rehash failed: %s", e)
+        return new_hash
+
+    return _run("rehash", job, wait=False, executor=_rehash_executor, slots=_rehash_slots)
+
+
+def stats():
+    with _shed_lock:
+        shed = _shed
+    return {"workers": HASH_WORKERS, "max_queue": HASH_MAX_QUEUE, "rounds": BCRYPT_ROUNDS, "shed": shed}
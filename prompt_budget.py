@@ -0,0 +1,166 @@
+# prompt_budget.py
+# Token budgets for the text interpolated into model prompts.
+#
+# Journal entries are unbounded, and a prompt's size drives the model's latency
+# and cost. Before a prompt is built, the journal (and each validation answer)
+# is trimmed to a per-template budget. The token count is estimated, not exact:
+# words cost about one token per 4 characters and punctuation one token each.
+# Trimming keeps whole sentences from the head and the tail of the entry (the
+# opening sets the scene, the ending is usually where the writer lands) and
+# drops the middle. Check-ins go into prompts as compact JSON.
+#
+# llm_client records the prompt / completion tokens of every model call here
+# (provider counts when available); the totals per template are on /metrics.
+#
+# Tunables (env):
+#   PROMPT_BUDGETS   journal-token budget per template, e.g. "emotion=1500,advice=2000"
+#   ANSWER_TOKENS    budget of each validation answer (default 120)
+
+import json
+import os
+import re
+import threading
+
+CHARS_PER_TOKEN = 4
+ELLIPSIS = " […] "
+
+DEFAULT_BUDGETS = {
+    "emotion": 1500,
+    "next_question": 1000,
+    "advice": 1500,
+}
+FALLBACK_BUDGET = 1500
+
+ANSWER_TOKENS = int(os.getenv("ANSWER_TOKENS", "120"))
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+# A sentence: text up to and including its closing punctuation or line break
+_SENTENCE_RE = re.compile(r"[^.!?\n]+(?:[.!?]+[\"')\]]*|\n|$)")
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _parse_budgets(spec):
+    budgets = dict(DEFAULT_BUDGETS)
+    for part in (spec or "").split(","):
+        template, _, tokens = part.partition("=")
+        try:
+            budgets[template.strip()] = int(tokens)
+        except ValueError:
+            continue
+    return budgets
+
+
+BUDGETS = _parse_budgets(os.getenv("PROMPT_BUDGETS"))
+
+
+def budget(template):
+    return BUDGETS.get(template, FALLBACK_BUDGET)
+
+
+def approx_tokens(text):
+    """Estimated token count of `text`."""
+    if not text:
+        return 0
+    return sum(
+        (len(w) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if w[0].isalnum() or w[0] == "_" else 1
+        for w in _WORD_RE.findall(text)
+    )
+
+
+def compact_json(obj):
+    """JSON without indentation or spaces after separators."""
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# ------------------------------------------------------
+# TRIMMING
+# ------------------------------------------------------
+def _cut(text, tokens, from_end=False):
+    """Hard cut on a word boundary, for a single sentence that exceeds the budget."""
+    words = text.split()
+    kept, used = [], 0
+    for word in (reversed(words) if from_end else words):
+        cost = approx_tokens(word)
+        if used + cost > tokens:
+            break
+        kept.append(word)
+        used += cost
+    if not kept and words:
+        # One "word" longer than the budget (a pasted URL, a run of emoji)
+        word = words[-1] if from_end else words[0]
+        chars = tokens * CHARS_PER_TOKEN
+        kept = [word[-chars:] if from_end else word[:chars]] if chars else []
+    return " ".join(reversed(kept) if from_end else kept)
+
+
+def trim(text, budget_tokens, head_share=0.6):
+    """
+    `text` unchanged when it fits the budget; otherwise whole sentences from
+    the head (`head_share` of the budget) and the tail, joined by an ellipsis.
+    Text without sentence breaks is cut at word boundaries at both ends.
+    """
+    text = (text or "").strip()
+    if approx_tokens(text) <= budget_tokens:
+        return text
+
+    sentences = [s.strip() for s in _SENTENCE_RE.findall(text) if s.strip()]
+    costs = [approx_tokens(s) for s in sentences]
+    room = max(0, budget_tokens - approx_tokens(ELLIPSIS))
+    head_room = int(room * head_share)
+
+    head, used, i = [], 0, 0
+    while i < len(sentences) and used + costs[i] <= head_room:
+        head.append(sentences[i])
+        used += costs[i]
+        i += 1
+    if not head and sentences:
+        head.append(_cut(sentences[0], head_room))
+        used, i = head_room, 1
+        if len(sentences) == 1:
+            # One long "sentence" (no punctuation): its own last words are the tail
+            tail = _cut(sentences[0], room - head_room, from_end=True)
+            return (head[0] + ELLIPSIS + tail).strip()
+
+    tail_room = room - used
+    tail, j = [], len(sentences) - 1
+    while j >= i and costs[j] <= tail_room:
+        tail.append(sentences[j])
+        tail_room -= costs[j]
+        j -= 1
+    if not tail and j >= i:
+        tail.append(_cut(sentences[j], tail_room, from_end=True))
+
+    return (" ".join(head) + ELLIPSIS + " ".join(reversed(tail))).strip()
+
+
+def journal_for(template, text):
+    """The journal text as it should appear in a `template` prompt."""
+    return trim(text, budget(template))
+
+
+def answers_for(answers):
+    """Validation answers as prompt lines, each trimmed to ANSWER_TOKENS."""
+    return "\n".join(
+        f"Q{a['step']}_answer: {trim(str(a.get('answer', '')), ANSWER_TOKENS)}" for a in answers
+    )
+
+
+# ------------------------------------------------------
+# TOKEN ACCOUNTING
+# ------------------------------------------------------
+def record(template, prompt_tokens, completion_tokens):
+    name = template or "untemplated"
+    with _stats_lock:
+        counts = _stats.setdefault(name, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                          "max_prompt_tokens": 0})
+        counts["calls"] += 1
+        counts["prompt_tokens"] += prompt_tokens
+        counts["completion_tokens"] += completion_tokens
+        counts["max_prompt_tokens"] = max(counts["max_prompt_tokens"], prompt_tokens)
+
+
+def stats():
+    with _stats_lock:
+        return {k: dict(v) for k, v in _stats.items()}
@@ -0,0 +1,158 @@
+# reencrypt.py
+# Bulk, resumable encryption / key rotation of journal entry text.
+# Replaces encrypt_existing.py.
+#
+#     python reencrypt.py                      # encrypt any plaintext entries
+#     python reencrypt.py --rotate             # also move old-key tokens to FERNET_KEY
+#     python reencrypt.py --dry-run            # report what would change
+#     python reencrypt.py --restart            # ignore the saved checkpoint
+#
+# Entries are scanned in `_id` order from `journal_entries` (run
+# `python journal_store.py migrate` first). The Fernet work runs in a process
+# pool, each batch is written with one unordered bulk_write, and the last `_id`
+# of every finished batch is stored in `migration_checkpoints` so an
+# interrupted run resumes where it stopped. Updates are guarded on the old
+# ciphertext, so entries re-saved during the run are left alone.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from cryptography.fernet import Fernet, InvalidToken
+from dotenv import load_dotenv
+from pymongo import ASCENDING, MongoClient, UpdateOne
+
+import journal_crypto
+from journal_store import ENTRIES_COLLECTION
+
+CHECKPOINTS_COLLECTION = "migration_checkpoints"
+
+# Per-process state for pool workers (set by _init_worker)
+_fernet = None
+_primary = None
+_rotate = False
+
+
+def _init_worker(primary_key, old_keys, rotate):
+    global _fernet, _primary, _rotate
+    _fernet = journal_crypto.build_fernet(primary_key, old_keys)
+    _primary = Fernet(primary_key.encode())
+    _rotate = rotate
+
+
+def _transform_chunk(chunk):
+    """
+    Runs in a pool worker. `chunk` is a list of (_id, text); returns
+    (changes, failures) where changes is a list of (_id, old_text, new_text).
+    """
+    changes = []
+    failures = 0
+    for _id, text in chunk:
+        if not text:
+            continue
+        if not journal_crypto.looks_encrypted(text):
+            changes.append((_id, text, _fernet.encrypt(text.encode()).decode()))
+            continue
+        if not _rotate or journal_crypto.is_current(_primary, text):
+            continue
+        try:
+            changes.append((_id, text, _fernet.rotate(text.encode()).decode()))
+        except InvalidToken:
+            # Not decryptable with any configured key; leave it untouched
+            failures += 1
+    return changes, failures
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def run(db, primary_key, old_keys=None, rotate=False, dry_run=False, restart=False,
+        batch_size=2000, workers=None, job_name="journal_text", log=print):
+    entries = db[ENTRIES_COLLECTION]
+    checkpoints = db[CHECKPOINTS_COLLECTION]
+
+    last_id = None
+    if not restart:
+        checkpoint = checkpoints.find_one({"_id": job_name})
+        if checkpoint:
+            last_id = checkpoint.get("last_id")
+            log(f"↪️  Resuming after _id {last_id}")
+
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, batch_size // workers)
+    scanned = changed = failed = 0
+    started = time.monotonic()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(primary_key, journal_crypto.parse_old_keys(old_keys), rotate)) as pool:
+        while True:
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            batch = [(d["_id"], d.get("text"))
+                     for d in entries.find(query, {"text": 1}).sort("_id", ASCENDING).limit(batch_size)]
+            if not batch:
+                break
+
+            ops = []
+            for changes, failures in pool.map(_transform_chunk, _chunks(batch, chunk_size)):
+                failed += failures
+                ops.extend(
+                    UpdateOne({"_id": _id, "text": old}, {"$set": {"text": new}})
+                    for _id, old, new in changes
+                )
+
+            if ops and not dry_run:
+                entries.bulk_write(ops, ordered=False)
+
+            scanned += len(batch)
+            changed += len(ops)
+            last_id = batch[-1][0]
+
+            if not dry_run:
+                checkpoints.update_one(
+                    {"_id": job_name},
+                    {"$set": {"last_id": last_id, "updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+
+            elapsed = max(time.monotonic() - started, 1e-9)
+            log(f"… {scanned} scanned, {changed} {'to change' if dry_run else 'changed'}, "
+                f"{failed} undecryptable — {scanned / elapsed:.0f} entries/s")
+
+    if not dry_run:
+        # A complete pass clears the checkpoint so the next run starts over
+        checkpoints.delete_one({"_id": job_name})
+
+    elapsed = time.monotonic() - started
+    log(f"✅ Done in {elapsed:.1f}s: {scanned} scanned, {changed} "
+        f"{'would change' if dry_run else 'changed'}, {failed} undecryptable")
+    return {"scanned": scanned, "changed": changed, "failed": failed, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encrypt / rotate journal entry text")
+    parser.add_argument("--rotate", action="store_true",
+                        help="Re-encrypt tokens made with FERNET_OLD_KEYS under FERNET_KEY")
+    parser.add_argument("--old-key", action="append", default=[],
+                        help="Extra old key accepted for decryption (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=None, help="Process pool size (default: CPU count)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    key = os.getenv("FERNET_KEY")
+    if not key:
+        raise RuntimeError("❌ FERNET_KEY missing in .env")
+
+    old = journal_crypto.parse_old_keys(os.getenv("FERNET_OLD_KEYS")) + args.old_key
+    if args.rotate and not old:
+        raise RuntimeError("❌ --rotate needs FERNET_OLD_KEYS or --old-key")
+
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+    run(mongo_db, key, old_keys=old, rotate=args.rotate, dry_run=args.dry_run,
+        restart=args.restart, batch_size=args.batch_size, workers=args.workers)
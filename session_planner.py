@@ -0,0 +1,162 @@
+# session_planner.py
+# Speculative prefetch for the validation conversation.
+#
+# A journal flow makes up to four sequential model calls: emotion + first
+# question (background job), two follow-up questions (/answer-question) and
+# the advice (/complete). When a question is shown whose answers can be
+# enumerated (yes_no, or choice with its options), every branch of the
+# conversation tree one step ahead is known: the planner builds the follow-up
+# prompt for each possible answer (the next question, or the advice after the
+# last step) and runs it in the background while the user reads and picks.
+# When the answer arrives, complete() hands over the matching prefetched call,
+# finished or still in flight, instead of starting a new one. Reflection
+# (free-text) questions are not prefetched.
+#
+# Speculative calls only run while the model pool has spare slots, so they
+# never queue in front of real requests. Prefetched results live in this
+# process only; a request served by another worker falls back to a normal call
+# (or to llm_cache when the template's policy is "reuse").
+#
+# Tunables (env):
+#   SESSION_PLANNER           1 enables prefetching (default 0)
+#   PLANNER_WORKERS           background threads per process (default 4)
+#   PLANNER_MAX_BRANCHES      answers prefetched per question (default 3)
+#   PLANNER_RESERVE_SLOTS     model pool slots kept free for real calls (default 2)
+#   PLANNER_TTL               seconds an unused prefetch is kept (default 600)
+
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+import llm_cache
+import llm_client
+
+logger = logging.getLogger("studentsphere.session_planner")
+
+ENABLED = os.getenv("SESSION_PLANNER", "0") == "1"
+WORKERS = int(os.getenv("PLANNER_WORKERS", "4"))
+MAX_BRANCHES = int(os.getenv("PLANNER_MAX_BRANCHES", "3"))
+RESERVE_SLOTS = int(os.getenv("PLANNER_RESERVE_SLOTS", "2"))
+TTL_SECONDS = float(os.getenv("PLANNER_TTL", "600"))
+# Prefetches kept per process; the oldest are dropped first
+MAX_ENTRIES = 1000
+
+_followup = None
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="planner")
+_prefetched = OrderedDict()  # cache key -> (future, created)
+_lock = threading.Lock()
+_stats = {"prefetched": 0, "skipped_busy": 0, "hits": 0, "misses": 0, "expired": 0}
+
+
+def configure(followup):
+    """
+    `followup(journal_context, answers)` returns the (template, prompt, parse)
+    of the model call that follows `answers`, built exactly as the routes
+    build it, so a prefetch and the real request share one key.
+    """
+    global _followup
+    _followup = followup
+
+
+def candidate_answers(question):
+    """The answers the app offers for `question`, or [] for free text."""
+    q_type = (question or {}).get("question_type")
+    if q_type == "yes_no":
+        return ["Yes", "No"]
+    if q_type == "choice":
+        return [str(o).strip() for o in question.get("options") or [] if str(o).strip()]
+    return []
+
+
+def _key(template, prompt):
+    return llm_cache.cache_key(template, llm_client.DEFAULT_MODEL, prompt)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _expire(now):
+    # Caller holds _lock
+    while _prefetched:
+        future, created = next(iter(_prefetched.values()))
+        if now - created < TTL_SECONDS and len(_prefetched) <= MAX_ENTRIES:
+            break
+        future.cancel()
+        _prefetched.popitem(last=False)
+        _stats["expired"] += 1
+
+
+def _run(prompt, template, parse):
+    if llm_client.idle_slots() <= RESERVE_SLOTS:
+        _count("skipped_busy")
+        return None
+    try:
+        return llm_client.complete(prompt, template=template, parse=parse)
+    except Exception as e:
+        logger.debug("Prefetch for %s failed: %s", template, e)
+        return None
+
+
+# ------------------------------------------------------
+# PLANNING
+# ------------------------------------------------------
+def plan(journal_context, answers, question, step):
+    """
+    Prefetch the follow-up of every offered answer to `question`, shown as
+    `step` after `answers`. Returns the number of calls started.
+    """
+    if not ENABLED or _followup is None:
+        return 0
+    started = 0
+    now = time.monotonic()
+    for answer in candidate_answers(question)[:MAX_BRANCHES]:
+        branch = list(answers) + [{"step": step, "answer": answer}]
+        template, prompt, parse = _followup(journal_context, branch)
+        key = _key(template, prompt)
+        with _lock:
+            _expire(now)
+            if key in _prefetched:
+                continue
+            _prefetched[key] = (_executor.submit(_run, prompt, template, parse), now)
+            _stats["prefetched"] += 1
+        started += 1
+    return started
+
+
+def prefetched(prompt, template=None):
+    """
+    The parsed result of a matching prefetch (waiting for it if it is still
+    running), or None. Each prefetch is handed out once.
+    """
+    if not ENABLED:
+        return None
+    with _lock:
+        entry = _prefetched.pop(_key(template, prompt), None)
+    result = None
+    if entry is not None:
+        with instrumentation.stage("model"):
+            try:
+                result = entry[0].result(timeout=llm_client.WAIT_TIMEOUT)
+            except Exception:
+                result = None
+    _count("hits" if result is not None else "misses")
+    return result
+
+
+def complete(prompt, template=None, parse=None):
+    """llm_client.complete(), served from a matching prefetch when there is one."""
+    result = prefetched(prompt, template)
+    if result is not None:
+        return result
+    return llm_client.complete(prompt, template=template, parse=parse)
+
+
+def stats():
+    with _lock:
+        return dict(_stats, enabled=ENABLED, pending=len(_prefetched))
@@ -0,0 +1,255 @@
+# summary_pipeline.py
+# Batch job that writes the monthly summaries served by /summaries/<username>
+# (stored through summary_store).
+#
+#     python summary_pipeline.py                    # all users, finished months
+#     python summary_pipeline.py --user alice --include-current
+#     python summary_pipeline.py --window 1-5       # only run between 01:00 and 05:00 UTC
+#     python summary_pipeline.py --fake-model       # in-process fake, no Groq calls
+#
+# Per user, months are listed from the (username, date) index and compared with
+# the stored summaries: a month is only regenerated when its newest entry date
+# (`last_journal_date`) changed. A month's entries are streamed, decrypted in
+# bulk and split into chunks that fit the model's context budget; large months
+# are summarised chunk by chunk and the partial summaries merged in a final
+# call. Users run on a small pool (SUMMARY_CONCURRENCY) on top of the
+# llm_client model-call cap, and progress is checkpointed per user batch in
+# `migration_checkpoints` so an interrupted run continues where it stopped;
+# with --window, a run still going when the window closes stops after its
+# current batch and the next run picks up from the checkpoint.
+
+import os
+import sys
+import time
+from calendar import month_name
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import journal_crypto
+import journal_store
+import llm_cache
+import llm_client
+import prompt_budget
+import summary_store
+
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "2"))
+# Approximate prompt budget per model call (see prompt_budget.approx_tokens)
+CONTEXT_TOKENS = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "6000"))
+
+CHECKPOINT_ID = "monthly_summaries"
+CHECKPOINTS_COLLECTION = "migration_checkpoints"
+
+SUMMARY_PROMPT = """You are a compassionate journaling companion writing a monthly summary.
+Summarise the journal entries of {month} {year} below in 3-4 warm sentences,
+speaking to the writer as "you". Mention recurring themes and moods, not
+individual dates. Do NOT give medical advice. Respond with the summary text only.
+
+Entries:
+{entries}
+"""
+
+MERGE_PROMPT = """You are a compassionate journaling companion writing a monthly summary.
+Combine these partial summaries of {month} {year} into one summary of 3-4 warm
+sentences, speaking to the writer as "you". Respond with the summary text only.
+
+Partial summaries:
+{entries}
+"""
+
+
+def chunk_entries(lines, budget_tokens):
+    """Group entry lines into chunks whose approximate size fits the budget."""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        tokens = prompt_budget.approx_tokens(line)
+        if tokens > budget_tokens:
+            # A single huge entry: keep its opening and ending sentences
+            line = prompt_budget.trim(line, budget_tokens)
+            tokens = prompt_budget.approx_tokens(line)
+        if current and size + tokens > budget_tokens:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def month_stats(db, username):
+    """{"YYYY-MM": newest entry date} for every month the user has entries in."""
+    pipeline = [
+        {"$match": {"username": username}},
+        {"$group": {"_id": {"$substrBytes": ["$date", 0, 7]}, "last": {"$max": "$date"}}},
+    ]
+    return {d["_id"]: d["last"] for d in journal_store.entries_collection(db).aggregate(pipeline)}
+
+
+def summarize_month(db, decrypt, username, month_key):
+    year, month = int(month_key[:4]), int(month_key[5:7])
+    entries = list(journal_store.find_entries(
+        db, username, {"_id": 0, "date": 1, "text": 1, "emotion_hidden": 1}, date_prefix=month_key
+    ))
+    texts = journal_crypto.decrypt_many([e.get("text") for e in entries], decrypt)
+    lines = [
+        f"- {e['date']} ({e.get('emotion_hidden') or 'Unknown'}): {text.strip()}"
+        for e, text in zip(entries, texts) if text and text.strip()
+    ]
+    if not lines:
+        return None
+
+    label = {"month": month_name[month], "year": year}
+    prompt_overhead = prompt_budget.approx_tokens(SUMMARY_PROMPT)
+    chunks = chunk_entries(lines, max(256, CONTEXT_TOKENS - prompt_overhead))
+
+    partials = [
+        llm_client.complete(SUMMARY_PROMPT.format(entries="\n".join(chunk), **label),
+                            template="monthly_summary")
+        for chunk in chunks
+    ]
+    # Merge rounds until everything fits in one call
+    merge_budget = max(256, CONTEXT_TOKENS - prompt_budget.approx_tokens(MERGE_PROMPT))
+    while len(partials) > 1:
+        groups = chunk_entries(partials, merge_budget)
+        if len(groups) == len(partials):
+            # No two partials fit together, so another round would not shrink
+            # them: trim each to its share and merge in one last call
+            share = merge_budget // len(partials)
+            groups = [[prompt_budget.trim(p, share) for p in partials]]
+        partials = [
+            llm_client.complete(MERGE_PROMPT.format(entries="\n\n".join(group), **label),
+                                template="monthly_summary")
+            for group in groups
+        ]
+    return partials[0].strip()
+
+
+def process_user(db, decrypt, username, include_current=False, log=print):
+    current_month = datetime.utcnow().strftime("%Y-%m")
+    stored = summary_store.last_journal_dates(db, username)
+    written = 0
+
+    for month_key, last_date in sorted(month_stats(db, username).items()):
+        if month_key == current_month and not include_current:
+            continue
+        if stored.get(summary_store.parse_period(month_key)) == last_date:
+            continue  # nothing new since the last summary
+        summary = summarize_month(db, decrypt, username, month_key)
+        if not summary:
+            continue
+        summary_store.upsert_summary(db, username, int(month_key[:4]), int(month_key[5:7]),
+                                     summary, last_date)
+        written += 1
+    if written:
+        log(f"📝 {username}: {written} month(s) summarised")
+    return written
+
+
+def run(db, decrypt, users=None, include_current=False, concurrency=SUMMARY_CONCURRENCY,
+        restart=False, window=None, log=print):
+    """
+    Summarise `users` (default: everyone, resuming from the checkpoint). With
+    a `window`, stops after the batch that runs past it; the checkpoint lets
+    the next run continue from there.
+    """
+    checkpoints = db[CHECKPOINTS_COLLECTION]
+    # Only a run over all users is checkpointed
+    resumable = users is None
+    after = None
+    if resumable and not restart:
+        checkpoint = checkpoints.find_one({"_id": CHECKPOINT_ID})
+        after = checkpoint.get("last_username") if checkpoint else None
+        if after:
+            log(f"↪️  Resuming after user {after}")
+
+    if users is None:
+        users = sorted(u for u in journal_store.entries_collection(db).distinct("username")
+                       if after is None or u > after)
+
+    started = time.monotonic()
+    total = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="summary") as pool:
+        for i in range(0, len(users), concurrency):
+            batch = users[i:i + concurrency]
+            results = pool.map(lambda u: _safe_process(db, decrypt, u, include_current, log), batch)
+            total += sum(results)
+            if resumable:
+                checkpoints.update_one(
+                    {"_id": CHECKPOINT_ID},
+                    {"$set": {"last_username": batch[-1], "updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+            if window and i + concurrency < len(users) and not in_window(window):
+                log(f"⏸️  Left the {window} window after user {batch[-1]}; "
+                    f"{total} summaries written, stopping")
+                return total
+
+    if resumable:
+        checkpoints.delete_one({"_id": CHECKPOINT_ID})
+    log(f"✅ {total} summaries written for {len(users)} users in {time.monotonic() - started:.1f}s")
+    return total
+
+
+def _safe_process(db, decrypt, username, include_current, log):
+    try:
+        return process_user(db, decrypt, username, include_current, log)
+    except Exception as e:
+        # One user's failure (e.g. model down) must not stop the batch;
+        # the month is retried on the next run since nothing was stored.
+        log(f"⚠️ {username}: summary failed: {e}")
+        return 0
+
+
+def in_window(window, now=None):
+    """True when the current UTC hour is inside "START-END" (wraps past midnight)."""
+    start, end = (int(h) for h in window.split("-"))
+    hour = (now or datetime.utcnow()).hour
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Generate monthly journal summaries")
+    parser.add_argument("--user", action="append", help="Only these users (repeatable)")
+    parser.add_argument("--include-current", action="store_true", help="Also summarise the running month")
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY)
+    parser.add_argument("--window", help="Off-peak UTC hours, e.g. 1-5; exit outside of it")
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    parser.add_argument("--fake-model", action="store_true", help="Use the in-process fake model")
+    args = parser.parse_args()
+
+    if args.window and not in_window(args.window):
+        print(f"⏸️  Outside the {args.window} window, nothing to do")
+        sys.exit(0)
+
+    load_dotenv()
+    key = os.getenv("FERNET_KEY")
+    if not key:
+        raise RuntimeError("❌ FERNET_KEY missing in .env")
+    fernet = journal_crypto.build_fernet(key, os.getenv("FERNET_OLD_KEYS"))
+
+    def decrypt(token):
+        try:
+            return fernet.decrypt(token.encode()).decode() if token else ""
+        except Exception:
+            return ""
+
+    if args.fake_model:
+        from fake_groq import FakeGroqClient
+        llm_client.configure(FakeGroqClient())
+    else:
+        from groq import Groq
+        llm_client.configure(Groq(api_key=os.getenv("GROQ_API_KEY"),
+                                  base_url=os.getenv("GROQ_BASE_URL") or None, max_retries=0))
+
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+    # Chunks summarised by an interrupted run are reused ("monthly_summary" policy)
+    llm_cache.configure(mongo_db)
+    llm_cache.ensure_indexes(mongo_db)
+    summary_store.ensure_indexes(mongo_db)
+    run(mongo_db, decrypt, users=args.user, include_current=args.include_current,
+        concurrency=args.concurrency, restart=args.restart, window=args.window)
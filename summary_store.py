@@ -0,0 +1,215 @@
+# summary_store.py
+# Monthly summaries: one document per (username, month) in `monthly_summaries`.
+#
+# Each document carries a canonical integer sort key `period` = year * 100 +
+# month (e.g. 202511), written together with the summary, so /summaries can let
+# Mongo answer range queries in order from the (username, period) index instead
+# of loading and sorting a user's whole history. The legacy layout
+# ({"username", "summaries": [...]} in `summaries`, month as a name) is moved
+# over lazily on first access, or in bulk with:
+#
+#     python summary_store.py migrate
+
+import threading
+from calendar import month_name
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+SUMMARIES_COLLECTION = "monthly_summaries"
+LEGACY_COLLECTION = "summaries"
+
+MONTH_NUMBERS = {name.lower(): i for i, name in enumerate(month_name) if name}
+
+_migrated_users = set()
+_migrated_lock = threading.Lock()
+
+
+def summaries_collection(db):
+    return db[SUMMARIES_COLLECTION]
+
+
+def ensure_indexes(db):
+    summaries_collection(db).create_index(
+        [("username", ASCENDING), ("period", ASCENDING)],
+        unique=True,
+        name="username_period_unique",
+    )
+
+
+def period_of(year, month):
+    return int(year) * 100 + int(month)
+
+
+def parse_month(month):
+    """Month number from 11, "11" or "November"; None when unrecognised."""
+    if isinstance(month, str) and not month.strip().isdigit():
+        return MONTH_NUMBERS.get(month.strip().lower())
+    try:
+        month = int(month)
+    except (TypeError, ValueError):
+        return None
+    return month if 1 <= month <= 12 else None
+
+
+def parse_period(value):
+    """Integer period from "YYYY-MM" (or "YYYY-MM-DD"); raises ValueError."""
+    parts = str(value).split("-")
+    year, month = int(parts[0]), parse_month(parts[1] if len(parts) > 1 else None)
+    if month is None:
+        raise ValueError(f"Invalid month in {value!r}")
+    return period_of(year, month)
+
+
+# ------------------------------------------------------
+# MIGRATION FROM THE EMBEDDED ARRAY
+# ------------------------------------------------------
+def migrate_user_doc(db, doc):
+    """Copy one legacy `summaries` document; rows already migrated win."""
+    ops = []
+    for s in doc.get("summaries", []) or []:
+        if not isinstance(s, dict):
+            continue
+        month = parse_month(s.get("month"))
+        try:
+            year = int(s.get("year"))
+        except (TypeError, ValueError):
+            continue
+        if month is None:
+            continue
+        ops.append(UpdateOne(
+            {"username": doc["username"], "period": period_of(year, month)},
+            {"$setOnInsert": {
+                "username": doc["username"],
+                "period": period_of(year, month),
+                "year": year,
+                "month": month,
+                "summary": s.get("summary", ""),
+                "last_journal_date": s.get("last_journal_date"),
+            }},
+            upsert=True,
+        ))
+
+    inserted = 0
+    if ops:
+        try:
+            inserted = summaries_collection(db).bulk_write(ops, ordered=False).upserted_count
+        except BulkWriteError as e:
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            inserted = e.details.get("nUpserted", 0)
+
+    db[LEGACY_COLLECTION].update_one(
+        {"_id": doc["_id"]},
+        {"$set": {"summaries_migrated_at": datetime.utcnow()}}
+    )
+    return inserted
+
+
+def ensure_migrated(db, username):
+    if username in _migrated_users:
+        return
+
+    doc = db[LEGACY_COLLECTION].find_one(
+        {"username": username, "summaries_migrated_at": {"$exists": False}},
+        {"username": 1, "summaries": 1}
+    )
+    if doc:
+        migrate_user_doc(db, doc)
+
+    with _migrated_lock:
+        _migrated_users.add(username)
+
+
+def migrate_all(db, log=print):
+    total_docs = total_rows = 0
+    for doc in db[LEGACY_COLLECTION].find({"summaries_migrated_at": {"$exists": False}},
+                                          {"username": 1, "summaries": 1}):
+        total_rows += migrate_user_doc(db, doc)
+        total_docs += 1
+    log(f"✅ Migrated {total_rows} summaries from {total_docs} documents")
+    return total_docs, total_rows
+
+
+# ------------------------------------------------------
+# READS / WRITES
+# ------------------------------------------------------
+def upsert_summary(db, username, year, month, summary, last_journal_date):
+    ensure_migrated(db, username)
+    period = period_of(year, month)
+    return summaries_collection(db).update_one(
+        {"username": username, "period": period},
+        {"$set": {
+            "year": int(year),
+            "month": int(month),
+            "summary": summary,
+            "last_journal_date": last_journal_date,
+            "updated_at": datetime.utcnow(),
+        }, "$setOnInsert": {"username": username, "period": period}},
+        upsert=True
+    )
+
+
+def last_journal_dates(db, username):
+    """{period: last_journal_date} of every stored summary of a user."""
+    ensure_migrated(db, username)
+    cursor = summaries_collection(db).find(
+        {"username": username}, {"_id": 0, "period": 1, "last_journal_date": 1}
+    )
+    return {d["period"]: d.get("last_journal_date") for d in cursor}
+
+
+def find_summaries(db, username, period_from=None, period_to=None, after=None, before=None,
+                   descending=False, limit=0):
+    """Summaries sorted by period; `from`/`to` inclusive, `after`/`before` exclusive."""
+    ensure_migrated(db, username)
+    query = {"username": username}
+    cond = {}
+    if period_from is not None:
+        cond["$gte"] = period_from
+    if period_to is not None:
+        cond["$lte"] = period_to
+    if after is not None:
+        cond["$gt"] = after
+    if before is not None:
+        cond["$lt"] = before
+    if cond:
+        query["period"] = cond
+    cursor = summaries_collection(db).find(
+        query, {"_id": 0, "period": 1, "year": 1, "month": 1, "summary": 1, "last_journal_date": 1}
+    ).sort("period", DESCENDING if descending else ASCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+
+def to_response(doc):
+    """API shape kept from the legacy layout: month as its English name."""
+    return {
+        "month": month_name[doc["month"]],
+        "year": doc["year"],
+        "period": f"{doc['year']:04d}-{doc['month']:02d}",
+        "summary": doc.get("summary", ""),
+        "last_journal_date": doc.get("last_journal_date"),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    parser = argparse.ArgumentParser(description="Monthly summary storage maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("migrate", help="Move embedded summaries into monthly_summaries")
+    args = parser.parse_args()
+
+    load_dotenv()
+    mongo_db = MongoClient(os.getenv("MONGO_URI")).get_default_database()
+
+    ensure_indexes(mongo_db)
+    if args.command == "migrate":
+        migrate_all(mongo_db)
@@ -878,20 +878,165 @@ EMOTION_TASKS = {
 
 
 
-def pick_tasks(emotion: str, count: int = 3):
+# ---------------------------------------------------------
+# TASK INDEX
+# Built once at import: immutable task records, per-emotion / per-type /
+# per-intensity buckets and an alias table per bucket for O(1) weighted draws.
+# The shared records are never mutated; callers get fresh dicts.
+# ---------------------------------------------------------
+
+# Low-effort tasks are favoured: they are more likely to get done before expiry
+INTENSITY_WEIGHTS = {"low": 3.0, "medium": 2.0, "high": 1.0}
+
+TASK_EXPIRY = timedelta(minutes=30)
+
+_rng = random.Random()
+
+
+class Task:
+    """Read-only wellbeing task record."""
+
+    __slots__ = ("id", "title", "description", "duration", "type", "intensity", "weight")
+
+    def __init__(self, id, title, description, duration, type, intensity, weight=None):
+        values = {
+            "id": id,
+            "title": title,
+            "description": description,
+            "duration": duration,
+            "type": type,
+            "intensity": intensity,
+            "weight": weight if weight is not None else INTENSITY_WEIGHTS.get(intensity, 1.0),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Task records are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Task records are immutable")
+
+    def __repr__(self):
+        return f"Task({self.id!r})"
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "title": self.title,
+            "description": self.description,
+            "duration": self.duration,
+            "type": self.type,
+            "intensity": self.intensity,
+        }
+
+
+class _Bucket:
+    """A fixed set of tasks with a Vose alias table over their weights."""
+
+    __slots__ = ("tasks", "prob", "alias")
+
+    def __init__(self, tasks):
+        self.tasks = tuple(tasks)
+        n = len(self.tasks)
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        if not n:
+            return
+
+        total = sum(t.weight for t in self.tasks)
+        scaled = [t.weight * n / total for t in self.tasks]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def draw(self):
+        i = _rng.randrange(len(self.tasks))
+        return self.tasks[i] if _rng.random() < self.prob[i] else self.tasks[self.alias[i]]
+
+
+def _build_index(catalog):
+    by_emotion, by_type, by_intensity = {}, {}, {}
+    for emotion, raw_tasks in catalog.items():
+        records = [Task(**raw) for raw in raw_tasks]
+        by_emotion[emotion] = _Bucket(records)
+        for key, index in (("type", by_type), ("intensity", by_intensity)):
+            groups = {}
+            for t in records:
+                groups.setdefault(getattr(t, key), []).append(t)
+            for value, group in groups.items():
+                index[(emotion, value)] = _Bucket(group)
+    return by_emotion, by_type, by_intensity
+
+
+_BY_EMOTION, _BY_TYPE, _BY_INTENSITY = _build_index(EMOTION_TASKS)
+
+FALLBACK_EMOTION = "Happy"
+
+
+def _sample(bucket, count, exclude_ids):
     """
-    Selects 'count' random tasks for the given emotion.
+    Draw up to `count` distinct tasks by weight, skipping `exclude_ids`.
+    Rejection sampling keeps this O(count) while most of the bucket is
+    eligible; a linear pass over the bucket finishes the job otherwise.
+    """
+    chosen = []
+    seen = set()
+    for _ in range(count * 4):
+        if len(chosen) == count:
+            return chosen
+        t = bucket.draw()
+        if t.id in seen or t.id in exclude_ids:
+            continue
+        seen.add(t.id)
+        chosen.append(t)
+
+    rest = [t for t in bucket.tasks if t.id not in seen and t.id not in exclude_ids]
+    _rng.shuffle(rest)
+    return chosen + rest[:count - len(chosen)]
+
+
+def pick_tasks(emotion: str, count: int = 3, exclude_ids=(), task_type: str = None,
+               intensity: str = None):
+    """
+    Selects 'count' weighted-random tasks for the given emotion.
     If emotion not found → fallback to Happy tasks.
+
+    exclude_ids: ids the user got recently; only reused when nothing else is left.
+    task_type / intensity: restrict to one bucket when it exists.
+    Returns new dicts (with expires_at + status); the catalog is never mutated.
     """
-    tasks = EMOTION_TASKS.get(emotion, EMOTION_TASKS["Happy"])
+    if emotion not in _BY_EMOTION:
+        emotion = FALLBACK_EMOTION
 
-    selected = random.sample(tasks, min(count, len(tasks)))
+    bucket = _BY_EMOTION[emotion]
+    if task_type and (emotion, task_type) in _BY_TYPE:
+        bucket = _BY_TYPE[(emotion, task_type)]
+    elif intensity and (emotion, intensity) in _BY_INTENSITY:
+        bucket = _BY_INTENSITY[(emotion, intensity)]
+
+    count = min(count, len(bucket.tasks))
+    exclude_ids = frozenset(exclude_ids or ())
+    selected = _sample(bucket, count, exclude_ids)
+    if len(selected) < count:
+        # Everything left was recently assigned: allow repeats rather than fewer tasks
+        taken = {t.id for t in selected}
+        selected += _sample(bucket, count - len(selected), taken)
 
     # Add expiry time: 30 minutes from now
-    expires_at = (datetime.utcnow() + timedelta(minutes=30)).isoformat()
+    expires_at = (datetime.utcnow() + TASK_EXPIRY).isoformat()
 
+    result = []
     for t in selected:
-        t["expires_at"] = expires_at
-        t["status"] = "pending"
-
-    return selected
\ No newline at end of file
+        task = t.to_dict()
+        task["expires_at"] = expires_at
+        task["status"] = "pending"
+        result.append(task)
+    return result
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+import ai_parsing
+from ai_parsing import JsonObjectScanner, ParseError, extract_first_object, parse_model_output, repair
+
+
+def _loads_repaired(text):
+    return json.loads(repair(extract_first_object(text)))
+
+
+# ------------------------------------------------------
+# SCANNER
+# ------------------------------------------------------
+def test_scanner_skips_chatter_and_fences():
+    text = 'Sure! ```json\n{"a": {"b": "}"}}\n``` hope that helps {"c": 1}'
+    assert extract_first_object(text) == '{"a": {"b": "}"}}'
+
+
+def test_scanner_feeds_in_chunks():
+    scanner = JsonObjectScanner()
+    assert scanner.feed('{"a": [1, ') is None
+    assert scanner.feed('2]} trailing') == '{"a": [1, 2]}'
+
+
+def test_scanner_closes_truncated_output():
+    assert json.loads(extract_first_object('{"a": ["x", "y')) == {"a": ["x", "y"]}
+
+
+def test_scanner_without_object():
+    assert extract_first_object("no json here") is None
+
+
+# ------------------------------------------------------
+# REPAIRS
+# ------------------------------------------------------
+def test_repair_trailing_commas():
+    assert _loads_repaired('{"a": [1, 2,], "b": 3,}') == {"a": [1, 2], "b": 3}
+
+
+def test_repair_single_quotes_and_escapes():
+    assert _loads_repaired("{'a': 'it\\'s \"fine\"'}") == {"a": 'it\'s "fine"'}
+
+
+def test_repair_python_literals_and_unquoted_keys():
+    assert _loads_repaired("{ok: True, missing: None, flag: False}") == \
+        {"ok": True, "missing": None, "flag": False}
+
+
+def test_repair_keeps_literals_inside_strings():
+    assert _loads_repaired("{'a': 'True # not a comment',}") == {"a": "True # not a comment"}
+
+
+def test_repair_smart_quotes():
+    assert _loads_repaired("{“a”: “b”}") == {"a": "b"}
+
+
+def test_repair_comment_on_own_line():
+    text = '{\n  "a": 1, // first\n  # second\n  "b": 2\n}'
+    assert _loads_repaired(text) == {"a": 1, "b": 2}
+
+
+def test_repair_comment_swallowing_closing_brace():
+    # The next-question prompt is one line; a model copying its example puts
+    # the closing brace after the "# include only when ..." comment
+    text = ('{   "question_type": "choice",   "question": "Was it work?",   '
+            '"options": ["Yes","Partly"]   # include only when question_type is "choice" }')
+    assert _loads_repaired(text) == {
+        "question_type": "choice", "question": "Was it work?", "options": ["Yes", "Partly"],
+    }
+
+
+def test_repair_comment_with_apostrophe():
+    text = '{"question": "How was today?"  # don\'t add options }'
+    assert _loads_repaired(text) == {"question": "How was today?"}
+
+
+# ------------------------------------------------------
+# PARSING
+# ------------------------------------------------------
+def test_parse_next_question_from_copied_example():
+    text = ('```json\n{ "question_type": "multiple choice", "question": "Which part?", '
+            '"options": ["Exams", "Friends",]   # include only when question_type is "choice" }\n```')
+    result = parse_model_output(text, ai_parsing.QuestionFields, "test_next_question")
+    assert result == {"question_type": "choice", "question": "Which part?", "options": ["Exams", "Friends"]}
+    assert ai_parsing.parse_stats()["test_next_question"]["repaired"] == 1
+
+
+def test_parse_rejects_output_without_json():
+    with pytest.raises(ParseError):
+        parse_model_output("I can't help with that.", ai_parsing.QuestionFields, "test_no_json")
+    assert ai_parsing.parse_stats()["test_no_json"]["failed"] == 1
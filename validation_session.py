@@ -0,0 +1,122 @@
+# validation_session.py
+# The validation conversation that follows a journal save (MAX_STEPS answers,
+# then /complete).
+#
+# The session is embedded in the journal entry as `session` and reset by every
+# save (journal_store.save_entry). An answer costs at most two operations:
+#
+#   1. record_answer: one find_one_and_update pipeline that appends the answer
+#      and advances the step atomically, returning the new state (AFTER);
+#   2. store_next_question: the generated follow-up question, plus the session's
+#      prompt context the first time.
+#
+# The prompt context (the journal text, trimmed to the largest prompt budget) is
+# derived once per session and kept encrypted in `session.context`, so later
+# steps and /complete read it back instead of re-deriving it from the entry.
+#
+# Retries are idempotent: the client sends the step it answers, a step that is
+# already recorded is not appended again (the first answer wins), and a stored
+# follow-up question for it is returned without calling the model.
+
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+import journal_store
+import prompt_budget
+
+MAX_STEPS = 3
+
+ANSWERED = "answered"
+COMPLETED = "completed"
+OUT_OF_ORDER = "out_of_order"
+
+
+def record_answer(db, username, date, answer, step=None, now=None):
+    """
+    Append `answer` as `step` (default: the next one) unless the session is
+    completed or that step is already recorded. Returns (status, entry) with
+    the entry's `text` and updated `session`, or (None, None) without an entry.
+    """
+    journal_store.ensure_migrated(db, username)
+    now = now or datetime.utcnow()
+
+    last = {"$ifNull": ["$session.last_answered_step", 0]}
+    answers = {"$ifNull": ["$session.answers", []]}
+    step_expr = step if step is not None else {"$add": [last, 1]}
+    take = {"$and": [
+        {"$ne": ["$session.completed", True]},
+        {"$eq": [step_expr, {"$add": [last, 1]}]},
+        {"$lte": [step_expr, MAX_STEPS]},
+    ]}
+
+    entry = journal_store.entries_collection(db).find_one_and_update(
+        {"username": username, "date": date},
+        [{"$set": {
+            "session.answers": {"$cond": [take, {"$concatArrays": [
+                answers, [{"step": step_expr, "answer": {"$literal": answer}}]
+            ]}, answers]},
+            "session.last_answered_step": {"$cond": [take, step_expr, last]},
+            "session.updated_at": {"$cond": [take, now, {"$ifNull": ["$session.updated_at", now]}]},
+        }}],
+        projection={"_id": 0, "text": 1, "session": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry is None:
+        return None, None
+
+    session = entry["session"]
+    if session.get("completed"):
+        return COMPLETED, entry
+    if step is not None and step > session.get("last_answered_step", 0):
+        return OUT_OF_ORDER, entry
+    return ANSWERED, entry
+
+
+def answered_step(session, step=None):
+    """The step the current request answered (retries included)."""
+    return step if step is not None else session.get("last_answered_step", 0)
+
+
+def pending_question(session, step):
+    """Follow-up question already stored for `step` (a retried answer), or None."""
+    question = session.get("next_question") or {}
+    return question if question.get("step") == step + 1 else None
+
+
+def build_context(journal_text):
+    tokens = max(prompt_budget.budget("next_question"), prompt_budget.budget("advice"))
+    return prompt_budget.trim(" ".join((journal_text or "").split()), tokens)
+
+
+def journal_context(entry, decrypt, encrypt=None):
+    """
+    Prompt context of the entry's session: (context, token), where `token` is
+    the freshly encrypted context to store when it had to be derived (and an
+    `encrypt` was given), else None. `decrypt` must not raise.
+    """
+    token = (entry.get("session") or {}).get("context")
+    if token:
+        context = decrypt(token)
+        if context:
+            return context, None
+
+    context = build_context(decrypt(entry.get("text")))
+    return context, (encrypt(context) if encrypt and context else None)
+
+
+def store_next_question(db, username, date, step, question, context_token=None, now=None):
+    """
+    Save the follow-up to `step`. Guarded by the step, so neither a stale
+    request nor one racing a re-save overwrites a newer session.
+    """
+    fields = {
+        "session.next_question": dict(question, step=step + 1),
+        "session.updated_at": now or datetime.utcnow(),
+    }
+    if context_token:
+        fields["session.context"] = context_token
+    return journal_store.modify_entry(
+        db, username, date, {"$set": fields},
+        extra_filter={"session.last_answered_step": step, "session.completed": {"$ne": True}}
+    )